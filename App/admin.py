@@ -3,6 +3,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     User,
     Farmacia,
+    Region,
     Motorista,
     Moto,
     AsignacionMoto,
@@ -12,7 +13,12 @@ from .models import (
     ProductoPedido,
     DocumentacionMoto,
     PermisoCirculacion,
-    ReportDownloadHistory
+    ReportDownloadHistory,
+    ResumenDiarioDespacho,
+    TrabajoReporte,
+    DocumentoBusqueda,
+    VersionColeccion,
+    TransicionDespacho
 )
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
@@ -72,6 +78,13 @@ class FarmaciaAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     farmacia_imagen_thumbnail.short_description = "Imagen"
     farmacia_imagen_thumbnail.allow_tags = True
 
+# Regiones
+@admin.register(Region)
+class RegionAdmin(admin.ModelAdmin):
+    list_display = ("codigo", "nombre")
+    search_fields = ("codigo", "nombre")
+    ordering = ("nombre",)
+
 class MotoristaResource(resources.ModelResource):
     class Meta:
         model = Motorista
@@ -190,4 +203,48 @@ class ReportDownloadHistoryAdmin(admin.ModelAdmin):
     list_filter = ['tipo_reporte', 'formato', 'fecha_descarga']
     search_fields = ['user__username', 'user__email', 'nombre_archivo']
     readonly_fields = ['fecha_descarga']
-    date_hierarchy = 'fecha_descarga'
\ No newline at end of file
+    date_hierarchy = 'fecha_descarga'
+
+@admin.register(TrabajoReporte)
+class TrabajoReporteAdmin(admin.ModelAdmin):
+    list_display = ['user', 'tipo_reporte', 'formato', 'estado', 'fecha_creacion', 'fecha_fin']
+    list_filter = ['estado', 'formato', 'tipo_reporte']
+    search_fields = ['user__username', 'mensaje_error']
+    readonly_fields = ['fecha_creacion', 'fecha_inicio', 'fecha_fin', 'historial']
+    date_hierarchy = 'fecha_creacion'
+
+# Resumen diario (solo lectura; se mantiene desde signals o el comando recalcular_resumen_diario)
+@admin.register(ResumenDiarioDespacho)
+class ResumenDiarioDespachoAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "farmacia", "motorista", "estado", "cantidad", "entregas_con_tiempo", "duracion_total_segundos")
+    list_filter = ("estado", "fecha", "farmacia")
+    search_fields = ("farmacia__nombre", "motorista__rut")
+    ordering = ("-fecha",)
+    readonly_fields = ("fecha", "farmacia", "motorista", "estado", "cantidad", "entregas_con_tiempo", "duracion_total_segundos")
+
+# Índice de búsqueda global (se mantiene desde signals o el comando reindexar_busqueda)
+@admin.register(DocumentoBusqueda)
+class DocumentoBusquedaAdmin(admin.ModelAdmin):
+    list_display = ("tipo", "objeto_id", "titulo", "subtitulo", "fecha_actualizacion")
+    list_filter = ("tipo",)
+    search_fields = ("titulo", "contenido")
+    readonly_fields = ("tipo", "objeto_id", "titulo", "subtitulo", "contenido", "fecha_actualizacion")
+
+# Sellos de versión para ETag / Last-Modified (se incrementan desde signals)
+@admin.register(VersionColeccion)
+class VersionColeccionAdmin(admin.ModelAdmin):
+    list_display = ("nombre", "version", "fecha_actualizacion")
+    readonly_fields = ("nombre", "version", "fecha_actualizacion")
+
+# Registro de cambios de estado (solo lectura: se escribe desde services/estados_despacho.py)
+@admin.register(TransicionDespacho)
+class TransicionDespachoAdmin(admin.ModelAdmin):
+    list_display = ("despacho", "estado_anterior", "estado_nuevo", "usuario", "fecha_hora")
+    list_filter = ("estado_nuevo",)
+    readonly_fields = ("despacho", "estado_anterior", "estado_nuevo", "usuario", "motivo", "fecha_hora")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,52 @@
+from django.core.exceptions import ValidationError
+
+from ..services.versiones import DEPENDENCIAS, agregar_validadores, firma, respuesta_no_modificada
+
+
+class ConditionalGetMixin:
+    """
+    ETag on list and retrieve (plus Last-Modified on retrieve), answered with
+    a 304 before the queryset is evaluated or anything is serialized.
+
+    Lists send no Last-Modified: its one-second resolution lets a poller that
+    only sends If-Modified-Since get a stale 304 after a change in the same
+    second, while the collection stamps in the ETag change on every commit.
+
+    `coleccion` names the entry of services.versiones.DEPENDENCIAS for this
+    resource. A list is versioned by all those collection stamps; a single
+    object by its fecha_actualizacion plus the stamps of what it nests (every
+    dependency except its own collection).
+    """
+    coleccion = None
+
+    def _partes(self, request):
+        # Same data renders differently per format and query string (fields, expand, cursor...)
+        return request.user.pk, request.accepted_renderer.format, request.get_full_path()
+
+    def list(self, request, *args, **kwargs):
+        etag, _ = firma(DEPENDENCIAS[self.coleccion], *self._partes(request))
+        no_modificada = respuesta_no_modificada(request, etag, None)
+        if no_modificada is not None:
+            return no_modificada
+        response = super().list(request, *args, **kwargs)
+        return agregar_validadores(response, etag, None)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            fecha = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).values_list('fecha_actualizacion', flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            fecha = None
+        if fecha is None:
+            # Let get_object() produce the usual 404
+            return super().retrieve(request, *args, **kwargs)
+
+        relacionadas = tuple(nombre for nombre in DEPENDENCIAS[self.coleccion] if nombre != self.coleccion)
+        etag, modificado = firma(relacionadas, *self._partes(request), modificado=fecha)
+        no_modificada = respuesta_no_modificada(request, etag, modificado)
+        if no_modificada is not None:
+            return no_modificada
+        response = super().retrieve(request, *args, **kwargs)
+        return agregar_validadores(response, etag, modificado)
@@ -0,0 +1,32 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from ..services.paginacion import conteo_cacheado
+
+
+class DespachoCursorPagination(CursorPagination):
+    """
+    Keyset pagination for despachos ordered by newest first. Every page costs
+    the same as the first one; `count` comes from a short-lived cached COUNT.
+    """
+    ordering = ('-fecha_hora_creacion', '-identificador_unico')
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.queryset = queryset
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': conteo_cacheado(self.queryset),
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return schema
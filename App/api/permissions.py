@@ -31,3 +31,10 @@ class IsMotoristaOrSupervisorOrAdminForState(permissions.BasePermission):
             return request.user and request.user.is_authenticated
         # for state-change endpoints, expect authenticated
         return request.user and request.user.is_authenticated and _has_role(request.user, ['MOTORISTA', 'SUPERVISOR', 'ADMINISTRADOR', 'GERENTE'])
+
+
+class CanCreateDespacho(permissions.BasePermission):
+    """Create despachos: operador, supervisor, admin, gerente (same roles as crear_despacho)."""
+
+    def has_permission(self, request, view):
+        return request.user and request.user.is_authenticated and _has_role(request.user, ['OPERADOR', 'SUPERVISOR', 'ADMINISTRADOR', 'GERENTE'])
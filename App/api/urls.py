@@ -2,7 +2,7 @@ from rest_framework.routers import DefaultRouter
 from django.urls import path, include
 from ..api.views import (
     FarmaciaViewSet, MotoristaViewSet, MotoViewSet,
-    AsignacionMotoViewSet, AsignacionFarmaciaViewSet, DespachoViewSet,
+    AsignacionMotoViewSet, AsignacionFarmaciaViewSet, DespachoViewSet, BusquedaViewSet,
 )
 
 router = DefaultRouter()
@@ -12,6 +12,7 @@ router.register(r'motos', MotoViewSet, basename='api-moto')
 router.register(r'asignaciones_moto', AsignacionMotoViewSet, basename='api-asignacion-moto')
 router.register(r'asignaciones_farmacia', AsignacionFarmaciaViewSet, basename='api-asignacion-farmacia')
 router.register(r'despachos', DespachoViewSet, basename='api-despacho')
+router.register(r'busqueda', BusquedaViewSet, basename='api-busqueda')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -2,19 +2,66 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from ..models import Farmacia, Motorista, Moto, AsignacionMoto, AsignacionFarmacia, Despacho
+from datetime import timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from ..models import Farmacia, Motorista, Moto, AsignacionMoto, AsignacionFarmacia, Despacho, DocumentoBusqueda
 from ..serializers import (
     FarmaciaSerializer, MotoristaSerializer, MotoSerializer,
-    AsignacionMotoSerializer, AsignacionFarmaciaSerializer, DespachoSerializer
+    AsignacionMotoSerializer, AsignacionFarmaciaSerializer, DespachoSerializer, DespachoListSerializer,
+    DespachoBulkSerializer, CambioEstadoBulkSerializer, AsignacionTurnoSerializer,
 )
-from .permissions import IsAdminOrSupervisorForWrite, IsSupervisorForCreate, IsMotoristaOrSupervisorOrAdminForState
+from ..utils import filtrar_por_fechas
+from ..services.asignaciones import asignar_turno
+from ..services.busqueda import LIMITE_RESULTADOS, buscar
+from ..services.despachos_masivos import MAX_ITEMS, cambiar_estados, crear_despachos, referencias_inexistentes
+from ..services.estados_despacho import ConflictoDeVersion, TransicionNoValida, transicionar
+from ..services.recomendacion_motoristas import RADIO_MAX_KM, recomendar
+from ..services.series import INTERVALOS, MAX_DIAS_POR_HORA, serie_despachos
+from .conditional import ConditionalGetMixin
+from .pagination import DespachoCursorPagination
+from .permissions import IsAdminOrSupervisorForWrite, IsSupervisorForCreate, IsMotoristaOrSupervisorOrAdminForState, CanCreateDespacho
 
 
-class FarmaciaViewSet(viewsets.ModelViewSet):
+def lista_masiva(request, serializer_class):
+    """Validates a JSON array body of at most MAX_ITEMS items; returns (serializer, error response)."""
+    if not isinstance(request.data, list) or not request.data:
+        return None, Response({'detail': 'Expected a non-empty JSON array'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(request.data) > MAX_ITEMS:
+        return None, Response({'detail': f'At most {MAX_ITEMS} items per request'}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = serializer_class(data=request.data, many=True)
+    if not serializer.is_valid():
+        return None, Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    return serializer, None
+
+
+class FarmaciaViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Farmacia.objects.all()
     serializer_class = FarmaciaSerializer
+    coleccion = 'farmacia'
     permission_classes = [IsAdminOrSupervisorForWrite]
 
+    @action(detail=True, methods=['get'], url_path='motoristas_recomendados')
+    def motoristas_recomendados(self, request, pk=None):
+        """
+        Available drivers for a despacho from this pharmacy, best first, ranked
+        by distance from their assigned pharmacy plus open despachos.
+        Params: limite (max 50), radio_km (max RADIO_MAX_KM).
+        """
+        try:
+            limite = min(int(request.query_params.get('limite', 10)), 50)
+            radio_km = min(float(request.query_params.get('radio_km', RADIO_MAX_KM)), RADIO_MAX_KM)
+            farmacia_id = int(pk)
+        except ValueError:
+            return Response({'detail': 'limite, radio_km and id must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limite < 1 or not radio_km > 0:
+            return Response({'detail': 'limite and radio_km must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            resultados = recomendar(farmacia_id, limite=limite, radio_km=radio_km)
+        except Farmacia.DoesNotExist:
+            return Response({'detail': 'Farmacia no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'farmacia': farmacia_id, 'count': len(resultados), 'results': resultados})
+
 
 class MotoristaViewSet(viewsets.ModelViewSet):
     queryset = Motorista.objects.select_related('usuario').all()
@@ -22,9 +69,10 @@ class MotoristaViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrSupervisorForWrite]
 
 
-class MotoViewSet(viewsets.ModelViewSet):
+class MotoViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Moto.objects.all()
     serializer_class = MotoSerializer
+    coleccion = 'moto'
     permission_classes = [IsAdminOrSupervisorForWrite]
 
 
@@ -59,6 +107,19 @@ class AsignacionMotoViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(nueva)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'], url_path='turno')
+    def turno(self, request):
+        """
+        Applies a shift roster [{"motorista", "moto"?, "farmacia"?}] in one transaction.
+        All or nothing: if any line conflicts with current assignments nothing is
+        changed and the conflicts are returned with 409.
+        """
+        serializer, error = lista_masiva(request, AsignacionTurnoSerializer)
+        if error:
+            return error
+        resultado = asignar_turno(serializer.validated_data)
+        return Response(resultado, status=status.HTTP_200_OK if resultado['ok'] else status.HTTP_409_CONFLICT)
+
 
 class AsignacionFarmaciaViewSet(viewsets.ModelViewSet):
     queryset = AsignacionFarmacia.objects.select_related('motorista', 'farmacia').all()
@@ -90,14 +151,51 @@ class AsignacionFarmaciaViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class DespachoViewSet(viewsets.ModelViewSet):
-    queryset = Despacho.objects.select_related('farmacia_origen', 'motorista_asignado').all()
+class DespachoViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    Responses use the nested DespachoSerializer; lists opt into the flat
+    DespachoListSerializer with ?view=flat. Both accept ?fields= and ?expand=
+    (see SparseFieldsMixin) and the queryset only joins/prefetches what the
+    response renders.
+    """
+    queryset = Despacho.objects.all()
     serializer_class = DespachoSerializer
+    coleccion = 'despacho'
+
+    @property
+    def paginator(self):
+        """
+        ?page= (the default pagination) unless the client opts into keyset
+        pages with ?pagination=cursor and then follows the next/previous links.
+        """
+        if not hasattr(self, '_paginator'):
+            if self.request is not None and self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = DespachoCursorPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self.request.query_params.get('view') == 'flat':
+            return DespachoListSerializer
+        return DespachoSerializer
+
+    def get_queryset(self):
+        queryset = self.get_serializer_class().optimize_queryset(super().get_queryset(), self.request)
+        if self.action == 'list':
+            # ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD (inclusive), same filter as the HTML list and reports
+            queryset = filtrar_por_fechas(
+                queryset, 'fecha_hora_creacion',
+                self.request.query_params.get('desde'), self.request.query_params.get('hasta')
+            ).order_by(*DespachoCursorPagination.ordering)
+        return queryset
 
     def get_permissions(self):
         # For state changes we may use the custom permission; create allowed for operadores/supervisores/admin/gerente
-        if self.action in ['partial_update', 'update']:
+        if self.action in ['partial_update', 'update', 'cambiar_estado_masivo']:
             permission_classes = [IsMotoristaOrSupervisorOrAdminForState]
+        elif self.action == 'crear_masivo':
+            permission_classes = [CanCreateDespacho]
         elif self.action == 'create':
             # creation allowed to operador, supervisor, admin, gerente - let backend view-level check
             permission_classes = [IsAuthenticated]
@@ -107,19 +205,144 @@ class DespachoViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def cambiar_estado(self, request, pk=None):
+        """
+        {"estado", "version"?, "motivo"?}. With "version" the change only applies if the
+        despacho is still at that version; a concurrent change returns 409 instead of
+        being overwritten.
+        """
         despacho = self.get_object()
-        nuevo_estado = request.data.get('estado')
-        # validate transitions (same logic as views)
-        transiciones_validas = {
-            'PENDIENTE': ['EN_RUTA', 'ANULADO'],
-            'EN_RUTA': ['ENTREGADO', 'INCIDENCIA', 'ANULADO'],
-            'ENTREGADO': [],
-            'ANULADO': [],
-            'INCIDENCIA': ['EN_RUTA', 'ENTREGADO'],
-        }
-        if nuevo_estado not in transiciones_validas.get(despacho.estado, []):
-            return Response({'detail': 'Transición no válida'}, status=status.HTTP_400_BAD_REQUEST)
-        despacho.estado = nuevo_estado
-        despacho.save()
-        serializer = self.get_serializer(despacho)
+        version = request.data.get('version')
+        if version is not None:
+            try:
+                version = int(version)
+            except (TypeError, ValueError):
+                return Response({'detail': 'version must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            transicionar(
+                despacho.pk, request.data.get('estado'), usuario=request.user, desde=despacho.estado,
+                version=version, motivo=request.data.get('motivo') or '',
+            )
+        except ConflictoDeVersion as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_409_CONFLICT)
+        except TransicionNoValida as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(self.get_object())
         return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='masivo')
+    def crear_masivo(self, request):
+        """
+        Creates an array of despachos (with nested productos) in one transaction.
+        All or nothing: any invalid item returns 400 with errors keyed by item index.
+        """
+        serializer, error = lista_masiva(request, DespachoBulkSerializer)
+        if error:
+            return error
+        errores = referencias_inexistentes(serializer.validated_data)
+        if errores:
+            return Response({'errors': errores}, status=status.HTTP_400_BAD_REQUEST)
+
+        despachos = crear_despachos(serializer.validated_data)
+        return Response(
+            {'created': len(despachos), 'ids': [despacho.pk for despacho in despachos]},
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['post'], url_path='cambiar_estado_masivo')
+    def cambiar_estado_masivo(self, request):
+        """
+        Applies [{"id", "estado"}] transitions with the same rules as cambiar_estado.
+        Valid items are applied even if others fail; each gets its own result.
+        """
+        serializer, error = lista_masiva(request, CambioEstadoBulkSerializer)
+        if error:
+            return error
+        resultados = cambiar_estados(serializer.validated_data, usuario=request.user)
+        return Response({
+            'updated': sum(1 for resultado in resultados if resultado['ok']),
+            'results': resultados,
+        })
+
+    @action(detail=False, methods=['get'])
+    def serie(self, request):
+        """
+        Volumen de despachos y tiempo promedio de entrega por periodo.
+        Parámetros: intervalo (hora|dia|semana|mes), desde, hasta (YYYY-MM-DD),
+        farmacia, motorista, region, estado. Por defecto: últimos 30 días por día.
+        Día/semana/mes se leen del resumen diario.
+        """
+        intervalo = request.query_params.get('intervalo', 'dia')
+        if intervalo not in INTERVALOS:
+            return Response({'detail': f'intervalo debe ser uno de: {", ".join(INTERVALOS)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hoy = timezone.localdate()
+        desde_param = request.query_params.get('desde')
+        hasta_param = request.query_params.get('hasta')
+        try:
+            fecha_hasta = parse_date(hasta_param) if hasta_param else hoy
+            fecha_desde = parse_date(desde_param) if desde_param else fecha_hasta - timedelta(days=30)
+        except ValueError:
+            fecha_desde = fecha_hasta = None
+        if not fecha_desde or not fecha_hasta or fecha_desde > fecha_hasta:
+            return Response({'detail': 'Rango de fechas inválido (formato YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+        if intervalo == 'hora' and (fecha_hasta - fecha_desde).days > MAX_DIAS_POR_HORA:
+            return Response({'detail': f'El intervalo hora admite como máximo {MAX_DIAS_POR_HORA} días'}, status=status.HTTP_400_BAD_REQUEST)
+
+        estado = request.query_params.get('estado') or None
+        if estado and estado not in dict(Despacho.ESTADOS):
+            return Response({'detail': 'Estado no válido'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            farmacia_id, motorista_id = (
+                int(request.query_params[nombre]) if request.query_params.get(nombre) else None
+                for nombre in ('farmacia', 'motorista')
+            )
+        except ValueError:
+            return Response({'detail': 'farmacia y motorista deben ser números'}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultados = serie_despachos(
+            intervalo, fecha_desde, fecha_hasta,
+            farmacia_id=farmacia_id,
+            motorista_id=motorista_id,
+            region=request.query_params.get('region') or None,
+            estado=estado,
+        )
+        return Response({
+            'intervalo': intervalo,
+            'desde': fecha_desde.isoformat(),
+            'hasta': fecha_hasta.isoformat(),
+            'resultados': resultados,
+        })
+
+
+class BusquedaViewSet(viewsets.ViewSet):
+    """
+    Global search over the denormalized search index.
+    Params: q (required), tipo (comma separated: DESPACHO, MOTORISTA, FARMACIA, MOTO), limite (max 100).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return Response({'detail': 'q required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        tipos_validos = dict(DocumentoBusqueda.TIPOS)
+        tipos = [tipo.upper() for tipo in request.query_params.get('tipo', '').split(',') if tipo]
+        if any(tipo not in tipos_validos for tipo in tipos):
+            return Response({'detail': f'tipo debe ser uno de: {", ".join(tipos_validos)}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limite = min(int(request.query_params.get('limite', LIMITE_RESULTADOS)), 100)
+        except ValueError:
+            return Response({'detail': 'limite must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultados = [
+            {
+                'tipo': documento.tipo,
+                'id': documento.objeto_id,
+                'titulo': documento.titulo,
+                'subtitulo': documento.subtitulo,
+            }
+            for documento in buscar(q, tipos=tipos or None, limite=max(limite, 1))
+        ]
+        return Response({'q': q, 'resultados': resultados})
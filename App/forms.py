@@ -5,7 +5,9 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm as DjangoUserCreationForm
 from .models import Farmacia, Motorista, Moto, MantenimientoMoto, AsignacionMoto, AsignacionFarmacia, Despacho, User, ProductoPedido, DocumentacionMoto, PermisoCirculacion
 from django.utils import timezone
+from django.db.models import Case, When
 from django.forms import inlineformset_factory
+from .services.recomendacion_motoristas import recomendar
 
 
 # ============================================
@@ -477,11 +479,15 @@ class AsignacionFarmaciaForm(forms.ModelForm):
         return motorista
 
 class DespachoForm(forms.ModelForm):
+    """
+    Datos del despacho. El estado no se edita aquí: los cambios de estado pasan
+    por services/estados_despacho.transicionar (validación y evento).
+    """
     class Meta:
         model = Despacho
         fields = [
             'farmacia_origen', 'motorista_asignado', 'direccion_entrega',
-            'estado', 'tipo_movimiento',
+            'tipo_movimiento',
             'fecha_hora_toma_pedido', 'fecha_hora_salida_farmacia', 'fecha_hora_estimada_llegada',
             'numero_receta', 'fecha_emision_receta', 'medico_prescribiente', 'paciente_nombre', 'paciente_edad', 'tipo_establecimiento_traslado',
             'motivo_reenvio', 
@@ -492,7 +498,6 @@ class DespachoForm(forms.ModelForm):
             'farmacia_origen': forms.Select(attrs={'class': 'form-select'}),
             'motorista_asignado': forms.Select(attrs={'class': 'form-select'}),
             'direccion_entrega': forms.TextInput(attrs={'class': 'form-control'}),
-            'estado': forms.Select(attrs={'class': 'form-select'}),
             'tipo_movimiento': forms.Select(attrs={'class': 'form-select', 'id': 'id_tipo_movimiento'}),
             'fecha_hora_toma_pedido': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
             'fecha_hora_salida_farmacia': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
@@ -509,6 +514,10 @@ class DespachoForm(forms.ModelForm):
             'imagen': forms.ClearableFileInput(attrs={'class': 'form-control'}),
         }
 
+    # Candidatos del desplegable: más que los que muestra la API, para que un
+    # POST no rechace al elegido si el ranking cambió desde que se cargó el formulario
+    LIMITE_MOTORISTAS = 50
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Inicialmente, mostrar ningún motorista (se filtra dinámicamente)
@@ -517,21 +526,24 @@ class DespachoForm(forms.ModelForm):
         if 'farmacia_origen' in self.data:
             try:
                 farmacia_id = int(self.data.get('farmacia_origen'))
-                # Filtrar motoristas asignados activamente a esa farmacia
-                asignaciones = AsignacionFarmacia.objects.filter(farmacia_id=farmacia_id, activa=True)
-                motoristas_ids = asignaciones.values_list('motorista_id', flat=True)
-                self.fields['motorista_asignado'].queryset = Motorista.objects.filter(identificador_unico__in=motoristas_ids)
-            except (ValueError, TypeError):
+                self.fields['motorista_asignado'].queryset = self._motoristas_recomendados(farmacia_id)
+            except (ValueError, TypeError, Farmacia.DoesNotExist):
                 pass
         elif self.instance.pk:
-            # Si editando, incluir el motorista actual en el queryset (además de los asignados a la farmacia actual)
-            farmacia_id = self.instance.farmacia_origen_id
-            asignaciones = AsignacionFarmacia.objects.filter(farmacia_id=farmacia_id, activa=True)
-            # motoristas_ids = asignaciones.values_list('motorista_id', flat=True)
-            # motoristas_ids = list(motoristas_ids) + [self.instance.motorista_asignado_id]
-            motoristas_ids = set(asignaciones.values_list('motorista_id', flat=True))
-            motoristas_ids.add(self.instance.motorista_asignado_id)
-            self.fields['motorista_asignado'].queryset = Motorista.objects.filter(identificador_unico__in=motoristas_ids).distinct()
+            # Si editando, incluir el motorista actual además de los recomendados para la farmacia actual
+            self.fields['motorista_asignado'].queryset = self._motoristas_recomendados(
+                self.instance.farmacia_origen_id, incluir=self.instance.motorista_asignado_id
+            )
+
+    def _motoristas_recomendados(self, farmacia_id, incluir=None):
+        """Motoristas en el orden de services/recomendacion_motoristas (cercanía y carga)."""
+        ids = [candidato['motorista_id'] for candidato in recomendar(farmacia_id, limite=self.LIMITE_MOTORISTAS)]
+        if incluir is not None and incluir not in ids:
+            ids.append(incluir)
+        if not ids:
+            return Motorista.objects.none()
+        orden = Case(*[When(pk=pk, then=posicion) for posicion, pk in enumerate(ids)])
+        return Motorista.objects.filter(pk__in=ids).order_by(orden)
 
 
 class ProductoPedidoForm(forms.ModelForm):
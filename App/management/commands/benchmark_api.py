@@ -0,0 +1,78 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from App.api.renderers import ORJSON_DISPONIBLE, FastJSONRenderer
+from App.api.views import DespachoViewSet
+from App.middleware.compresion import BROTLI_DISPONIBLE, CALIDAD_BROTLI, comprimir
+
+
+def _medir(funcion, repeticiones):
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), resultado
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide una página del listado de despachos de la API: consulta + serialización, "
+        "render JSON (DRF vs orjson) y tamaño sin comprimir / gzip / brotli."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help="Despachos por página (máx. 100)")
+        parser.add_argument('--repeticiones', type=int, default=20, help="Mediciones por caso (se reporta la mediana)")
+        parser.add_argument('--usuario', help="Usuario que hace la petición (por defecto el primer superusuario)")
+
+    def handle(self, *args, **options):
+        repeticiones = max(1, options['repeticiones'])
+        User = get_user_model()
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = User.objects.filter(is_superuser=True).first()
+        if usuario is None:
+            raise CommandError("No hay un usuario con el que autenticar la petición.")
+
+        vista = DespachoViewSet.as_view({'get': 'list'})
+        fabrica = APIRequestFactory()
+
+        def listar():
+            request = fabrica.get('/api/despachos/', {'page_size': options['page_size']})
+            force_authenticate(request, user=usuario)
+            return vista(request).data
+
+        ms_serializar, datos = _medir(listar, repeticiones)
+        filas = len(datos.get('results', []))
+        self.stdout.write(f"Página de {filas} despachos, mediana de {repeticiones} repeticiones")
+        self.stdout.write(f"  consulta + serialización: {ms_serializar:8.2f} ms")
+
+        contenido = None
+        for nombre, renderer in (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+            ms_render, contenido = _medir(lambda: renderer.render(datos), repeticiones)
+            self.stdout.write(f"  render {nombre:<19}{ms_render:8.2f} ms")
+        if not ORJSON_DISPONIBLE:
+            self.stdout.write(self.style.WARNING("  orjson no está instalado: FastJSONRenderer usa json.dumps"))
+
+        ms_gzip, comprimido = _medir(lambda: comprimir(contenido, 'gzip'), repeticiones)
+        self.stdout.write(f"  sin comprimir:            {len(contenido):8d} bytes")
+        self.stdout.write(
+            f"  gzip:                     {len(comprimido):8d} bytes ({ms_gzip:.2f} ms, "
+            f"{len(comprimido) / len(contenido):.0%})"
+        )
+        if BROTLI_DISPONIBLE:
+            ms_br, comprimido = _medir(lambda: comprimir(contenido, 'br'), repeticiones)
+            self.stdout.write(
+                f"  {f'brotli (q={CALIDAD_BROTLI}):':<26}{len(comprimido):8d} bytes ({ms_br:.2f} ms, "
+                f"{len(comprimido) / len(contenido):.0%})"
+            )
+        else:
+            self.stdout.write(self.style.WARNING("  brotli no está instalado: la API responde con gzip"))
@@ -0,0 +1,44 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from App.services.asignaciones import asignar_turno
+
+
+def _id(valor):
+    valor = (valor or '').strip()
+    return int(valor) if valor else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga las asignaciones de un turno desde un CSV con columnas motorista,moto,farmacia (ids; "
+        "moto y farmacia pueden ir vacías). Todo o nada: si hay conflictos no se aplica ninguna."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del CSV")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], newline='', encoding='utf-8-sig') as archivo:
+                items = [
+                    {'motorista': _id(fila['motorista']), 'moto': _id(fila.get('moto')), 'farmacia': _id(fila.get('farmacia'))}
+                    for fila in csv.DictReader(archivo)
+                ]
+        except (OSError, KeyError, ValueError) as exc:
+            raise CommandError(f"No se pudo leer el turno: {exc}")
+        if not items or any(item['motorista'] is None for item in items):
+            raise CommandError("Cada fila debe indicar un motorista.")
+
+        resultado = asignar_turno(items)
+        if not resultado['ok']:
+            for conflicto in resultado['conflictos']:
+                # Fila 1 es el encabezado
+                self.stderr.write(f"Fila {conflicto['indice'] + 2}: {conflicto['detail']}")
+            raise CommandError(f"Turno no aplicado: {len(resultado['conflictos'])} conflictos.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Turno aplicado: {resultado['motos_asignadas']} motos y {resultado['farmacias_asignadas']} "
+            f"farmacias asignadas, {resultado['liberadas']} motos liberadas."
+        ))
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from App.services import eventos_despacho
+
+
+def _retroceder(mes, meses):
+    indice = mes.year * 12 + mes.month - 1 - meses
+    return mes.replace(year=indice // 12, month=indice % 12 + 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mantiene DespachoEvento: archiva en CSV comprimido y elimina los meses más antiguos que "
+        "--meses, borra eventos de despachos eliminados y, en MySQL, crea las particiones de los "
+        "meses siguientes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses', type=int, default=getattr(settings, 'EVENTOS_DESPACHO_MESES_ACTIVOS', 12),
+            help="Meses completos que se mantienen en la base, además del actual",
+        )
+        parser.add_argument(
+            '--directorio', default=getattr(settings, 'EVENTOS_DESPACHO_ARCHIVO_DIR', None),
+            help="Directorio donde se archivan los meses eliminados",
+        )
+        parser.add_argument('--sin-archivo', action='store_true', help="Elimina los meses antiguos sin archivarlos")
+        parser.add_argument(
+            '--particiones-futuras', type=int, default=3,
+            help="Meses siguientes que deben tener partición propia (solo MySQL)",
+        )
+
+    def handle(self, *args, **options):
+        if options['meses'] < 0 or options['particiones_futuras'] < 0:
+            raise CommandError("--meses y --particiones-futuras no pueden ser negativos.")
+        if not options['sin_archivo'] and not options['directorio']:
+            raise CommandError("Indique --directorio o use --sin-archivo.")
+
+        mes_actual = eventos_despacho.inicio_mes(timezone.now().date())
+        limite = _retroceder(mes_actual, options['meses'])
+        for mes in eventos_despacho.meses_anteriores(limite):
+            if not options['sin_archivo']:
+                ruta, filas = eventos_despacho.archivar_mes(mes, options['directorio'])
+                self.stdout.write(f"{mes:%Y-%m}: {filas} eventos archivados en {ruta}")
+            filas = eventos_despacho.descartar_mes(mes)
+            self.stdout.write(f"{mes:%Y-%m}: {filas} eventos eliminados")
+
+        huerfanos = eventos_despacho.eliminar_huerfanos()
+        nuevas = eventos_despacho.asegurar_particiones(_retroceder(mes_actual, -options['particiones_futuras']))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Eventos compactados: {huerfanos} de despachos eliminados; "
+            f"{len(nuevas)} particiones nuevas{': ' + ', '.join(nuevas) if nuevas else ''}."
+        ))
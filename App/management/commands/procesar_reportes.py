@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from App.models import TrabajoReporte
+from App.services.trabajos_reporte import ejecutar_trabajo
+
+
+class Command(BaseCommand):
+    help = "Genera los reportes en segundo plano que quedaron pendientes (ej: tras reiniciar el servidor)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reiniciar',
+            action='store_true',
+            help="Vuelve a PENDIENTE los trabajos EN_PROCESO interrumpidos antes de procesarlos"
+        )
+
+    def handle(self, *args, **options):
+        if options['reiniciar']:
+            reiniciados = TrabajoReporte.objects.filter(estado='EN_PROCESO').update(
+                estado='PENDIENTE', fecha_inicio=None
+            )
+            self.stdout.write(f"Trabajos reiniciados: {reiniciados}")
+
+        pendientes = list(
+            TrabajoReporte.objects.filter(estado='PENDIENTE')
+            .order_by('fecha_creacion')
+            .values_list('pk', flat=True)
+        )
+        completados = sum(1 for pk in pendientes if ejecutar_trabajo(pk))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Trabajos procesados: {len(pendientes)} ({completados} completados)."
+        ))
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from App.services.cache_dashboard import invalidar_dashboards
+from App.services.resumen_diario import recalcular_rango, recalcular_todo
+
+
+class Command(BaseCommand):
+    help = "Recalcula ResumenDiarioDespacho para un rango de días o para toda la historia."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Fecha inicial (YYYY-MM-DD)")
+        parser.add_argument('--hasta', help="Fecha final (YYYY-MM-DD), por defecto igual a --desde")
+
+    def _parse_fecha(self, valor):
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Fecha inválida: {valor}. Use el formato YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        desde = options.get('desde')
+        hasta = options.get('hasta')
+
+        if not desde and not hasta:
+            filas = recalcular_todo()
+            invalidar_dashboards()
+            self.stdout.write(self.style.SUCCESS(f"Resumen reconstruido: {filas} filas."))
+            return
+
+        fecha_desde = self._parse_fecha(desde or hasta)
+        fecha_hasta = self._parse_fecha(hasta) if hasta else fecha_desde
+        if fecha_hasta < fecha_desde:
+            raise CommandError("--hasta no puede ser anterior a --desde.")
+
+        filas = recalcular_rango(fecha_desde, fecha_hasta)
+        invalidar_dashboards()
+        self.stdout.write(self.style.SUCCESS(
+            f"Resumen recalculado del {fecha_desde} al {fecha_hasta}: {filas} filas."
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from App.services.busqueda import TIPOS, indexar, reindexar_todo
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda global (DocumentoBusqueda)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipo', help=f"Solo un tipo: {', '.join(TIPOS)}")
+
+    def handle(self, *args, **options):
+        tipo = options.get('tipo')
+        if tipo:
+            tipo = tipo.upper()
+            if tipo not in TIPOS:
+                raise CommandError(f"Tipo inválido: {tipo}. Opciones: {', '.join(TIPOS)}.")
+            resultado = {tipo: indexar(tipo)}
+        else:
+            resultado = reindexar_todo()
+
+        for nombre, total in resultado.items():
+            self.stdout.write(f"{nombre}: {total} documentos")
+        self.stdout.write(self.style.SUCCESS("Índice de búsqueda actualizado."))
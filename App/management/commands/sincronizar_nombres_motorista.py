@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from App.models import Motorista
+
+
+class Command(BaseCommand):
+    help = "Recalcula Motorista.nombre_visible desde el usuario asociado (backfill de la columna desnormalizada)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Filas por UPDATE (por defecto 1000)")
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        pendientes = []
+        actualizados = 0
+        for motorista in Motorista.objects.select_related('usuario').iterator(chunk_size=lote):
+            nombre = motorista.calcular_nombre_visible()
+            if motorista.nombre_visible != nombre:
+                motorista.nombre_visible = nombre
+                pendientes.append(motorista)
+            if len(pendientes) >= lote:
+                Motorista.objects.bulk_update(pendientes, ['nombre_visible'])
+                actualizados += len(pendientes)
+                pendientes = []
+        if pendientes:
+            Motorista.objects.bulk_update(pendientes, ['nombre_visible'])
+            actualizados += len(pendientes)
+
+        self.stdout.write(self.style.SUCCESS(f"Nombres de motorista actualizados: {actualizados}."))
@@ -0,0 +1,88 @@
+"""
+Compresión gzip/brotli de las respuestas de la API.
+
+Los listados JSON son muy repetitivos (las mismas claves en cada fila) y se
+reducen a una fracción de su tamaño, lo que en la red móvil de los motoristas
+pesa más que el costo de comprimir. Solo se comprimen rutas de
+API_COMPRESION_PREFIJOS sobre API_COMPRESION_MIN_BYTES; brotli se usa si está
+instalado y el cliente lo acepta, si no gzip.
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+BROTLI_DISPONIBLE = brotli is not None
+
+# Calidad media: casi la razón de compresión de 11 a una fracción del tiempo
+CALIDAD_BROTLI = 5
+
+_acepta = re.compile(r'\b(?P<codificacion>br|gzip)\b(?:\s*;\s*q=(?P<q>[0-9.]+))?')
+
+
+def codificaciones_aceptadas(accept_encoding):
+    """Codificaciones soportadas presentes en Accept-Encoding (sin las de q=0)."""
+    aceptadas = set()
+    for coincidencia in _acepta.finditer(accept_encoding or ''):
+        q = coincidencia.group('q')
+        try:
+            if q is not None and float(q) == 0:
+                continue
+        except ValueError:
+            continue
+        aceptadas.add(coincidencia.group('codificacion'))
+    return aceptadas
+
+
+def comprimir(contenido, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(contenido, quality=CALIDAD_BROTLI)
+    return compress_string(contenido)
+
+
+class CompresionAPIMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefijos = tuple(getattr(settings, 'API_COMPRESION_PREFIJOS', ('/api/',)))
+        self.min_bytes = getattr(settings, 'API_COMPRESION_MIN_BYTES', 1024)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not request.path.startswith(self.prefijos):
+            return response
+        # Aunque no se comprima esta respuesta, la misma URL puede comprimirse con otro tamaño
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < self.min_bytes
+        ):
+            return response
+
+        aceptadas = codificaciones_aceptadas(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if 'br' in aceptadas and BROTLI_DISPONIBLE:
+            codificacion = 'br'
+        elif 'gzip' in aceptadas:
+            codificacion = 'gzip'
+        else:
+            return response
+
+        comprimido = comprimir(response.content, codificacion)
+        if len(comprimido) >= len(response.content):
+            return response
+
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        response['Content-Encoding'] = codificacion
+        # El ETag fuerte identifica los bytes sin comprimir
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def poblar_resumen(apps, schema_editor):
+    Despacho = apps.get_model('App', 'Despacho')
+    ResumenDiarioDespacho = apps.get_model('App', 'ResumenDiarioDespacho')
+
+    con_tiempos = Q(fecha_hora_estimada_llegada__isnull=False, fecha_hora_despacho__isnull=False)
+    duracion = ExpressionWrapper(
+        F('fecha_hora_estimada_llegada') - F('fecha_hora_despacho'),
+        output_field=DurationField()
+    )
+    grupos = Despacho.objects.order_by().annotate(
+        dia=TruncDate('fecha_hora_creacion')
+    ).values('dia', 'farmacia_origen_id', 'motorista_asignado_id', 'estado').annotate(
+        cantidad=Count('identificador_unico'),
+        con_tiempo=Count('identificador_unico', filter=con_tiempos),
+        duracion=Sum(duracion, filter=con_tiempos),
+    )
+    ResumenDiarioDespacho.objects.bulk_create([
+        ResumenDiarioDespacho(
+            fecha=g['dia'],
+            farmacia_id=g['farmacia_origen_id'],
+            motorista_id=g['motorista_asignado_id'],
+            estado=g['estado'],
+            cantidad=g['cantidad'],
+            entregas_con_tiempo=g['con_tiempo'],
+            duracion_total_segundos=int(g['duracion'].total_seconds()) if g['duracion'] else 0,
+        )
+        for g in grupos
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiarioDespacho',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_RUTA', 'En Ruta'), ('ENTREGADO', 'Entregado'), ('INCIDENCIA', 'Incidencia'), ('ANULADO', 'Anulado'), ('REENVIO', 'Reenvío')], max_length=20)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('entregas_con_tiempo', models.PositiveIntegerField(default=0)),
+                ('duracion_total_segundos', models.BigIntegerField(default=0)),
+                ('farmacia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='App.farmacia')),
+                ('motorista', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='App.motorista')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Despachos',
+                'verbose_name_plural': 'Resúmenes Diarios de Despachos',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['fecha', 'estado'], name='resumen_fecha_estado_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'farmacia', 'motorista', 'estado'), name='resumen_diario_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
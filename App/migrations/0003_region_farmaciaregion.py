@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0002_resumen_diario_despacho'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Region',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(help_text='Valor usado en Farmacia.region', max_length=100, unique=True)),
+                ('nombre', models.CharField(max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Región',
+                'verbose_name_plural': 'Regiones',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FarmaciaRegion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('farmacia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='farmacia_regiones', to='App.farmacia')),
+                ('region', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='farmacia_regiones', to='App.region')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='farmacia',
+            name='regiones',
+            field=models.ManyToManyField(blank=True, related_name='farmacias', through='App.FarmaciaRegion', to='App.region'),
+        ),
+        migrations.AddIndex(
+            model_name='farmaciaregion',
+            index=models.Index(fields=['region', 'farmacia'], name='region_farmacia_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='farmaciaregion',
+            constraint=models.UniqueConstraint(fields=('farmacia', 'region'), name='farmacia_region_unica'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def poblar_regiones(apps, schema_editor):
+    Farmacia = apps.get_model('App', 'Farmacia')
+    Region = apps.get_model('App', 'Region')
+    FarmaciaRegion = apps.get_model('App', 'FarmaciaRegion')
+
+    # Catálogo completo según Farmacia.LAS_REGIONES
+    nombres = dict(Farmacia._meta.get_field('region').choices)
+    regiones = {}
+    for codigo, nombre in nombres.items():
+        regiones[codigo] = Region.objects.get_or_create(codigo=codigo, defaults={'nombre': nombre})[0]
+
+    # Separar el campo region (coma separado) en filas de FarmaciaRegion
+    relaciones = []
+    for farmacia_id, region in Farmacia.objects.values_list('identificador_unico', 'region').iterator():
+        codigos = {c.strip() for c in (region or '').split(',') if c.strip()}
+        for codigo in codigos:
+            if codigo not in regiones:
+                regiones[codigo] = Region.objects.create(codigo=codigo, nombre=codigo)
+            relaciones.append(FarmaciaRegion(farmacia_id=farmacia_id, region=regiones[codigo]))
+
+    FarmaciaRegion.objects.bulk_create(relaciones, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0003_region_farmaciaregion'),
+    ]
+
+    operations = [
+        migrations.RunPython(poblar_regiones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0005_trabajo_reporte'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportdownloadhistory',
+            name='formato',
+            field=models.CharField(choices=[('CSV', 'CSV'), ('PDF', 'PDF'), ('XLSX', 'Excel (XLSX)'), ('PARQUET', 'Parquet')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='trabajoreporte',
+            name='formato',
+            field=models.CharField(choices=[('CSV', 'CSV'), ('PDF', 'PDF'), ('XLSX', 'Excel (XLSX)'), ('PARQUET', 'Parquet')], max_length=10),
+        ),
+    ]
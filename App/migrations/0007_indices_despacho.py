@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0006_formatos_reporte_tipados'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['fecha_hora_creacion', 'identificador_unico'], name='despacho_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['estado', 'fecha_hora_creacion'], name='despacho_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['tipo_movimiento', 'fecha_hora_creacion'], name='despacho_tipo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['motorista_asignado', 'fecha_hora_creacion'], name='despacho_motorista_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['farmacia_origen', 'fecha_hora_creacion'], name='despacho_farmacia_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(condition=models.Q(('estado__in', ['PENDIENTE', 'EN_RUTA'])), fields=['fecha_hora_creacion'], name='despacho_activos_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+
+def crear_indice_fulltext(apps, schema_editor):
+    # Django no declara índices FULLTEXT; en otros motores la búsqueda usa LIKE sobre la tabla compacta
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE App_documentobusqueda ADD FULLTEXT INDEX documento_busqueda_ft (contenido)'
+        )
+
+
+def eliminar_indice_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE App_documentobusqueda DROP INDEX documento_busqueda_ft')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0007_indices_despacho'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('DESPACHO', 'Despacho'), ('MOTORISTA', 'Motorista'), ('FARMACIA', 'Farmacia'), ('MOTO', 'Moto')], max_length=20)),
+                ('objeto_id', models.PositiveIntegerField()),
+                ('titulo', models.CharField(max_length=255)),
+                ('subtitulo', models.CharField(blank=True, max_length=255)),
+                ('contenido', models.TextField()),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Documento de Búsqueda',
+                'verbose_name_plural': 'Documentos de Búsqueda',
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='documento_busqueda_unico')],
+            },
+        ),
+        migrations.RunPython(crear_indice_fulltext, eliminar_indice_fulltext),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+def poblar_nombre_visible(apps, schema_editor):
+    # Misma regla que Motorista.nombre_de_usuario (el modelo histórico no tiene sus métodos)
+    Motorista = apps.get_model('App', 'Motorista')
+    pendientes = []
+    for motorista in Motorista.objects.select_related('usuario').filter(usuario__isnull=False).iterator():
+        usuario = motorista.usuario
+        motorista.nombre_visible = f"{usuario.first_name or ''} {usuario.last_name or ''}".strip() or usuario.username
+        pendientes.append(motorista)
+    Motorista.objects.bulk_update(pendientes, ['nombre_visible'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0008_documento_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='motorista',
+            name='nombre_visible',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(poblar_nombre_visible, migrations.RunPython.noop),
+    ]
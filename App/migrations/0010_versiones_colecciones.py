@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def crear_versiones(apps, schema_editor):
+    # Con fila desde el inicio, toda respuesta lleva Last-Modified
+    VersionColeccion = apps.get_model('App', 'VersionColeccion')
+    for nombre in ('despacho', 'farmacia', 'motorista', 'moto', 'asignacion'):
+        VersionColeccion.objects.get_or_create(nombre=nombre)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0009_motorista_nombre_visible'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionColeccion',
+            fields=[
+                ('nombre', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Versión de Colección',
+                'verbose_name_plural': 'Versiones de Colección',
+            },
+        ),
+        migrations.AddField(
+            model_name='despacho',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='farmacia',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='moto',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(crear_versiones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0010_versiones_colecciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despacho',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TransicionDespacho',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_RUTA', 'En Ruta'), ('ENTREGADO', 'Entregado'), ('INCIDENCIA', 'Incidencia'), ('ANULADO', 'Anulado'), ('REENVIO', 'Reenvío')], max_length=20)),
+                ('estado_nuevo', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_RUTA', 'En Ruta'), ('ENTREGADO', 'Entregado'), ('INCIDENCIA', 'Incidencia'), ('ANULADO', 'Anulado'), ('REENVIO', 'Reenvío')], max_length=20)),
+                ('motivo', models.TextField(blank=True)),
+                ('fecha_hora', models.DateTimeField(default=django.utils.timezone.now)),
+                ('despacho', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transiciones', to='App.despacho')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transición de Despacho',
+                'verbose_name_plural': 'Transiciones de Despacho',
+                'ordering': ['fecha_hora', 'id'],
+                'indexes': [models.Index(fields=['despacho', 'fecha_hora'], name='transicion_despacho_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:10
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Copia fija de DespachoEvento.CODIGOS al momento de esta migración
+CODIGOS = {'PENDIENTE': 1, 'EN_RUTA': 2, 'ENTREGADO': 3, 'INCIDENCIA': 4, 'ANULADO': 5, 'REENVIO': 6}
+MESES_ADELANTE = 3
+TAM_LOTE = 1000
+
+
+def poblar_eventos(apps, schema_editor):
+    """
+    Creación de cada despacho y las transiciones ya registradas en TransicionDespacho.
+    Sin transiciones, el despacho se creó PENDIENTE (valor por defecto) y, si
+    su estado actual es otro, se registra ese cambio en fecha_actualizacion:
+    no se inventa una creación en el estado actual.
+    """
+    Despacho = apps.get_model('App', 'Despacho')
+    TransicionDespacho = apps.get_model('App', 'TransicionDespacho')
+    DespachoEvento = apps.get_model('App', 'DespachoEvento')
+
+    lote = []
+
+    def agregar(evento):
+        lote.append(evento)
+        if len(lote) >= TAM_LOTE:
+            DespachoEvento.objects.bulk_create(lote)
+            lote.clear()
+
+    # El estado inicial es el anterior de la primera transición; sin transiciones, PENDIENTE
+    iniciales = {}
+    for transicion in TransicionDespacho.objects.order_by('fecha_hora', 'id').iterator():
+        iniciales.setdefault(transicion.despacho_id, transicion.estado_anterior)
+    for pk, creacion, actualizacion, estado in Despacho.objects.values_list(
+        'identificador_unico', 'fecha_hora_creacion', 'fecha_actualizacion', 'estado'
+    ).iterator():
+        inicial = iniciales.get(pk, 'PENDIENTE')
+        agregar(DespachoEvento(despacho_id=pk, fecha_hora=creacion, estado=CODIGOS[inicial]))
+        if pk not in iniciales and estado != inicial:
+            agregar(DespachoEvento(
+                despacho_id=pk, fecha_hora=max(creacion, actualizacion),
+                estado=CODIGOS[estado], estado_anterior=CODIGOS[inicial],
+            ))
+    for transicion in TransicionDespacho.objects.order_by('fecha_hora', 'id').iterator():
+        agregar(DespachoEvento(
+            despacho_id=transicion.despacho_id, fecha_hora=transicion.fecha_hora,
+            estado=CODIGOS[transicion.estado_nuevo], estado_anterior=CODIGOS[transicion.estado_anterior],
+        ))
+    if lote:
+        DespachoEvento.objects.bulk_create(lote)
+
+
+def _mes_siguiente(mes):
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def particionar_por_mes(apps, schema_editor):
+    """
+    Solo MySQL: RANGE por mes de fecha_hora (UTC). Lo anterior al mes actual
+    queda en p_historico; compactar_eventos_despacho agrega los meses
+    siguientes partiendo pmax y descarta meses completos con DROP PARTITION.
+    """
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    mes = timezone.now().date().replace(day=1)
+    particiones = [f"PARTITION p_historico VALUES LESS THAN (TO_DAYS('{mes:%Y-%m-%d}'))"]
+    for _ in range(MESES_ADELANTE + 1):
+        siguiente = _mes_siguiente(mes)
+        particiones.append(f"PARTITION p{mes:%Y%m} VALUES LESS THAN (TO_DAYS('{siguiente:%Y-%m-%d}'))")
+        mes = siguiente
+    particiones.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+    schema_editor.execute(
+        'ALTER TABLE App_despachoevento PARTITION BY RANGE (TO_DAYS(fecha_hora)) (' + ', '.join(particiones) + ')'
+    )
+
+
+def quitar_particiones(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE App_despachoevento REMOVE PARTITIONING')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0011_estados_despacho'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DespachoEvento',
+            fields=[
+                ('pk', models.CompositePrimaryKey('despacho', 'fecha_hora', 'estado', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('fecha_hora', models.DateTimeField()),
+                ('estado', models.PositiveSmallIntegerField(choices=[(0, 'Sin estado'), (1, 'Pendiente'), (2, 'En Ruta'), (3, 'Entregado'), (4, 'Incidencia'), (5, 'Anulado'), (6, 'Reenvío')])),
+                ('estado_anterior', models.PositiveSmallIntegerField(choices=[(0, 'Sin estado'), (1, 'Pendiente'), (2, 'En Ruta'), (3, 'Entregado'), (4, 'Incidencia'), (5, 'Anulado'), (6, 'Reenvío')], default=0)),
+                ('despacho', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='eventos', to='App.despacho')),
+            ],
+            options={
+                'verbose_name': 'Evento de Despacho',
+                'verbose_name_plural': 'Eventos de Despacho',
+                'ordering': ['despacho', 'fecha_hora'],
+                'indexes': [models.Index(fields=['fecha_hora', 'estado'], name='despacho_evento_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_eventos, migrations.RunPython.noop),
+        migrations.RunPython(particionar_por_mes, quitar_particiones),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0012_eventos_despacho'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despacho',
+            name='latitud_entrega',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='despacho',
+            name='longitud_entrega',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+    ]
@@ -135,12 +135,28 @@ class Farmacia(models.Model):
     latitud = models.DecimalField(max_digits=9, decimal_places=6, help_text="Coordenada de latitud | ej: 40.4168")
     longitud = models.DecimalField(max_digits=9, decimal_places=6, help_text="Coordenada de longitud | ej: -3.7038")
     fecha_hora_creacion = models.DateTimeField(default=timezone.now)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    # Dimensión normalizada de regiones (se sincroniza desde el campo region)
+    regiones = models.ManyToManyField('Region', through='FarmaciaRegion', related_name='farmacias', blank=True)
+
+    def sincronizar_regiones(self):
+        """Refleja el campo region (separado por comas) en la tabla FarmaciaRegion."""
+        nombres = dict(self.LAS_REGIONES)
+        regiones = [
+            Region.objects.get_or_create(codigo=codigo, defaults={'nombre': nombres.get(codigo, codigo)})[0]
+            for codigo in self.get_region_list() if codigo
+        ]
+        self.regiones.set(regiones)
 
     def save(self, *args, **kwargs):
         # Limpieza de dias_operativos
         if self.dias_operativos and isinstance(self.dias_operativos, str):
             self.dias_operativos = ','.join([d.strip() for d in self.dias_operativos.split(',')])
         super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'region' in update_fields:
+            self.sincronizar_regiones()
 
     def __str__(self):
         return f"{self.nombre} ({self.identificador_unico}) - {self.region}, {self.comuna}"
@@ -150,6 +166,35 @@ class Farmacia(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.identificador_unico}) - {self.region}, {self.comuna}"
 
+# 2.1 REGIONES (una farmacia puede atender varias)
+class Region(models.Model):
+    codigo = models.CharField(max_length=100, unique=True, help_text="Valor usado en Farmacia.region")
+    nombre = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['nombre']
+        verbose_name = 'Región'
+        verbose_name_plural = 'Regiones'
+
+    def __str__(self):
+        return self.nombre
+
+
+class FarmaciaRegion(models.Model):
+    farmacia = models.ForeignKey(Farmacia, on_delete=models.CASCADE, related_name='farmacia_regiones')
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, related_name='farmacia_regiones')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['farmacia', 'region'], name='farmacia_region_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['region', 'farmacia'], name='region_farmacia_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.farmacia_id} → {self.region_id}"
+
 # 3. BASE MOTORISTA
 class Motorista(models.Model):
     identificador_unico = models.AutoField(primary_key=True) 
@@ -160,6 +205,10 @@ class Motorista(models.Model):
         'User',
         on_delete=models.CASCADE, related_name='motorista', null=True, blank=True
     )
+    # Nombre del usuario desnormalizado (se sincroniza desde signals.py) para no unir con User al mostrarlo.
+    # El índice sirve para ordenar por nombre (filtros de reportes); los filtros con
+    # icontains (nombre o apellido) no pueden usarlo y recorren la tabla.
+    nombre_visible = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
 
     pasaporte = models.CharField(max_length=50, unique=True, blank=True, null=True, help_text="Número de Pasaporte (Opcional)")
     nombre = models.CharField(max_length=100)
@@ -232,15 +281,21 @@ class Motorista(models.Model):
     #     # Llama al método save original para que se guarde en la BD
     #         super().save(*args, **kwargs)
 
+    @staticmethod
+    def nombre_de_usuario(usuario):
+        """Nombre completo del usuario, o su username si no tiene nombre."""
+        if usuario is None:
+            return ''
+        full = f"{usuario.first_name or ''} {usuario.last_name or ''}".strip()
+        return full or usuario.username
+
+    def calcular_nombre_visible(self):
+        return self.nombre_de_usuario(self.usuario)
+
     @property
     def nombre_completo(self):
-        """Retorna el nombre completo del motorista"""
-        if self.usuario:
-            first = self.usuario.first_name or ''
-            last = self.usuario.last_name or ''
-            full = f"{first} {last}".strip()
-            return full or self.usuario.username
-        return f"Motorista {self.identificador_unico}"
+        """Retorna el nombre completo del motorista (desde nombre_visible, sin consultar el usuario)"""
+        return self.nombre_visible or f"Motorista {self.identificador_unico}"
     
     def __str__(self):
         return f"{self.nombre_completo} - {self.rut}"
@@ -298,6 +353,7 @@ class Moto(models.Model):
     frenadas_bruscas = models.PositiveIntegerField(default=0, help_text='Por día')
     aceleraciones_rapidas = models.PositiveIntegerField(default=0, help_text='Por día')
     tiempo_inactividad_horas = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True, help_text='Horas')
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.patente} - {self.marca} {self.modelo}"
@@ -588,11 +644,16 @@ class Despacho(models.Model):
     farmacia_origen = models.ForeignKey(Farmacia, on_delete=models.CASCADE)
     motorista_asignado = models.ForeignKey(Motorista, on_delete=models.CASCADE)
     fecha_hora_creacion = models.DateTimeField(auto_now_add=True)
+    # auto_now no aplica a QuerySet.update(); quien use update() debe fijarla
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     fecha_hora_toma_pedido = models.DateTimeField(null=True, blank=True)
     fecha_hora_salida_farmacia = models.DateTimeField(null=True, blank=True)
     fecha_hora_despacho = models.DateTimeField(null=True, blank=True)
     fecha_hora_estimada_llegada = models.DateTimeField(blank=True, null=True)
     direccion_entrega = models.CharField(max_length=255)
+    # Punto geocodificado de la dirección de entrega (opcional; lo usa services/estimacion_llegada.py)
+    latitud_entrega = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitud_entrega = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
 
     # Estado y seguimiento
     ESTADOS = (
@@ -605,6 +666,8 @@ class Despacho(models.Model):
     )
 
     estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    # Control optimista: se incrementa con cada cambio de estado (services/estados_despacho.py)
+    version = models.PositiveIntegerField(default=0)
     incidencia_motivo = models.TextField(blank=True, null=True)
     incidencia_fecha_hora = models.DateTimeField(blank=True, null=True)
     motivo_reenvio = models.TextField(blank=True, null=True)
@@ -650,6 +713,20 @@ class Despacho(models.Model):
             return int(diff.total_seconds() // 60)
         else:
             return None
+
+    # Estado leído de la base de datos: signals.py lo compara al guardar para
+    # registrar el DespachoEvento del cambio sin volver a consultarlo.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        if 'estado' in instancia.__dict__:
+            instancia._estado_guardado = instancia.estado
+        return instancia
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'estado' in fields:
+            self._estado_guardado = self.estado
     
     class Meta:
         permissions = [
@@ -658,6 +735,109 @@ class Despacho(models.Model):
             ("can_export_csv", "Puede exportar CSV"),
             ("can_export_pdf", "Puede exportar PDF"),
         ]
+        # Índices según los accesos reales: listados y reportes filtran por
+        # estado, tipo, motorista, farmacia y rango de fechas, y ordenan por
+        # fecha_hora_creacion descendente (con identificador_unico como desempate).
+        indexes = [
+            models.Index(fields=['fecha_hora_creacion', 'identificador_unico'], name='despacho_fecha_idx'),
+            models.Index(fields=['estado', 'fecha_hora_creacion'], name='despacho_estado_fecha_idx'),
+            models.Index(fields=['tipo_movimiento', 'fecha_hora_creacion'], name='despacho_tipo_fecha_idx'),
+            models.Index(fields=['motorista_asignado', 'fecha_hora_creacion'], name='despacho_motorista_fecha_idx'),
+            models.Index(fields=['farmacia_origen', 'fecha_hora_creacion'], name='despacho_farmacia_fecha_idx'),
+            # Parcial: solo despachos activos (bandejas de trabajo). MySQL no
+            # soporta índices parciales y lo omite; ahí lo cubre despacho_estado_fecha_idx.
+            models.Index(
+                fields=['fecha_hora_creacion'],
+                name='despacho_activos_fecha_idx',
+                condition=models.Q(estado__in=['PENDIENTE', 'EN_RUTA']),
+            ),
+        ]
+
+
+# Registro de cambios de estado (solo se agregan filas)
+class TransicionDespacho(models.Model):
+    """
+    Una fila por cambio de estado de un despacho, escrita en la misma
+    transacción que el UPDATE condicional de services/estados_despacho.py.
+    """
+    despacho = models.ForeignKey(Despacho, on_delete=models.CASCADE, related_name='transiciones')
+    estado_anterior = models.CharField(max_length=20, choices=Despacho.ESTADOS)
+    estado_nuevo = models.CharField(max_length=20, choices=Despacho.ESTADOS)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    motivo = models.TextField(blank=True)
+    fecha_hora = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['fecha_hora', 'id']
+        indexes = [models.Index(fields=['despacho', 'fecha_hora'], name='transicion_despacho_idx')]
+        verbose_name = 'Transición de Despacho'
+        verbose_name_plural = 'Transiciones de Despacho'
+
+    def __str__(self):
+        return f"Despacho {self.despacho_id}: {self.estado_anterior} -> {self.estado_nuevo}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("TransicionDespacho es de solo inserción")
+        super().save(*args, **kwargs)
+
+
+# Eventos de despacho para analítica de tiempos (solo se agregan filas)
+class DespachoEvento(models.Model):
+    """
+    Un evento por creación o cambio de estado de un despacho, con los estados
+    como enteros chicos. La clave primaria (despacho, fecha_hora, estado) es
+    también el índice por despacho; en MySQL la tabla se particiona por mes de
+    fecha_hora (migración 0012). Las tablas particionadas no admiten claves
+    foráneas, por eso la FK no crea restricción en la base de datos: al borrar
+    un despacho sus eventos quedan hasta la siguiente compactación
+    (manage.py compactar_eventos_despacho).
+    """
+    SIN_ESTADO = 0
+    # Códigos fijos: no derivarlos del orden de Despacho.ESTADOS
+    CODIGOS = {
+        'PENDIENTE': 1,
+        'EN_RUTA': 2,
+        'ENTREGADO': 3,
+        'INCIDENCIA': 4,
+        'ANULADO': 5,
+        'REENVIO': 6,
+    }
+    ESTADOS = (
+        (SIN_ESTADO, 'Sin estado'),
+        (1, 'Pendiente'),
+        (2, 'En Ruta'),
+        (3, 'Entregado'),
+        (4, 'Incidencia'),
+        (5, 'Anulado'),
+        (6, 'Reenvío'),
+    )
+
+    pk = models.CompositePrimaryKey('despacho', 'fecha_hora', 'estado')
+    despacho = models.ForeignKey(
+        Despacho, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='eventos'
+    )
+    fecha_hora = models.DateTimeField()
+    estado = models.PositiveSmallIntegerField(choices=ESTADOS)
+    estado_anterior = models.PositiveSmallIntegerField(choices=ESTADOS, default=SIN_ESTADO)
+
+    class Meta:
+        ordering = ['despacho', 'fecha_hora']
+        # Analítica por rango de fechas sin pasar por el índice de despacho
+        indexes = [models.Index(fields=['fecha_hora', 'estado'], name='despacho_evento_fecha_idx')]
+        verbose_name = 'Evento de Despacho'
+        verbose_name_plural = 'Eventos de Despacho'
+
+    def __str__(self):
+        return f"Despacho {self.despacho_id}: {self.get_estado_display()} ({self.fecha_hora:%Y-%m-%d %H:%M})"
+
+    @classmethod
+    def de_transicion(cls, despacho_id, anterior, nuevo, fecha_hora):
+        """Evento de `anterior` a `nuevo` (estados de Despacho; anterior None al crear)."""
+        return cls(
+            despacho_id=despacho_id, fecha_hora=fecha_hora, estado=cls.CODIGOS[nuevo],
+            estado_anterior=cls.CODIGOS[anterior] if anterior else cls.SIN_ESTADO,
+        )
 
 
 # Contenido del pedido (productos asociados al despacho)
@@ -673,6 +853,40 @@ class ProductoPedido(models.Model):
         return f"Prod. {self.nombre_producto} ({self.codigo_producto}) x {self.cantidad}"
 
 
+# Resumen diario de despachos (rollup para dashboards y reportes)
+class ResumenDiarioDespacho(models.Model):
+    """
+    Conteos precalculados por día, farmacia, motorista y estado.
+    Se recalcula por día desde signals.py o con el comando recalcular_resumen_diario.
+    """
+    fecha = models.DateField()
+    farmacia = models.ForeignKey(Farmacia, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    motorista = models.ForeignKey(Motorista, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    estado = models.CharField(max_length=20, choices=Despacho.ESTADOS)
+    cantidad = models.PositiveIntegerField(default=0)
+
+    # Suma de (llegada estimada - hora de despacho) para promediar tiempos de entrega
+    entregas_con_tiempo = models.PositiveIntegerField(default=0)
+    duracion_total_segundos = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'farmacia', 'motorista', 'estado'],
+                name='resumen_diario_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['fecha', 'estado'], name='resumen_fecha_estado_idx'),
+        ]
+        ordering = ['-fecha']
+        verbose_name = 'Resumen Diario de Despachos'
+        verbose_name_plural = 'Resúmenes Diarios de Despachos'
+
+    def __str__(self):
+        return f"{self.fecha} - {self.farmacia_id}/{self.motorista_id} {self.estado}: {self.cantidad}"
+
+
 class ReportDownloadHistory(models.Model):
     TIPO_REPORTE = (
         ('GENERAL', 'General'),
@@ -684,6 +898,8 @@ class ReportDownloadHistory(models.Model):
     FORMATO = (
         ('CSV', 'CSV'),
         ('PDF', 'PDF'),
+        ('XLSX', 'Excel (XLSX)'),
+        ('PARQUET', 'Parquet'),
     )
     
     user = models.ForeignKey(
@@ -716,4 +932,102 @@ class ReportDownloadHistory(models.Model):
         verbose_name_plural = 'Historial de Reportes'
     
     def __str__(self):
-        return f"{self.user.username} - {self.get_tipo_reporte_display()} {self.get_formato_display()} - {self.fecha_descarga.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"{self.user.username} - {self.get_tipo_reporte_display()} {self.get_formato_display()} - {self.fecha_descarga.strftime('%Y-%m-%d %H:%M')}"
+
+class TrabajoReporte(models.Model):
+    """
+    Generación de un reporte en segundo plano. El archivo queda en
+    MEDIA_ROOT/reportes/ y, al completarse, se enlaza con su registro
+    de ReportDownloadHistory.
+    """
+    ESTADOS = (
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En Proceso'),
+        ('COMPLETADO', 'Completado'),
+        ('ERROR', 'Error'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='trabajos_reporte'
+    )
+    tipo_reporte = models.CharField(max_length=20, choices=ReportDownloadHistory.TIPO_REPORTE)
+    formato = models.CharField(max_length=10, choices=ReportDownloadHistory.FORMATO)
+    # Parámetros del formulario de reportes: fecha, mes, anio, id_motorista
+    parametros = models.JSONField(default=dict, blank=True)
+
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    archivo = models.FileField(upload_to='reportes/', null=True, blank=True)
+    historial = models.OneToOneField(
+        ReportDownloadHistory,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='trabajo'
+    )
+    mensaje_error = models.TextField(blank=True)
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-fecha_creacion']
+        verbose_name = 'Trabajo de Reporte'
+        verbose_name_plural = 'Trabajos de Reporte'
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion'], name='trabajo_estado_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.get_tipo_reporte_display()} {self.get_formato_display()} - {self.get_estado_display()}"
+
+
+class DocumentoBusqueda(models.Model):
+    """
+    Documento desnormalizado para la búsqueda global. Cada despacho, motorista,
+    farmacia y moto tiene una fila con su texto buscable normalizado (minúsculas,
+    sin tildes); se mantiene desde signals (ver services/busqueda.py).
+    """
+    TIPOS = (
+        ('DESPACHO', 'Despacho'),
+        ('MOTORISTA', 'Motorista'),
+        ('FARMACIA', 'Farmacia'),
+        ('MOTO', 'Moto'),
+    )
+
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    objeto_id = models.PositiveIntegerField()
+    titulo = models.CharField(max_length=255)
+    subtitulo = models.CharField(max_length=255, blank=True)
+    contenido = models.TextField()
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Documento de Búsqueda'
+        verbose_name_plural = 'Documentos de Búsqueda'
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='documento_busqueda_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.objeto_id}: {self.titulo}"
+
+
+class VersionColeccion(models.Model):
+    """
+    Sello de versión de una colección (despachos, farmacias, motos...). Los
+    signals lo incrementan al confirmar cualquier cambio; la API y los
+    dashboards lo usan como ETag / Last-Modified (ver services/versiones.py).
+    """
+    nombre = models.CharField(max_length=40, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Versión de Colección'
+        verbose_name_plural = 'Versiones de Colección'
+
+    def __str__(self):
+        return f"{self.nombre} v{self.version}"
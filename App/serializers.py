@@ -1,6 +1,64 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import User, Farmacia, Motorista, Moto, AsignacionMoto, AsignacionFarmacia, Despacho, ProductoPedido, MantenimientoMoto
 
+def _query_param_set(request, name):
+    """'a, b,c' -> {'a', 'b', 'c'} from a query param; empty set if missing."""
+    value = request.query_params.get(name, '') if request is not None else ''
+    return {part.strip() for part in value.split(',') if part.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets driven by the request in the serializer context:
+    ?fields=a,b keeps only those fields and ?expand=x,y replaces the id of the
+    relations listed in Meta.expandable with the nested object.
+
+    Meta.expandable maps field -> {'serializer', 'many', 'select_related', 'prefetch_related'};
+    Meta.select_related_by_field / prefetch_related_by_field map plain fields to the
+    relations they read, so optimize_queryset() only loads what will be rendered.
+    Only reads (GET/HEAD/OPTIONS) are trimmed: on writes the serializer keeps
+    every field so ?fields= cannot drop input before validation.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None and request.method not in SAFE_METHODS:
+            return
+        expandable = getattr(self.Meta, 'expandable', {})
+        expand = _query_param_set(request, 'expand') & set(expandable)
+        for name in expand:
+            options = expandable[name]
+            self.fields[name] = options['serializer'](read_only=True, many=options.get('many', False))
+
+        fields = _query_param_set(request, 'fields')
+        if fields:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request):
+        """Applies select_related/prefetch_related for the fields the request will render."""
+        expandable = getattr(cls.Meta, 'expandable', {})
+        by_field = {
+            'select_related': getattr(cls.Meta, 'select_related_by_field', {}),
+            'prefetch_related': getattr(cls.Meta, 'prefetch_related_by_field', {}),
+        }
+        fields = _query_param_set(request, 'fields') or set(cls.Meta.fields)
+        expand = _query_param_set(request, 'expand') & set(expandable)
+
+        for method, paths_by_field in by_field.items():
+            paths = set()
+            for name in fields - expand:
+                paths.update(paths_by_field.get(name, ()))
+            for name in expand:
+                paths.update(expandable[name].get(method, ()))
+            if paths:
+                queryset = getattr(queryset, method)(*sorted(paths))
+        return queryset
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -11,10 +69,10 @@ class FarmaciaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Farmacia
         fields = [
-            'id', 'identificador_unico', 'nombre', 'direccion', 'region', 'comuna',
+            'identificador_unico', 'nombre', 'direccion', 'region', 'comuna',
             'horario_recepcion_inicio', 'horario_recepcion_fin', 'dias_operativos', 'telefono', 'correo', 'imagen'
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['identificador_unico']
 
 class MotoristaSerializer(serializers.ModelSerializer):
     usuario = UserSerializer(read_only=True)
@@ -24,22 +82,23 @@ class MotoristaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Motorista
         fields = [
-            'id', 'identificador_unico', 'usuario', 'usuario_id', 'nombre', 'apellido_paterno', 'apellido_materno',
+            'identificador_unico', 'usuario', 'usuario_id', 'nombre', 'apellido_paterno', 'apellido_materno',
             'rut', 'domicilio', 'correo', 'telefono', 'emergencia_nombre', 'emergencia_telefono',
-            'licencia_tipo', 'licencia_vigente', 'disponibilidad', 'posesion_moto', 'activo', 'imagen'
+            'licencia_tipo', 'licencia_vigente', 'disponibilidad', 'posesion_moto', 'activo', 'imagen',
+            'nombre_visible'
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['identificador_unico', 'nombre_visible']
 
 class MotoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Moto
         fields = [
-            'id', 'identificador_unico', 'patente', 'marca', 'modelo', 'color', 'anio_fabricacion',
-            'numero_chasis', 'numero_motor', 'permiso_circulacion_vigente', 'revision_tecnica_vigente',
+            'identificador_unico', 'patente', 'marca', 'modelo', 'color', 'anio_fabricacion',
+            'numero_chasis', 'numero_motor',
             'consumo_combustible', 'capacidad_carga', 'estado', 'imagen',
             'velocidad_promedio', 'frenadas_bruscas', 'aceleraciones_rapidas', 'tiempo_inactividad_horas',
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['identificador_unico']
 
 class AsignacionMotoSerializer(serializers.ModelSerializer):
     motorista = MotoristaSerializer(read_only=True)
@@ -64,7 +123,7 @@ class AsignacionFarmaciaSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'fecha_asignacion', "fecha_desasignacion"]
     
 
-class DespachoSerializer(serializers.ModelSerializer):
+class DespachoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     farmacia_origen = FarmaciaSerializer(read_only=True)
     farmacia_origen_id = serializers.PrimaryKeyRelatedField(write_only=True, source='farmacia_origen', queryset=Farmacia.objects.all())
     motorista_asignado = MotoristaSerializer(read_only=True)
@@ -73,14 +132,96 @@ class DespachoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Despacho
         fields = [
-            'id', 'identificador_unico', 'farmacia_origen', 'farmacia_origen_id', 'motorista_asignado', 'motorista_asignado_id',
+            'identificador_unico', 'farmacia_origen', 'farmacia_origen_id', 'motorista_asignado', 'motorista_asignado_id',
             'fecha_hora_creacion', 'fecha_hora_toma_pedido', 'fecha_hora_salida_farmacia', 'fecha_hora_despacho',
-            'fecha_hora_estimada_llegada', 'direccion_entrega', 'imagen',
-            'estado', 'incidencia_motivo', 'incidencia_fecha_hora', 'motivo_reenvio',
+            'fecha_hora_estimada_llegada', 'direccion_entrega', 'latitud_entrega', 'longitud_entrega', 'imagen',
+            'estado', 'version', 'incidencia_motivo', 'incidencia_fecha_hora', 'motivo_reenvio',
             'tipo_movimiento', 'numero_receta', 'fecha_emision_receta', 'medico_prescribiente',
             'paciente_nombre', 'paciente_edad', 'tipo_establecimiento_traslado', 'productos'
         ]
-        read_only_fields = ['id', 'fecha_hora_creacion']
+        # El estado cambia solo con la acción cambiar_estado (services/estados_despacho.py)
+        read_only_fields = ['fecha_hora_creacion', 'estado', 'version']
+        select_related_by_field = {
+            'farmacia_origen': ['farmacia_origen'],
+            'motorista_asignado': ['motorista_asignado__usuario'],
+        }
+        prefetch_related_by_field = {'productos': ['productos']}
+
+
+class ProductoPedidoResumenSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductoPedido
+        fields = ['id', 'codigo_producto', 'nombre_producto', 'cantidad', 'numero_lote', 'numero_serie']
+        read_only_fields = fields
+
+
+class DespachoListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Flat despacho for list endpoints: related objects as ids plus their
+    display names. ?expand=farmacia_origen,motorista_asignado,productos nests them.
+    """
+    farmacia_nombre = serializers.CharField(source='farmacia_origen.nombre', read_only=True)
+    motorista_nombre = serializers.CharField(source='motorista_asignado.nombre_completo', read_only=True)
+
+    class Meta:
+        model = Despacho
+        fields = [
+            'identificador_unico', 'estado', 'version', 'tipo_movimiento',
+            'farmacia_origen', 'farmacia_nombre', 'motorista_asignado', 'motorista_nombre',
+            'fecha_hora_creacion', 'fecha_hora_estimada_llegada', 'direccion_entrega', 'paciente_nombre',
+        ]
+        read_only_fields = fields
+        select_related_by_field = {
+            'farmacia_nombre': ['farmacia_origen'],
+            'motorista_nombre': ['motorista_asignado'],
+        }
+        expandable = {
+            'farmacia_origen': {'serializer': FarmaciaSerializer, 'select_related': ['farmacia_origen']},
+            'motorista_asignado': {'serializer': MotoristaSerializer, 'select_related': ['motorista_asignado__usuario']},
+            'productos': {'serializer': ProductoPedidoResumenSerializer, 'many': True, 'prefetch_related': ['productos']},
+        }
+
+
+class ProductoPedidoBulkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductoPedido
+        fields = ['codigo_producto', 'nombre_producto', 'cantidad', 'numero_lote', 'numero_serie']
+
+
+class DespachoBulkSerializer(serializers.ModelSerializer):
+    """
+    One item of a bulk upload. Related ids are plain integers checked in a
+    single query per model by the view, instead of one query per item.
+    """
+    farmacia_origen_id = serializers.IntegerField()
+    motorista_asignado_id = serializers.IntegerField()
+    productos = ProductoPedidoBulkSerializer(many=True, required=False)
+
+    class Meta:
+        model = Despacho
+        fields = [
+            'farmacia_origen_id', 'motorista_asignado_id', 'direccion_entrega', 'latitud_entrega', 'longitud_entrega',
+            'tipo_movimiento', 'fecha_hora_estimada_llegada', 'numero_receta', 'fecha_emision_receta', 'medico_prescribiente',
+            'paciente_nombre', 'paciente_edad', 'tipo_establecimiento_traslado', 'productos',
+        ]
+
+    def validate(self, attrs):
+        # Same rule as crear_despacho: DIRECTO orders carry their products
+        if attrs.get('tipo_movimiento') == 'DIRECTO' and not attrs.get('productos'):
+            raise serializers.ValidationError({'productos': 'productos required for DIRECTO'})
+        return attrs
+
+
+class CambioEstadoBulkSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    estado = serializers.ChoiceField(choices=Despacho.ESTADOS)
+
+
+class AsignacionTurnoSerializer(serializers.Serializer):
+    """One roster line: a motorista and, optionally, the moto and farmacia for the shift."""
+    motorista = serializers.IntegerField()
+    moto = serializers.IntegerField(required=False, allow_null=True)
+    farmacia = serializers.IntegerField(required=False, allow_null=True)
 
 
 class MantenimientoMotoSerializer(serializers.ModelSerializer):
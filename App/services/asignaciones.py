@@ -0,0 +1,167 @@
+"""
+Carga de asignaciones de un turno (motorista -> moto -> farmacia) en lote.
+
+AsignacionMoto.save y AsignacionFarmacia.save desactivan en silencio las
+asignaciones que chocan y re-guardan Motorista/Moto fila a fila (lo que a su
+vez dispara signals). Para cargar el turno completo se validan primero todos
+los ítems contra el estado actual, con las filas bloqueadas siempre en el
+mismo orden (motoristas, motos, asignaciones de moto, asignaciones de
+farmacia; cada tabla por pk) para que dos cargas simultáneas no se bloqueen
+mutuamente. Si hay conflictos no se cambia nada y se informan; si no, todo se
+aplica con UPDATE/INSERT por lote en una transacción.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import AsignacionFarmacia, AsignacionMoto, Farmacia, Moto, Motorista
+from . import versiones
+from .cache_dashboard import invalidar_dashboards
+
+
+# Estados de moto que se pueden asignar (OCUPADO: la tiene otro motorista del mismo turno)
+ESTADOS_MOTO_ASIGNABLES = ('OPERATIVO', 'OCUPADO')
+
+
+def _bloquear(modelo, *condiciones, **filtros):
+    # Una consulta por tabla, ordenada por pk: las filas se bloquean siempre en el mismo orden
+    return list(modelo.objects.select_for_update().filter(*condiciones, **filtros).order_by('pk'))
+
+
+def _al_confirmar():
+    def actualizar():
+        invalidar_dashboards()
+        versiones.incrementar('asignacion', 'motorista', 'moto')
+    transaction.on_commit(actualizar)
+
+
+def _conflictos(items, motoristas, motos, farmacias, moto_actual, titular_actual):
+    """Conflictos por ítem: [{'indice', 'motorista', 'detail'}]."""
+    conflictos = []
+    moto_en_turno = {item['motorista']: item.get('moto') for item in items}
+    vistos_motorista = {}
+    vistos_moto = {}
+
+    def conflicto(indice, item, detalle):
+        conflictos.append({'indice': indice, 'motorista': item['motorista'], 'detail': detalle})
+
+    for indice, item in enumerate(items):
+        motorista = motoristas.get(item['motorista'])
+        moto_id, farmacia_id = item.get('moto'), item.get('farmacia')
+        if motorista is None:
+            conflicto(indice, item, 'Motorista no encontrado')
+            continue
+        if not motorista.activo:
+            conflicto(indice, item, f'{motorista.nombre_completo} no está activo')
+        if item['motorista'] in vistos_motorista:
+            conflicto(indice, item, f'Motorista repetido (ítem {vistos_motorista[item["motorista"]]})')
+        vistos_motorista.setdefault(item['motorista'], indice)
+
+        if moto_id is not None:
+            moto = motos.get(moto_id)
+            titular = titular_actual.get(moto_id)
+            if moto is None:
+                conflicto(indice, item, 'Moto no encontrada')
+            elif moto.estado not in ESTADOS_MOTO_ASIGNABLES:
+                conflicto(indice, item, f'Moto {moto.patente} no disponible ({moto.get_estado_display()})')
+            elif titular not in (None, item['motorista']) and moto_en_turno.get(titular) is None:
+                # El titular no recibe otra moto en este turno: no se le quita en silencio
+                conflicto(indice, item, f'Moto {moto.patente} asignada a otro motorista (id {titular})')
+            if moto_id in vistos_moto:
+                conflicto(indice, item, f'Moto repetida (ítem {vistos_moto[moto_id]})')
+            vistos_moto.setdefault(moto_id, indice)
+
+        if farmacia_id is not None:
+            if farmacia_id not in farmacias:
+                conflicto(indice, item, 'Farmacia no encontrada')
+            elif moto_id is None and item['motorista'] not in moto_actual:
+                conflicto(indice, item, f'{motorista.nombre_completo} no tiene moto asignada')
+    return conflictos
+
+
+def asignar_turno(items):
+    """
+    Aplica [{'motorista', 'moto' (opcional), 'farmacia' (opcional)}] (ids).
+    Una moto o farmacia omitida deja la asignación actual del motorista.
+    Retorna {'ok', 'conflictos', 'motos_asignadas', 'farmacias_asignadas', 'liberadas'}.
+    """
+    resultado = {'ok': False, 'conflictos': [], 'motos_asignadas': 0, 'farmacias_asignadas': 0, 'liberadas': 0}
+    ids_motorista = {item['motorista'] for item in items}
+    ids_moto = {item['moto'] for item in items if item.get('moto') is not None}
+    ids_farmacia = {item['farmacia'] for item in items if item.get('farmacia') is not None}
+
+    with transaction.atomic():
+        motoristas = {motorista.pk: motorista for motorista in _bloquear(Motorista, pk__in=ids_motorista)}
+        # También las motos que hoy tienen los motoristas del turno (pueden quedar liberadas)
+        motos_actuales = set(AsignacionMoto.objects.filter(
+            activa=True, motorista_id__in=ids_motorista
+        ).values_list('moto_id', flat=True))
+        motos = {moto.pk: moto for moto in _bloquear(Moto, pk__in=ids_moto | motos_actuales)}
+        asignaciones_moto = _bloquear(
+            AsignacionMoto, Q(motorista_id__in=ids_motorista) | Q(moto_id__in=ids_moto), activa=True
+        )
+        asignaciones_farmacia = _bloquear(AsignacionFarmacia, activa=True, motorista_id__in=ids_motorista)
+        # Las farmacias no se modifican: basta con que existan
+        farmacias = set(Farmacia.objects.filter(pk__in=ids_farmacia).values_list('pk', flat=True))
+
+        moto_actual = {asignacion.motorista_id: asignacion for asignacion in asignaciones_moto}
+        asignacion_de_moto = {asignacion.moto_id: asignacion for asignacion in asignaciones_moto}
+        titular_actual = {moto_id: asignacion.motorista_id for moto_id, asignacion in asignacion_de_moto.items()}
+        farmacia_actual = {asignacion.motorista_id: asignacion for asignacion in asignaciones_farmacia}
+
+        resultado['conflictos'] = _conflictos(items, motoristas, motos, farmacias, moto_actual, titular_actual)
+        if resultado['conflictos']:
+            return resultado
+
+        ahora = timezone.now()
+        cerrar_moto, nuevas_moto = set(), []
+        cerrar_farmacia, nuevas_farmacia = set(), []
+        for item in items:
+            motorista_id, moto_id, farmacia_id = item['motorista'], item.get('moto'), item.get('farmacia')
+            actual = moto_actual.get(motorista_id)
+            if moto_id is not None and (actual is None or actual.moto_id != moto_id):
+                if actual is not None:
+                    cerrar_moto.add(actual.pk)
+                if moto_id in asignacion_de_moto:
+                    cerrar_moto.add(asignacion_de_moto[moto_id].pk)
+                nuevas_moto.append(AsignacionMoto(motorista_id=motorista_id, moto_id=moto_id, activa=True))
+
+            actual = farmacia_actual.get(motorista_id)
+            if farmacia_id is not None and (actual is None or actual.farmacia_id != farmacia_id):
+                if actual is not None:
+                    cerrar_farmacia.add(actual.pk)
+                nuevas_farmacia.append(AsignacionFarmacia(
+                    motorista_id=motorista_id, farmacia_id=farmacia_id, activa=True,
+                    observaciones='Carga de turno',
+                ))
+
+        # Cerrar antes de insertar: las asignaciones activas son únicas por motorista y por moto
+        AsignacionMoto.objects.filter(pk__in=cerrar_moto).update(activa=False, fecha_desasignacion=ahora)
+        AsignacionFarmacia.objects.filter(pk__in=cerrar_farmacia).update(activa=False, fecha_desasignacion=ahora)
+        AsignacionMoto.objects.bulk_create(nuevas_moto)
+        AsignacionFarmacia.objects.bulk_create(nuevas_farmacia)
+
+        motos_nuevas = {asignacion.moto_id for asignacion in nuevas_moto}
+        motos_liberadas = {
+            asignacion.moto_id for asignacion in asignaciones_moto if asignacion.pk in cerrar_moto
+        } - motos_nuevas
+        if nuevas_moto:
+            Motorista.objects.filter(
+                pk__in={asignacion.motorista_id for asignacion in nuevas_moto}
+            ).update(posesion_moto='CON_MOTO')
+            Moto.objects.filter(pk__in=motos_nuevas).update(estado='OCUPADO', fecha_actualizacion=ahora)
+        if motos_liberadas:
+            Moto.objects.filter(pk__in=motos_liberadas).update(estado='OPERATIVO', fecha_actualizacion=ahora)
+        if nuevas_farmacia:
+            Motorista.objects.filter(
+                pk__in={asignacion.motorista_id for asignacion in nuevas_farmacia}
+            ).update(disponibilidad='ASIGNADO')
+
+        if nuevas_moto or nuevas_farmacia:
+            _al_confirmar()
+
+    resultado.update(
+        ok=True, motos_asignadas=len(nuevas_moto), farmacias_asignadas=len(nuevas_farmacia),
+        liberadas=len(motos_liberadas),
+    )
+    return resultado
@@ -0,0 +1,246 @@
+"""
+Búsqueda global sobre despachos, motoristas, farmacias y motos.
+
+Cada objeto tiene un DocumentoBusqueda con su texto buscable normalizado
+(minúsculas, sin tildes ni puntuación). En MySQL la tabla lleva un índice
+FULLTEXT (migración 0008) y se consulta con MATCH ... AGAINST; en otros
+motores se filtra con LIKE sobre la misma tabla, que sigue siendo mucho más
+chica que los JOIN de cada listado.
+"""
+import logging
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models.expressions import RawSQL
+
+from ..models import Despacho, DocumentoBusqueda, Farmacia, Moto, Motorista
+
+
+logger = logging.getLogger(__name__)
+
+TAM_LOTE = 500
+LIMITE_RESULTADOS = 20
+# Despachos de un motorista o farmacia que se reindexan en la misma petición;
+# con más, se reindexan en un hilo de fondo
+LIMITE_DESPACHOS_EN_LINEA = TAM_LOTE
+# innodb_ft_min_token_size por defecto; tokens más cortos se buscan con LIKE
+LARGO_MINIMO_FULLTEXT = 3
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con la puntuación convertida en espacios."""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'\w+', texto))
+
+
+def compactar(texto):
+    """RUT o patente sin puntos, guiones ni espacios: '12.345.678-k' -> '12345678k'."""
+    return ''.join(normalizar(texto).split())
+
+
+def _unir(*partes):
+    return normalizar(' '.join(str(parte) for parte in partes if parte))
+
+
+def _nombre(nombre, apellido_paterno, apellido_materno=''):
+    return ' '.join(parte for parte in (nombre, apellido_paterno, apellido_materno) if parte)
+
+
+# Cada tipo declara su queryset de valores y cómo construir (titulo, subtitulo, contenido)
+
+def _documento_despacho(fila):
+    motorista = _nombre(fila['motorista_asignado__nombre'], fila['motorista_asignado__apellido_paterno'])
+    titulo = f"Despacho #{fila['identificador_unico']} - {fila['paciente_nombre'] or fila['direccion_entrega']}"
+    subtitulo = f"{fila['farmacia_origen__nombre']} · {motorista} · {fila['estado']}"
+    contenido = _unir(
+        fila['identificador_unico'], fila['paciente_nombre'], fila['direccion_entrega'],
+        fila['numero_receta'], fila['medico_prescribiente'], fila['farmacia_origen__nombre'],
+        motorista, fila['motorista_asignado__rut'], compactar(fila['motorista_asignado__rut']),
+    )
+    return titulo, subtitulo, contenido
+
+
+def _documento_motorista(fila):
+    titulo = _nombre(fila['nombre'], fila['apellido_paterno'], fila['apellido_materno'])
+    subtitulo = f"RUT {fila['rut']}"
+    contenido = _unir(
+        titulo, fila['rut'], compactar(fila['rut']), fila['domicilio'], fila['telefono'], fila['correo'],
+    )
+    return titulo, subtitulo, contenido
+
+
+def _documento_farmacia(fila):
+    subtitulo = f"{fila['direccion']}, {fila['comuna']}"
+    contenido = _unir(fila['nombre'], fila['direccion'], fila['comuna'], fila['localidad'], fila['region'])
+    return fila['nombre'], subtitulo, contenido
+
+
+def _documento_moto(fila):
+    subtitulo = f"{fila['marca']} {fila['modelo']}"
+    contenido = _unir(
+        fila['patente'], compactar(fila['patente']), fila['marca'], fila['modelo'],
+        fila['numero_chasis'], fila['numero_motor'],
+    )
+    return fila['patente'], subtitulo, contenido
+
+
+TIPOS = {
+    'DESPACHO': (Despacho, _documento_despacho, (
+        'identificador_unico', 'paciente_nombre', 'direccion_entrega', 'numero_receta', 'medico_prescribiente',
+        'estado', 'farmacia_origen__nombre', 'motorista_asignado__nombre',
+        'motorista_asignado__apellido_paterno', 'motorista_asignado__rut',
+    )),
+    'MOTORISTA': (Motorista, _documento_motorista, (
+        'identificador_unico', 'nombre', 'apellido_paterno', 'apellido_materno', 'rut',
+        'domicilio', 'telefono', 'correo',
+    )),
+    'FARMACIA': (Farmacia, _documento_farmacia, (
+        'identificador_unico', 'nombre', 'direccion', 'comuna', 'localidad', 'region',
+    )),
+    'MOTO': (Moto, _documento_moto, (
+        'identificador_unico', 'patente', 'marca', 'modelo', 'numero_chasis', 'numero_motor',
+    )),
+}
+
+
+def _documentos(tipo, queryset):
+    _, constructor, campos = TIPOS[tipo]
+    for fila in queryset.values(*campos).iterator(chunk_size=TAM_LOTE):
+        titulo, subtitulo, contenido = constructor(fila)
+        yield DocumentoBusqueda(
+            tipo=tipo, objeto_id=fila['identificador_unico'],
+            titulo=titulo[:255], subtitulo=subtitulo[:255], contenido=contenido,
+        )
+
+
+def indexar(tipo, queryset=None):
+    """
+    (Re)genera los documentos de `queryset` (por defecto, todos los objetos
+    del tipo). Retorna la cantidad de documentos escritos.
+    """
+    modelo = TIPOS[tipo][0]
+    if queryset is None:
+        queryset = modelo.objects.all()
+
+    total = 0
+    lote = []
+
+    def escribir(lote):
+        with transaction.atomic():
+            DocumentoBusqueda.objects.filter(
+                tipo=tipo, objeto_id__in=[documento.objeto_id for documento in lote]
+            ).delete()
+            DocumentoBusqueda.objects.bulk_create(lote)
+
+    for documento in _documentos(tipo, queryset.order_by()):
+        lote.append(documento)
+        if len(lote) >= TAM_LOTE:
+            escribir(lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        escribir(lote)
+        total += len(lote)
+    return total
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obtener_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='busqueda')
+        return _executor
+
+
+def _reindexar_despachos_en_hilo(relacion, pk):
+    close_old_connections()
+    try:
+        indexar('DESPACHO', Despacho.objects.filter(**{relacion: pk}))
+    except Exception:
+        logger.exception("Error reindexando los despachos con %s=%s", relacion, pk)
+    finally:
+        connection.close()
+
+
+def actualizar(tipo, pk):
+    """
+    Reindexa un objeto. Si cambia el texto de un motorista o una farmacia,
+    también se reindexan sus despachos, que incluyen su nombre: hasta
+    LIMITE_DESPACHOS_EN_LINEA en la misma llamada y, si son más, en un hilo
+    de fondo. Si el proceso se reinicia antes de terminar, `manage.py
+    reindexar_busqueda --tipo despacho` reconstruye esos documentos.
+    """
+    modelo = TIPOS[tipo][0]
+    anterior = DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id=pk).values_list('contenido', flat=True).first()
+    if not indexar(tipo, modelo.objects.filter(pk=pk)):
+        eliminar(tipo, pk)
+        return
+
+    relacion = {'MOTORISTA': 'motorista_asignado_id', 'FARMACIA': 'farmacia_origen_id'}.get(tipo)
+    if relacion and anterior is not None:
+        actual = DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id=pk).values_list('contenido', flat=True).first()
+        if actual == anterior:
+            return
+        despachos = Despacho.objects.filter(**{relacion: pk}).order_by()
+        if despachos[:LIMITE_DESPACHOS_EN_LINEA + 1].count() <= LIMITE_DESPACHOS_EN_LINEA:
+            indexar('DESPACHO', despachos)
+        else:
+            _obtener_executor().submit(_reindexar_despachos_en_hilo, relacion, pk)
+
+
+def eliminar(tipo, pk):
+    DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id=pk).delete()
+
+
+def reindexar_todo():
+    """Reconstruye el índice completo. Retorna {tipo: documentos}."""
+    resultado = {}
+    for tipo in TIPOS:
+        modelo = TIPOS[tipo][0]
+        ids_vigentes = modelo.objects.values('identificador_unico')
+        DocumentoBusqueda.objects.filter(tipo=tipo).exclude(objeto_id__in=ids_vigentes).delete()
+        resultado[tipo] = indexar(tipo)
+    return resultado
+
+
+def terminos(texto):
+    """Tokens normalizados de la consulta; un RUT o patente escrito con puntuación se compacta."""
+    if re.fullmatch(r'[\d.\-\s]+[kK]?', (texto or '').strip()) and re.search(r'[.\-]', texto):
+        return [compactar(texto)]
+    return normalizar(texto).split()
+
+
+def buscar(texto, tipos=None, limite=LIMITE_RESULTADOS):
+    """
+    Documentos que contienen todos los términos de `texto` (como prefijo en
+    MySQL, como subcadena en otros motores), filtrados por `tipos`.
+    """
+    tokens = terminos(texto)
+    if not tokens:
+        return DocumentoBusqueda.objects.none()
+
+    queryset = DocumentoBusqueda.objects.all()
+    if tipos:
+        queryset = queryset.filter(tipo__in=tipos)
+
+    largos = [token for token in tokens if len(token) >= LARGO_MINIMO_FULLTEXT]
+    if connection.vendor == 'mysql' and largos:
+        consulta = ' '.join(f'+{token}*' for token in largos)
+        relevancia = RawSQL('MATCH (contenido) AGAINST (%s IN BOOLEAN MODE)', (consulta,))
+        queryset = queryset.annotate(relevancia=relevancia).filter(relevancia__gt=0)
+        for token in tokens:
+            if len(token) < LARGO_MINIMO_FULLTEXT:
+                queryset = queryset.filter(contenido__contains=token)
+        return queryset.order_by('-relevancia', 'tipo', '-objeto_id')[:limite]
+
+    for token in tokens:
+        queryset = queryset.filter(contenido__contains=token)
+    return queryset.order_by('tipo', '-objeto_id')[:limite]
@@ -0,0 +1,43 @@
+"""
+Caché de los contextos de dashboard.
+
+Usa el framework de caché de Django (alias settings.DASHBOARD_CACHE_ALIAS) con
+expiración settings.DASHBOARD_CACHE_TTL. Las entradas se invalidan desde
+signals.py cuando cambian despachos, motos, motoristas, farmacias o asignaciones.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+
+CLAVES_DASHBOARD = ('general', 'regional')
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _clave(nombre):
+    return f'dashboard:{nombre}'
+
+
+def obtener_contexto(nombre, constructor, version=None):
+    """
+    Retorna el contexto cacheado del dashboard `nombre`, o lo calcula con
+    `constructor()` y lo guarda si no existe. Con `version` (sello de
+    services.versiones) un contexto guardado con otra versión se recalcula:
+    la caché es por proceso y la invalidación de signals.py solo llega al
+    proceso que hizo el cambio.
+    """
+    cache = _cache()
+    clave = _clave(nombre)
+    guardado = cache.get(clave)
+    if guardado is not None and guardado[0] == version:
+        return guardado[1]
+    contexto = constructor()
+    cache.set(clave, (version, contexto), getattr(settings, 'DASHBOARD_CACHE_TTL', 300))
+    return contexto
+
+
+def invalidar_dashboards():
+    """Elimina todos los contextos de dashboard cacheados."""
+    _cache().delete_many([_clave(nombre) for nombre in CLAVES_DASHBOARD])
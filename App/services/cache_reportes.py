@@ -0,0 +1,117 @@
+"""
+Caché en disco de reportes ya generados.
+
+Cada archivo se guarda con el nombre `<clave>.<formato>`, donde la clave es
+un hash de los filtros normalizados (rango de rango_fechas_por_tipo,
+motorista, formato), del sello de versión de los datos de ese rango
+(metricas.version_resumen) y de los sellos de VersionColeccion de farmacias y
+motoristas, cuyos nombres aparecen en el reporte pero no en el resumen diario.
+Cuando cambia un despacho del rango, una farmacia o un motorista cambia la
+clave, así que nunca se sirve un reporte desactualizado; las entradas viejas
+salen por LRU al superar REPORTES_CACHE_MAX_BYTES.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+from . import versiones
+from .metricas import version_resumen
+
+
+# Colecciones cuyos datos se muestran en el reporte además de los despachos
+COLECCIONES_REPORTE = ('farmacia', 'motorista')
+
+
+def _directorio():
+    directorio = settings.REPORTES_CACHE_DIR
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _ruta(clave, formato):
+    return os.path.join(_directorio(), f"{clave}.{formato.lower()}")
+
+
+def firma_reporte(fecha_desde, fecha_hasta, motorista_id, formato, *extra):
+    """
+    Retorna (clave, total_registros) para los filtros dados. `extra` agrega
+    partes al hash para contenido que depende de algo más (ej: el autor del PDF).
+    """
+    version = version_resumen(
+        fecha_desde=fecha_desde.date() if fecha_desde else None,
+        fecha_hasta=fecha_hasta.date() if fecha_hasta else None,
+        motorista_id=motorista_id or None,
+    )
+    partes = [
+        fecha_desde.isoformat() if fecha_desde else '',
+        fecha_hasta.isoformat() if fecha_hasta else '',
+        str(motorista_id or ''),
+        formato.upper(),
+        version['version'],
+        repr(sorted(versiones.sellos(COLECCIONES_REPORTE).items())),
+        *map(str, extra),
+    ]
+    clave = hashlib.sha256('|'.join(partes).encode('utf-8')).hexdigest()
+    return clave, version['total']
+
+
+def obtener(clave, formato):
+    """Ruta del reporte en caché o None. Un acierto lo marca como usado (LRU)."""
+    ruta = _ruta(clave, formato)
+    try:
+        os.utime(ruta)
+    except FileNotFoundError:
+        return None
+    return ruta
+
+
+def guardar(clave, formato, origen):
+    """Copia el archivo binario `origen` a la caché y retorna su ruta."""
+    ruta = _ruta(clave, formato)
+    with tempfile.NamedTemporaryFile(dir=_directorio(), delete=False) as temporal:
+        shutil.copyfileobj(origen, temporal)
+    os.replace(temporal.name, ruta)
+    _podar()
+    return ruta
+
+
+def guardar_al_transmitir(clave, formato, bloques):
+    """
+    Envuelve un generador de bloques de bytes: los reenvía tal cual y, solo si
+    se transmitieron completos, guarda el resultado en la caché.
+    """
+    with tempfile.NamedTemporaryFile(dir=_directorio(), delete=False) as temporal:
+        try:
+            for bloque in bloques:
+                temporal.write(bloque)
+                yield bloque
+        except BaseException:
+            temporal.close()
+            os.unlink(temporal.name)
+            raise
+    os.replace(temporal.name, _ruta(clave, formato))
+    _podar()
+
+
+def _podar():
+    """Elimina los archivos menos usados hasta quedar bajo el límite de tamaño."""
+    limite = settings.REPORTES_CACHE_MAX_BYTES
+    archivos = []
+    for entrada in os.scandir(_directorio()):
+        # Los temporales ('tmp...') son escrituras en curso
+        if entrada.is_file() and not entrada.name.startswith('tmp'):
+            estado = entrada.stat()
+            archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+
+    ocupado = sum(tamano for _, tamano, _ in archivos)
+    for _, tamano, ruta in sorted(archivos):
+        if ocupado <= limite:
+            break
+        try:
+            os.unlink(ruta)
+        except FileNotFoundError:
+            pass
+        ocupado -= tamano
@@ -0,0 +1,150 @@
+"""
+Carga masiva de despachos y cambios de estado en lote.
+
+bulk_create y update() no emiten post_save, así que al confirmar la
+transacción se hace en un solo paso lo que los signals harían fila a fila
+(ver estados_despacho.al_confirmar). Los cambios de estado siguen las reglas
+de la máquina de estados de estados_despacho.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Despacho, Farmacia, Motorista, DespachoEvento, ProductoPedido, TransicionDespacho
+from .estados_despacho import al_confirmar, cambios_de_transicion, es_valida
+from .estimacion_llegada import completar_estimaciones
+
+
+MAX_ITEMS = 500
+TAM_LOTE = 500
+
+
+def referencias_inexistentes(items):
+    """
+    Errores para farmacias o motoristas que no existen, con una consulta por
+    modelo. Retorna {índice del ítem: errores}, como ListSerializer.errors.
+    """
+    farmacias = set(Farmacia.objects.filter(
+        pk__in={item['farmacia_origen_id'] for item in items}
+    ).values_list('pk', flat=True))
+    motoristas = set(Motorista.objects.filter(
+        pk__in={item['motorista_asignado_id'] for item in items}
+    ).values_list('pk', flat=True))
+
+    errores = {}
+    for indice, item in enumerate(items):
+        error = {}
+        if item['farmacia_origen_id'] not in farmacias:
+            error['farmacia_origen_id'] = ['Farmacia no encontrada']
+        if item['motorista_asignado_id'] not in motoristas:
+            error['motorista_asignado_id'] = ['Motorista no encontrado']
+        if error:
+            errores[indice] = error
+    return errores
+
+
+def _insertar(despachos):
+    if connection.features.can_return_rows_from_bulk_insert:
+        Despacho.objects.bulk_create(despachos, batch_size=TAM_LOTE)
+        return
+    # MySQL no retorna los ids de un INSERT multi-fila; se inserta fila a fila
+    # dentro de la misma transacción y se lee LAST_INSERT_ID() (por conexión)
+    with connection.cursor() as cursor:
+        for despacho in despachos:
+            Despacho.objects.bulk_create([despacho])
+            cursor.execute('SELECT LAST_INSERT_ID()')
+            despacho.pk = cursor.fetchone()[0]
+
+
+def crear_despachos(items):
+    """
+    Inserta los despachos validados (dicts con campos de Despacho y una lista
+    opcional 'productos') y sus productos en una sola transacción.
+    """
+    despachos = []
+    productos_por_despacho = []
+    for item in items:
+        datos = dict(item)
+        productos_por_despacho.append(datos.pop('productos', None) or [])
+        despachos.append(Despacho(**datos))
+    # Un solo cálculo para todo el lote (el pre_save de signals.py no corre con bulk_create)
+    completar_estimaciones(despachos)
+
+    with transaction.atomic():
+        _insertar(despachos)
+        ProductoPedido.objects.bulk_create([
+            ProductoPedido(despacho=despacho, **producto)
+            for despacho, productos in zip(despachos, productos_por_despacho)
+            for producto in productos
+        ], batch_size=TAM_LOTE)
+        DespachoEvento.objects.bulk_create([
+            DespachoEvento.de_transicion(despacho.pk, None, despacho.estado, despacho.fecha_hora_creacion)
+            for despacho in despachos
+        ], batch_size=TAM_LOTE)
+        al_confirmar([despacho.pk for despacho in despachos], {timezone.localdate()})
+
+    return despachos
+
+
+def cambiar_estados(cambios, usuario=None):
+    """
+    Aplica transiciones [{'id', 'estado'}] con las reglas de la máquina de
+    estados; varios cambios del mismo despacho se encadenan. Los despachos se
+    bloquean en una consulta y se actualizan con un UPDATE por camino
+    (estado actual, estados recorridos), con una fila de TransicionDespacho y
+    otra de DespachoEvento por paso. Retorna un resultado por ítem, en el mismo orden.
+    """
+    resultados = []
+    with transaction.atomic():
+        despachos = Despacho.objects.select_for_update().only(
+            'identificador_unico', 'estado', 'fecha_hora_creacion'
+        ).in_bulk([cambio['id'] for cambio in cambios])
+
+        caminos = {}
+        for cambio in cambios:
+            despacho = despachos.get(cambio['id'])
+            if despacho is None:
+                resultados.append({'id': cambio['id'], 'ok': False, 'detail': 'Despacho no encontrado'})
+                continue
+            camino = caminos.get(despacho.pk, [])
+            actual = camino[-1] if camino else despacho.estado
+            if not es_valida(actual, cambio['estado']):
+                resultados.append({
+                    'id': despacho.pk, 'ok': False,
+                    'detail': f'Transición no válida: {actual} -> {cambio["estado"]}',
+                })
+                continue
+            caminos[despacho.pk] = camino + [cambio['estado']]
+            resultados.append({'id': despacho.pk, 'ok': True, 'estado': cambio['estado']})
+
+        grupos = {}
+        for pk, camino in caminos.items():
+            grupos.setdefault((despachos[pk].estado, tuple(camino)), []).append(pk)
+        ahora = timezone.now()
+        registro, eventos = [], []
+        for (actual, camino), ids in grupos.items():
+            columnas = {}
+            for estado in camino:
+                columnas.update(cambios_de_transicion(estado, ahora))
+            columnas['version'] = F('version') + len(camino)
+            Despacho.objects.filter(pk__in=ids, estado=actual).update(**columnas)
+            for pk in ids:
+                for paso, (anterior, nuevo) in enumerate(zip((actual,) + camino, camino)):
+                    registro.append(TransicionDespacho(
+                        despacho_id=pk, estado_anterior=anterior, estado_nuevo=nuevo, usuario=usuario, fecha_hora=ahora,
+                    ))
+                    # Un microsegundo por paso: conserva el orden y un camino que
+                    # vuelve a un estado (EN_RUTA -> INCIDENCIA -> EN_RUTA) no repite la clave
+                    eventos.append(DespachoEvento.de_transicion(
+                        pk, anterior, nuevo, ahora + timedelta(microseconds=paso)
+                    ))
+        TransicionDespacho.objects.bulk_create(registro, batch_size=TAM_LOTE)
+        DespachoEvento.objects.bulk_create(eventos, batch_size=TAM_LOTE)
+
+        if caminos:
+            fechas = {timezone.localdate(despachos[pk].fecha_hora_creacion) for pk in caminos}
+            al_confirmar(list(caminos), fechas)
+
+    return resultados
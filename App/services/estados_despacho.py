@@ -0,0 +1,121 @@
+"""
+Máquina de estados de Despacho.
+
+Todo cambio de estado (API, anulación desde las vistas, cambios en lote) pasa
+por aquí. En vez de leer, modificar y guardar la fila completa, cada cambio es
+un único UPDATE condicional:
+
+    UPDATE despacho SET estado=<nuevo>, version=version+1, <marcas de tiempo>
+    WHERE id=<pk> AND estado=<esperado> [AND version=<versión del cliente>]
+
+Si otro usuario cambió el despacho entre la lectura y la escritura, el UPDATE
+no afecta filas y se informa el conflicto en lugar de pisar su cambio. Cada
+cambio agrega una fila a TransicionDespacho (auditoría: usuario y motivo) y
+otra a DespachoEvento (analítica de tiempos) en la misma transacción.
+"""
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import Despacho, DespachoEvento, TransicionDespacho
+from . import busqueda, versiones
+from .cache_dashboard import invalidar_dashboards
+from .resumen_diario import recalcular_dia
+
+
+TRANSICIONES_VALIDAS = {
+    'PENDIENTE': ['EN_RUTA', 'ANULADO'],
+    'EN_RUTA': ['ENTREGADO', 'INCIDENCIA', 'ANULADO'],
+    'ENTREGADO': [],
+    'ANULADO': [],
+    'INCIDENCIA': ['EN_RUTA', 'ENTREGADO'],
+}
+
+# Campos que se fijan al entrar al estado, solo si aún están vacíos
+MARCAS_DE_TIEMPO = {
+    'EN_RUTA': ('fecha_hora_salida_farmacia', 'fecha_hora_despacho'),
+}
+
+
+class TransicionNoValida(ValueError):
+    """El cambio de estado no está permitido desde el estado actual."""
+
+
+class ConflictoDeVersion(TransicionNoValida):
+    """El despacho cambió (estado o versión) desde que el cliente lo leyó."""
+
+
+def es_valida(actual, nuevo):
+    return nuevo in TRANSICIONES_VALIDAS.get(actual, [])
+
+
+def cambios_de_transicion(nuevo, ahora, motivo=''):
+    """Columnas que escribe el UPDATE al pasar a `nuevo` (solo las que cambian)."""
+    cambios = {'estado': nuevo, 'version': F('version') + 1, 'fecha_actualizacion': ahora}
+    for campo in MARCAS_DE_TIEMPO.get(nuevo, ()):
+        cambios[campo] = Coalesce(F(campo), Value(ahora))
+    if nuevo == 'INCIDENCIA':
+        cambios['incidencia_fecha_hora'] = ahora
+        if motivo:
+            cambios['incidencia_motivo'] = motivo
+    return cambios
+
+
+def al_confirmar(ids, fechas=None):
+    """
+    Lo que harían los signals de post_save, que update()/bulk_create no emiten:
+    resumen diario de los días afectados (por defecto, los de creación de
+    `ids`), dashboards, índice de búsqueda y versión de la colección.
+    """
+    def actualizar():
+        dias = fechas
+        if dias is None:
+            dias = {
+                timezone.localdate(creacion)
+                for creacion in Despacho.objects.filter(pk__in=ids).values_list('fecha_hora_creacion', flat=True)
+            }
+        for fecha in sorted(dias):
+            recalcular_dia(fecha)
+        invalidar_dashboards()
+        busqueda.indexar('DESPACHO', Despacho.objects.filter(pk__in=ids))
+        versiones.incrementar('despacho')
+    transaction.on_commit(actualizar)
+
+
+def transicionar(pk, nuevo, usuario=None, desde=None, version=None, motivo=''):
+    """
+    Pasa el despacho `pk` al estado `nuevo` con un UPDATE condicional.
+
+    `desde` es el estado que el llamador leyó (si se omite se lee aquí) y
+    `version`, opcional, la versión que el cliente tiene. Lanza
+    TransicionNoValida si el cambio no está permitido y ConflictoDeVersion si
+    el despacho cambió entremedio. Retorna el estado anterior.
+    """
+    if desde is None:
+        desde = Despacho.objects.filter(pk=pk).values_list('estado', flat=True).first()
+        if desde is None:
+            raise TransicionNoValida('Despacho no encontrado')
+    if not es_valida(desde, nuevo):
+        raise TransicionNoValida(f'Transición no válida: {desde} -> {nuevo}')
+
+    ahora = timezone.now()
+    filtro = {'pk': pk, 'estado': desde}
+    if version is not None:
+        filtro['version'] = version
+
+    with transaction.atomic():
+        if not Despacho.objects.filter(**filtro).update(**cambios_de_transicion(nuevo, ahora, motivo)):
+            actual = Despacho.objects.filter(pk=pk).values_list('estado', 'version').first()
+            if actual is None:
+                raise TransicionNoValida('Despacho no encontrado')
+            raise ConflictoDeVersion(
+                f'El despacho fue modificado por otro usuario (estado {actual[0]}, versión {actual[1]})'
+            )
+        TransicionDespacho.objects.create(
+            despacho_id=pk, estado_anterior=desde, estado_nuevo=nuevo,
+            usuario=usuario, motivo=motivo, fecha_hora=ahora,
+        )
+        DespachoEvento.de_transicion(pk, desde, nuevo, ahora).save(force_insert=True)
+        al_confirmar([pk])
+    return desde
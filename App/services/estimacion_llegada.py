@@ -0,0 +1,151 @@
+"""
+Estimación de fecha_hora_estimada_llegada al crear despachos.
+
+Para cada despacho:
+
+    llegada = base + preparación + viaje
+
+- base: salida de farmacia si ya salió; si no, la creación (o ahora).
+- preparación (solo si aún no salió): mediana histórica creación -> salida
+  de la farmacia de origen.
+- viaje: con punto de entrega geocodificado, distancia haversine farmacia ->
+  entrega por FACTOR_RUTA, a la velocidad_promedio de la moto asignada al
+  motorista (VELOCIDAD_DEFECTO_KMH si no tiene), más MINUTOS_ENTREGA. Sin
+  punto de entrega, la mediana histórica salida -> entrega de la farmacia (o
+  la general).
+
+Las medianas salen de DespachoEvento (services/eventos_despacho.py) y se
+guardan en caché. Todo se calcula por lote: una consulta de farmacias, una de
+velocidades y, con NumPy instalado, las distancias y minutos en operaciones
+vectorizadas sobre arreglos; sin NumPy se usa el mismo cálculo en Python.
+"""
+import math
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..models import AsignacionMoto, Farmacia
+from .eventos_despacho import medianas_por_farmacia
+from .recomendacion_motoristas import RADIO_TIERRA_KM, distancia_km
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional
+    np = None
+
+NUMPY_DISPONIBLE = np is not None
+
+VELOCIDAD_DEFECTO_KMH = 25.0
+# Recorrido por calles respecto de la línea recta
+FACTOR_RUTA = 1.3
+MINUTOS_ENTREGA = 5.0
+DIAS_HISTORIA = 90
+MIN_MUESTRAS = 5
+CLAVE_HISTORIA = 'estimacion_llegada:medianas'
+TTL_HISTORIA = 3600
+
+
+def medianas_historicas():
+    """medianas_por_farmacia de los últimos DIAS_HISTORIA días, en caché por TTL_HISTORIA segundos."""
+    medianas = cache.get(CLAVE_HISTORIA)
+    if medianas is None:
+        medianas = medianas_por_farmacia(timezone.now() - timedelta(days=DIAS_HISTORIA), MIN_MUESTRAS)
+        cache.set(CLAVE_HISTORIA, medianas, TTL_HISTORIA)
+    return medianas
+
+
+def _velocidades(motorista_ids):
+    """{motorista_id: km/h} de la moto activa de cada motorista que la tenga informada."""
+    return {
+        motorista_id: float(velocidad)
+        for motorista_id, velocidad in AsignacionMoto.objects.filter(
+            activa=True, motorista_id__in=motorista_ids, moto__velocidad_promedio__gt=0,
+        ).values_list('motorista_id', 'moto__velocidad_promedio')
+    }
+
+
+def _nan(valor):
+    return math.nan if valor is None else float(valor)
+
+
+def _mediana(de_farmacia, generales, tramo):
+    """Mediana del tramo de la farmacia o, si no tiene (None), la general; 0 minutos es un valor válido."""
+    valor = de_farmacia.get(tramo)
+    return generales.get(tramo) if valor is None else valor
+
+
+def _minutos_numpy(origenes, destinos, velocidades, viaje_historico, preparacion):
+    origen = np.radians(np.array(origenes, dtype=float).reshape(-1, 2))
+    destino = np.radians(np.array(destinos, dtype=float).reshape(-1, 2))
+    lat1, lon1 = origen[:, 0], origen[:, 1]
+    lat2, lon2 = destino[:, 0], destino[:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    km = 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(a))
+    viaje = km * FACTOR_RUTA / np.array(velocidades, dtype=float) * 60 + MINUTOS_ENTREGA
+    viaje = np.where(np.isnan(viaje), np.array(viaje_historico, dtype=float), viaje)
+    minutos = viaje + np.array(preparacion, dtype=float)
+    return [None if math.isnan(valor) else valor for valor in minutos.tolist()]
+
+
+def _minutos_python(origenes, destinos, velocidades, viaje_historico, preparacion):
+    minutos = []
+    for origen, destino, velocidad, historico, previo in zip(
+        origenes, destinos, velocidades, viaje_historico, preparacion
+    ):
+        if any(map(math.isnan, origen + destino)):
+            viaje = historico
+        else:
+            viaje = distancia_km(*origen, *destino) * FACTOR_RUTA / velocidad * 60 + MINUTOS_ENTREGA
+        total = viaje + previo
+        minutos.append(None if math.isnan(total) else total)
+    return minutos
+
+
+def estimar_llegadas(despachos):
+    """
+    Fecha estimada de llegada de cada despacho (instancias, guardadas o no),
+    en el mismo orden; None si no hay distancia ni historia para estimar.
+    """
+    if not despachos:
+        return []
+    coordenadas = {
+        pk: (float(latitud), float(longitud))
+        for pk, latitud, longitud in Farmacia.objects.filter(
+            pk__in={despacho.farmacia_origen_id for despacho in despachos}
+        ).values_list('pk', 'latitud', 'longitud')
+    }
+    velocidades = _velocidades({despacho.motorista_asignado_id for despacho in despachos})
+    medianas = medianas_historicas()
+    generales = medianas.get(None, {})
+    ahora = timezone.now()
+
+    origenes, destinos, kmh, viaje_historico, preparacion, bases = [], [], [], [], [], []
+    for despacho in despachos:
+        de_farmacia = medianas.get(despacho.farmacia_origen_id, {})
+        origenes.append(coordenadas.get(despacho.farmacia_origen_id, (math.nan, math.nan)))
+        destinos.append((_nan(despacho.latitud_entrega), _nan(despacho.longitud_entrega)))
+        kmh.append(velocidades.get(despacho.motorista_asignado_id, VELOCIDAD_DEFECTO_KMH))
+        viaje_historico.append(_nan(_mediana(de_farmacia, generales, 'en_ruta')))
+        if despacho.fecha_hora_salida_farmacia:
+            bases.append(despacho.fecha_hora_salida_farmacia)
+            preparacion.append(0.0)
+        else:
+            bases.append(despacho.fecha_hora_creacion or ahora)
+            hasta_salida = _mediana(de_farmacia, generales, 'hasta_salida')
+            preparacion.append(0.0 if hasta_salida is None else float(hasta_salida))
+
+    calcular = _minutos_numpy if NUMPY_DISPONIBLE else _minutos_python
+    minutos = calcular(origenes, destinos, kmh, viaje_historico, preparacion)
+    return [
+        None if valor is None else base + timedelta(minutes=round(valor))
+        for base, valor in zip(bases, minutos)
+    ]
+
+
+def completar_estimaciones(despachos):
+    """Fija fecha_hora_estimada_llegada en los despachos que no la traen (sin guardar)."""
+    pendientes = [despacho for despacho in despachos if despacho.fecha_hora_estimada_llegada is None]
+    for despacho, llegada in zip(pendientes, estimar_llegadas(pendientes)):
+        despacho.fecha_hora_estimada_llegada = llegada
+    return pendientes
@@ -0,0 +1,244 @@
+"""
+Eventos de despacho (DespachoEvento): analítica de tiempos y mantenimiento.
+
+Los eventos se escriben en la misma transacción que cada creación o cambio de
+estado (estados_despacho, despachos_masivos y signals.py). Los tiempos de
+entrega se calculan solo con esta tabla, sin leer ni bloquear Despacho.
+
+En MySQL la tabla está particionada por mes de fecha_hora (UTC, migración
+0012): los meses siguientes se agregan partiendo pmax y un mes completo se
+descarta con DROP PARTITION, sin DELETE fila a fila. En otros motores se borra
+por rango de fechas.
+"""
+import csv
+import gzip
+import os
+from datetime import date, datetime, time, timezone as dt_timezone
+from statistics import median
+
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from ..models import Despacho, DespachoEvento
+
+
+TABLA = DespachoEvento._meta.db_table
+CREADO = DespachoEvento.SIN_ESTADO
+EN_RUTA = DespachoEvento.CODIGOS['EN_RUTA']
+ENTREGADO = DespachoEvento.CODIGOS['ENTREGADO']
+INCIDENCIA = DespachoEvento.CODIGOS['INCIDENCIA']
+
+
+def _minutos(inicio, fin):
+    return (fin - inicio).total_seconds() / 60
+
+
+def _resumen(valores):
+    if not valores:
+        return {'cantidad': 0, 'promedio': None, 'mediana': None, 'p90': None}
+    ordenados = sorted(valores)
+    return {
+        'cantidad': len(ordenados),
+        'promedio': round(sum(ordenados) / len(ordenados), 1),
+        'mediana': round(median(ordenados), 1),
+        'p90': round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.9))], 1),
+    }
+
+
+def _marcas(filas):
+    """
+    {despacho_id: {código: primer fecha_hora}} desde filas agrupadas por
+    (despacho_id, estado, estado_anterior) con el mínimo en 'primero'. La
+    creación (evento sin estado anterior) marca CREADO y también su estado:
+    un despacho creado ya ENTREGADO tiene entrega en la creación.
+    """
+    por_despacho = {}
+    for fila in filas:
+        marcas = por_despacho.setdefault(fila['despacho_id'], {})
+        claves = (fila['estado'],)
+        if fila['estado_anterior'] == CREADO:
+            claves = (CREADO, fila['estado'])
+        for clave in claves:
+            if clave not in marcas or fila['primero'] < marcas[clave]:
+                marcas[clave] = fila['primero']
+    return por_despacho
+
+
+def tiempos_entrega(desde, hasta):
+    """
+    Tiempos (minutos) de los despachos entregados en [desde, hasta):
+    creación -> entrega, creación -> salida y salida -> entrega, más cuántos
+    pasaron por incidencia. Se usa el primer evento de cada estado.
+    """
+    entregados = DespachoEvento.objects.filter(
+        estado=ENTREGADO, fecha_hora__gte=desde, fecha_hora__lt=hasta
+    ).order_by().values('despacho_id')
+    por_despacho = _marcas(DespachoEvento.objects.filter(
+        despacho_id__in=entregados
+    ).order_by().values('despacho_id', 'estado', 'estado_anterior').annotate(primero=Min('fecha_hora')))
+
+    total, hasta_salida, en_ruta = [], [], []
+    con_incidencia = 0
+    for marcas in por_despacho.values():
+        creado, salida, entrega = marcas.get(CREADO), marcas.get(EN_RUTA), marcas.get(ENTREGADO)
+        if creado and entrega:
+            total.append(_minutos(creado, entrega))
+        if creado and salida:
+            hasta_salida.append(_minutos(creado, salida))
+        if salida and entrega:
+            en_ruta.append(_minutos(salida, entrega))
+        if INCIDENCIA in marcas:
+            con_incidencia += 1
+    return {
+        'entregados': len(por_despacho),
+        'con_incidencia': con_incidencia,
+        'total': _resumen(total),
+        'hasta_salida': _resumen(hasta_salida),
+        'en_ruta': _resumen(en_ruta),
+    }
+
+
+def medianas_por_farmacia(desde, min_muestras=1):
+    """
+    Mediana (minutos) de creación -> salida y salida -> entrega de los
+    despachos entregados desde `desde`, por farmacia de origen:
+    {farmacia_id: {'hasta_salida', 'en_ruta'}}; la clave None agrupa todas.
+    Un tramo con menos de `min_muestras` entregas queda en None. Los eventos
+    de despachos eliminados no cuentan (el JOIN con Despacho los descarta).
+    """
+    entregados = DespachoEvento.objects.filter(estado=ENTREGADO, fecha_hora__gte=desde).order_by().values('despacho_id')
+    filas = list(DespachoEvento.objects.filter(despacho_id__in=entregados).order_by().values(
+        'despacho_id', 'despacho__farmacia_origen_id', 'estado', 'estado_anterior'
+    ).annotate(primero=Min('fecha_hora')))
+    farmacia_de = {fila['despacho_id']: fila['despacho__farmacia_origen_id'] for fila in filas}
+
+    muestras = {}
+    for despacho_id, marcas in _marcas(filas).items():
+        creado, salida, entrega = marcas.get(CREADO), marcas.get(EN_RUTA), marcas.get(ENTREGADO)
+        for clave in (farmacia_de[despacho_id], None):
+            grupo = muestras.setdefault(clave, {'hasta_salida': [], 'en_ruta': []})
+            if creado and salida:
+                grupo['hasta_salida'].append(_minutos(creado, salida))
+            if salida and entrega:
+                grupo['en_ruta'].append(_minutos(salida, entrega))
+    return {
+        clave: {
+            tramo: median(valores) if len(valores) >= min_muestras else None
+            for tramo, valores in grupo.items()
+        }
+        for clave, grupo in muestras.items()
+    }
+
+
+# --- Mantenimiento ---
+
+def inicio_mes(fecha):
+    return fecha.replace(day=1)
+
+
+def mes_siguiente(mes):
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def _limite(mes):
+    # Los límites de partición son en UTC, igual que fecha_hora en la base de datos
+    return datetime.combine(mes, time.min, tzinfo=dt_timezone.utc)
+
+
+def particiones():
+    """{nombre: descripción del límite} de la tabla; vacío si no está particionada (o no es MySQL)."""
+    if connection.vendor != 'mysql':
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+            [TABLA],
+        )
+        return dict(cursor.fetchall())
+
+
+def nombre_particion(mes):
+    return f'p{mes:%Y%m}'
+
+
+def asegurar_particiones(hasta_mes):
+    """Crea las particiones mensuales que falten hasta `hasta_mes` inclusive. Retorna sus nombres."""
+    existentes = particiones()
+    if 'pmax' not in existentes:
+        return []
+    mes = inicio_mes(timezone.now().date())
+    nuevas = []
+    while mes <= hasta_mes:
+        if nombre_particion(mes) not in existentes:
+            nuevas.append(mes)
+        mes = mes_siguiente(mes)
+    if not nuevas:
+        return []
+    definiciones = [
+        f"PARTITION {nombre_particion(mes)} VALUES LESS THAN (TO_DAYS('{mes_siguiente(mes):%Y-%m-%d}'))"
+        for mes in nuevas
+    ] + ['PARTITION pmax VALUES LESS THAN MAXVALUE']
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLA} REORGANIZE PARTITION pmax INTO ({', '.join(definiciones)})")
+    return [nombre_particion(mes) for mes in nuevas]
+
+
+def eventos_del_mes(mes):
+    return DespachoEvento.objects.filter(
+        fecha_hora__gte=_limite(mes), fecha_hora__lt=_limite(mes_siguiente(mes))
+    ).order_by()
+
+
+def archivar_mes(mes, directorio):
+    """Escribe los eventos del mes en <directorio>/eventos_despacho_AAAA-MM.csv.gz. Retorna (ruta, filas)."""
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f'eventos_despacho_{mes:%Y-%m}.csv.gz')
+    filas = 0
+    with gzip.open(ruta, 'wt', newline='', encoding='utf-8') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(['despacho_id', 'fecha_hora', 'estado', 'estado_anterior'])
+        for fila in eventos_del_mes(mes).values_list(
+            'despacho_id', 'fecha_hora', 'estado', 'estado_anterior'
+        ).iterator(chunk_size=5000):
+            escritor.writerow([fila[0], fila[1].isoformat(), fila[2], fila[3]])
+            filas += 1
+    return ruta, filas
+
+
+def descartar_mes(mes):
+    """Elimina los eventos del mes: DROP PARTITION si el mes tiene partición propia, si no DELETE por rango."""
+    nombre = nombre_particion(mes)
+    if nombre in particiones():
+        filas = eventos_del_mes(mes).count()
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {TABLA} DROP PARTITION {nombre}')
+        return filas
+    with transaction.atomic():
+        filas, _ = eventos_del_mes(mes).delete()
+    return filas
+
+
+def meses_anteriores(limite):
+    """Meses con eventos anteriores a `limite` (primer día de un mes), del más antiguo al más reciente."""
+    primero = DespachoEvento.objects.filter(fecha_hora__lt=_limite(limite)).order_by('fecha_hora').values_list(
+        'fecha_hora', flat=True
+    ).first()
+    if primero is None:
+        return []
+    mes = inicio_mes(primero.astimezone(dt_timezone.utc).date())
+    meses = []
+    while mes < limite:
+        meses.append(mes)
+        mes = mes_siguiente(mes)
+    return meses
+
+
+def eliminar_huerfanos():
+    """Eventos de despachos que ya no existen (la FK no tiene restricción ni borrado en cascada)."""
+    with transaction.atomic():
+        filas, _ = DespachoEvento.objects.exclude(
+            despacho_id__in=Despacho.objects.values('identificador_unico')
+        ).delete()
+    return filas
@@ -0,0 +1,153 @@
+"""
+Exportación tipada de reportes de despachos: XLSX y Parquet.
+
+Ambos formatos se construyen por lotes desde las filas proyectadas de
+reportes.iterar_despachos, conservando tipos (enteros, fechas, booleanos).
+El XLSX se escribe con openpyxl en modo write_only; Parquet requiere
+pyarrow y solo se ofrece si está instalado.
+"""
+from datetime import datetime
+
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font
+
+from .reportes import (
+    ENCABEZADO_CSV, ESTADOS_LABEL, MOVIMIENTOS_LABEL, TAM_LOTE,
+    iterar_despachos, nombre_motorista, tiempo_entrega_minutos,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional
+    pa = pq = None
+
+PARQUET_DISPONIBLE = pa is not None
+
+
+def fila_tipada(fila):
+    """Valores de una fila en el orden de ENCABEZADO_CSV, con sus tipos nativos."""
+    return (
+        fila.identificador_unico,
+        MOVIMIENTOS_LABEL.get(fila.tipo_movimiento, fila.tipo_movimiento),
+        fila.farmacia_origen__nombre or '',
+        nombre_motorista(fila),
+        ESTADOS_LABEL.get(fila.estado, fila.estado),
+        fila.fecha_hora_creacion,
+        fila.fecha_hora_toma_pedido,
+        fila.fecha_hora_salida_farmacia,
+        fila.fecha_hora_estimada_llegada,
+        tiempo_entrega_minutos(fila),
+        fila.direccion_entrega,
+        fila.tipo_movimiento == 'CON_RECETA',
+    )
+
+
+# ============================================
+# XLSX
+# ============================================
+
+_FORMATO_FECHA_XLSX = 'yyyy-mm-dd hh:mm'
+
+
+def _celdas_xlsx(hoja, valores):
+    """Celdas de una fila: texto sin caracteres de control y fechas locales sin zona (Excel no las admite)."""
+    celdas = []
+    for valor in valores:
+        if isinstance(valor, datetime):
+            if timezone.is_aware(valor):
+                valor = timezone.localtime(valor).replace(tzinfo=None)
+            celda = WriteOnlyCell(hoja, valor)
+            celda.number_format = _FORMATO_FECHA_XLSX
+            valor = celda
+        elif isinstance(valor, str):
+            valor = ILLEGAL_CHARACTERS_RE.sub('', valor)
+        celdas.append(valor)
+    return celdas
+
+
+def generar_xlsx(destino, queryset):
+    """
+    Escribe el reporte como libro XLSX de una hoja en `destino` (ruta o
+    archivo binario) y retorna la cantidad de despachos. El libro es
+    write_only de openpyxl: las filas se escriben a medida que se recorren,
+    sin mantenerlas en memoria.
+    """
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('Despachos')
+    hoja.freeze_panes = 'A2'
+
+    negrita = Font(bold=True)
+    encabezado = []
+    for columna in ENCABEZADO_CSV:
+        celda = WriteOnlyCell(hoja, columna)
+        celda.font = negrita
+        encabezado.append(celda)
+    hoja.append(encabezado)
+
+    total = 0
+    for fila in iterar_despachos(queryset):
+        hoja.append(_celdas_xlsx(hoja, fila_tipada(fila)))
+        total += 1
+
+    libro.save(destino)
+    return total
+
+
+# ============================================
+# PARQUET
+# ============================================
+
+def _esquema_parquet():
+    fecha = pa.timestamp('us', tz='UTC')
+    return pa.schema([
+        ('id_despacho', pa.int64()),
+        ('tipo_movimiento', pa.string()),
+        ('farmacia', pa.string()),
+        ('motorista', pa.string()),
+        ('estado', pa.string()),
+        ('fecha_creacion', fecha),
+        ('fecha_toma_pedido', fecha),
+        ('fecha_salida_farmacia', fecha),
+        ('fecha_estimada_llegada', fecha),
+        ('tiempo_entrega_min', pa.int32()),
+        ('direccion_entrega', pa.string()),
+        ('requiere_receta', pa.bool_()),
+    ])
+
+
+def generar_parquet(destino, queryset, tam_lote=TAM_LOTE):
+    """
+    Escribe el reporte en Parquet (zstd) en `destino`, un row group por lote
+    de `tam_lote` filas, y retorna la cantidad de despachos.
+    Requiere pyarrow (ver PARQUET_DISPONIBLE).
+    """
+    if not PARQUET_DISPONIBLE:
+        raise RuntimeError("La exportación Parquet requiere pyarrow.")
+
+    esquema = _esquema_parquet()
+    total = 0
+    lote = []
+
+    def escribir_lote(writer):
+        columnas = list(zip(*lote))
+        writer.write_batch(pa.RecordBatch.from_arrays(
+            [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+            schema=esquema
+        ))
+
+    with pq.ParquetWriter(destino, esquema, compression='zstd') as writer:
+        for fila in iterar_despachos(queryset, tam_lote=tam_lote):
+            lote.append(fila_tipada(fila))
+            if len(lote) == tam_lote:
+                escribir_lote(writer)
+                total += len(lote)
+                lote = []
+        if lote:
+            escribir_lote(writer)
+            total += len(lote)
+
+    return total
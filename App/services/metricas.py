@@ -0,0 +1,146 @@
+"""
+Servicio de métricas para los dashboards.
+
+Las métricas de despachos se leen desde ResumenDiarioDespacho mediante
+agregación condicional, de modo que el costo no depende de cuántos despachos
+existan. El resumen se mantiene en services/resumen_diario.py.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import Motorista, Moto, Farmacia, Region, ResumenDiarioDespacho
+
+
+# Duración de entrega: llegada estimada - hora de despacho
+DURACION_ENTREGA = ExpressionWrapper(
+    F('fecha_hora_estimada_llegada') - F('fecha_hora_despacho'),
+    output_field=DurationField()
+)
+
+
+def _resumen_filtrado(fecha_desde=None, fecha_hasta=None, motorista_id=None):
+    resumen = ResumenDiarioDespacho.objects.order_by()
+    if fecha_desde:
+        resumen = resumen.filter(fecha__gte=fecha_desde)
+    if fecha_hasta:
+        resumen = resumen.filter(fecha__lte=fecha_hasta)
+    if motorista_id:
+        resumen = resumen.filter(motorista_id=motorista_id)
+    return resumen
+
+
+def _suma(filtro=None):
+    return Coalesce(Sum('cantidad', filter=filtro), 0)
+
+
+def metricas_despachos():
+    """
+    Conteos por estado, despachos de los últimos 7 días y tiempo promedio
+    de entrega, leídos desde el resumen diario en una sola consulta.
+    El resumen es por día, así que "últimos 7 días" son 7 días calendario
+    (hoy y los 6 anteriores) y no las últimas 168 horas.
+    """
+    hace_7_dias = timezone.localdate() - timedelta(days=6)
+    entregados = Q(estado='ENTREGADO')
+
+    resultado = _resumen_filtrado().aggregate(
+        total_despachos=_suma(),
+        despachos_pendientes=_suma(Q(estado='PENDIENTE')),
+        despachos_en_ruta=_suma(Q(estado='EN_RUTA')),
+        despachos_entregados=_suma(entregados),
+        despachos_incidencias=_suma(Q(estado='INCIDENCIA')),
+        despachos_recientes=_suma(Q(fecha__gte=hace_7_dias)),
+        segundos_entrega=Coalesce(Sum('duracion_total_segundos', filter=entregados), 0),
+        entregas_con_tiempo=Coalesce(Sum('entregas_con_tiempo', filter=entregados), 0),
+    )
+
+    segundos = resultado.pop('segundos_entrega')
+    entregas = resultado.pop('entregas_con_tiempo')
+    resultado['tiempo_promedio'] = int(segundos // entregas // 60) if entregas else 0
+    return resultado
+
+
+def resumen_por_estado(fecha_desde=None, fecha_hasta=None, motorista_id=None):
+    """
+    Total y conteos por estado para un rango de días (fechas locales) y
+    opcionalmente un motorista. Usado por la vista de reportes.
+    """
+    return _resumen_filtrado(fecha_desde, fecha_hasta, motorista_id).aggregate(
+        total=_suma(),
+        pendientes=_suma(Q(estado='PENDIENTE')),
+        en_ruta=_suma(Q(estado='EN_RUTA')),
+        entregados=_suma(Q(estado='ENTREGADO')),
+        con_incidencia=_suma(Q(estado='INCIDENCIA')),
+    )
+
+
+def version_resumen(fecha_desde=None, fecha_hasta=None, motorista_id=None):
+    """
+    Sello de versión de los datos de un rango de días: (mayor id, filas, total)
+    de ResumenDiarioDespacho. Cada recálculo de un día borra e inserta sus filas
+    con ids nuevos, por lo que cualquier cambio en los despachos del rango
+    altera el sello. Retorna {'version': str, 'total': int}.
+    """
+    datos = _resumen_filtrado(fecha_desde, fecha_hasta, motorista_id).aggregate(
+        ultimo_id=Max('id'),
+        filas=Count('id'),
+        total=_suma(),
+    )
+    return {
+        'version': f"{datos['ultimo_id'] or 0}-{datos['filas']}",
+        'total': datos['total'],
+    }
+
+
+def metricas_recursos():
+    """
+    Conteos de motoristas, motos y farmacias (una consulta agregada por tabla).
+    """
+    motoristas = Motorista.objects.order_by().aggregate(
+        motoristas_total=Count('identificador_unico'),
+        motoristas_activos=Count('identificador_unico', filter=Q(licencia_vigente=True)),
+    )
+    motos = Moto.objects.order_by().aggregate(
+        motos_total=Count('identificador_unico'),
+        motos_disponibles=Count('identificador_unico', filter=Q(estado='OPERATIVO')),
+    )
+    farmacias = Farmacia.objects.order_by().aggregate(
+        farmacias_total=Count('identificador_unico'),
+    )
+    return {**motoristas, **motos, **farmacias}
+
+
+def metricas_regionales():
+    """
+    Contexto del dashboard regional: despachos por región, por estado y
+    top 10 de motoristas, todo desde el resumen diario.
+    """
+    # Una farmacia con varias regiones suma en cada una de ellas
+    despachos_por_region = Region.objects.values(region=F('nombre')).annotate(
+        total=Coalesce(Sum('farmacias__resumenes_diarios__cantidad'), 0)
+    ).order_by('-total', 'region')
+
+    despachos_por_estado = _resumen_filtrado().values('estado').annotate(
+        total=Sum('cantidad')
+    ).order_by('-total')
+
+    motoristas_rendimiento = Motorista.objects.annotate(
+        total_despachos=Coalesce(Sum('resumenes_diarios__cantidad'), 0)
+    ).order_by('-total_despachos')[:10]
+
+    # Listas ya evaluadas para poder guardarlas en caché
+    return {
+        'despachos_por_region': list(despachos_por_region),
+        'despachos_por_estado': list(despachos_por_estado),
+        'motoristas_rendimiento': list(motoristas_rendimiento),
+    }
+
+
+def metricas_generales():
+    """
+    Contexto completo del dashboard general.
+    """
+    return {**metricas_despachos(), **metricas_recursos()}
@@ -0,0 +1,111 @@
+"""
+Paginación por keyset (cursor) para listados ordenados por fecha de creación.
+
+En lugar de OFFSET, cada página se pide relativa a la última fila vista
+(fecha_hora_creacion, identificador_unico), por lo que cualquier página
+cuesta lo mismo que la primera. El total se calcula con COUNT solo cuando
+no está en caché (ver conteo_cacheado).
+"""
+import base64
+import hashlib
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+CONTEO_TTL = 60
+
+
+def codificar_cursor(fecha, pk):
+    valor = f"{fecha.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(valor.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """Retorna (fecha, pk) o lanza ValueError si el cursor no es válido."""
+    try:
+        valor = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        fecha_texto, pk = valor.rsplit('|', 1)
+        fecha = parse_datetime(fecha_texto)
+        pk = int(pk)
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError(f"Cursor inválido: {cursor}") from exc
+    if fecha is None:
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return fecha, pk
+
+
+@dataclass
+class PaginaKeyset:
+    object_list: list = field(default_factory=list)
+    cursor_siguiente: str = None
+    cursor_anterior: str = None
+
+    @property
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginar_keyset(queryset, cursor=None, anterior=False, tam_pagina=20,
+                   campo_fecha='fecha_hora_creacion', campo_pk='identificador_unico'):
+    """
+    Página de `queryset` en orden (campo_fecha, campo_pk) descendente.
+    Sin cursor retorna la primera página; con `anterior=True` retorna la
+    página previa al cursor. Lanza ValueError si el cursor no es válido.
+    """
+    orden = (f'-{campo_fecha}', f'-{campo_pk}')
+    if cursor:
+        fecha, pk = decodificar_cursor(cursor)
+        if anterior:
+            queryset = queryset.filter(
+                Q(**{f'{campo_fecha}__gt': fecha}) | Q(**{campo_fecha: fecha, f'{campo_pk}__gt': pk})
+            )
+            orden = (campo_fecha, campo_pk)
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{campo_fecha}__lt': fecha}) | Q(**{campo_fecha: fecha, f'{campo_pk}__lt': pk})
+            )
+
+    filas = list(queryset.order_by(*orden)[:tam_pagina + 1])
+    hay_mas = len(filas) > tam_pagina
+    filas = filas[:tam_pagina]
+    if anterior and cursor:
+        filas.reverse()
+
+    def cursor_de(fila):
+        return codificar_cursor(getattr(fila, campo_fecha), getattr(fila, campo_pk))
+
+    pagina = PaginaKeyset(object_list=filas)
+    if filas:
+        # Hacia atrás, "hay más" significa que existen páginas anteriores
+        if (anterior and cursor and hay_mas) or (cursor and not anterior):
+            pagina.cursor_anterior = cursor_de(filas[0])
+        if (not anterior and hay_mas) or (anterior and cursor):
+            pagina.cursor_siguiente = cursor_de(filas[-1])
+    return pagina
+
+
+def conteo_cacheado(queryset, ttl=CONTEO_TTL):
+    """
+    COUNT(*) del queryset guardado en caché por `ttl` segundos, con la
+    consulta SQL como clave. El valor puede quedar atrasado hasta `ttl`.
+    """
+    sql = str(queryset.order_by().query)
+    clave = 'conteo:' + hashlib.md5(sql.encode('utf-8')).hexdigest()
+    total = cache.get(clave)
+    if total is None:
+        total = queryset.count()
+        cache.set(clave, total, ttl)
+    return total
@@ -0,0 +1,166 @@
+"""
+Recomendación de motoristas para un despacho según distancia y carga.
+
+La ubicación de un motorista es la de la farmacia a la que está asignado
+(AsignacionFarmacia activa). Las farmacias con motoristas disponibles se
+guardan en una grilla en memoria (celdas de TAM_CELDA_GRADOS); para una
+farmacia de origen se recorren anillos de celdas hacia afuera y se corta
+cuando ningún candidato más lejano puede mejorar el ranking. Cada motorista
+lleva además su cantidad de despachos abiertos.
+
+El índice y las cargas viven en el proceso y se reconstruyen solo cuando
+cambian los sellos de services/versiones.py (farmacias, asignaciones,
+motoristas para el índice; despachos para las cargas): una consulta chica por
+llamada y el ranking se hace en memoria.
+"""
+import math
+import threading
+
+from django.db.models import Count
+
+from ..models import AsignacionFarmacia, Despacho, Farmacia
+from . import versiones
+
+
+TAM_CELDA_GRADOS = 0.05  # ~5,5 km de latitud
+RADIO_MAX_KM = 50
+# Cada despacho abierto pesa como esta distancia adicional en el ranking
+KM_POR_DESPACHO_ABIERTO = 2.0
+ESTADOS_ABIERTOS = ('PENDIENTE', 'EN_RUTA', 'INCIDENCIA')
+DISPONIBILIDAD_RECOMENDABLE = ('DISPONIBLE', 'ASIGNADO', 'EN_DESPACHO')
+RADIO_TIERRA_KM = 6371.0
+
+COLECCIONES_INDICE = ('farmacia', 'asignacion', 'motorista')
+COLECCIONES_CARGA = ('despacho',)
+
+_bloqueo = threading.Lock()
+_indice = None
+_cargas = None
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distancia haversine entre dos puntos (grados)."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(a))
+
+
+def _celda(lat, lon):
+    return math.floor(lat / TAM_CELDA_GRADOS), math.floor(lon / TAM_CELDA_GRADOS)
+
+
+class _Indice:
+    """Grilla de farmacias con motoristas recomendables; inmutable una vez construida."""
+
+    def __init__(self, sello):
+        self.sello = sello
+        self.coordenadas = {
+            pk: (float(latitud), float(longitud))
+            for pk, latitud, longitud in Farmacia.objects.values_list('pk', 'latitud', 'longitud')
+        }
+        self.motoristas = {}  # farmacia_id -> [(motorista_id, nombre, rut)]
+        for farmacia_id, motorista_id, nombre, rut in AsignacionFarmacia.objects.filter(
+            activa=True, motorista__activo=True, motorista__disponibilidad__in=DISPONIBILIDAD_RECOMENDABLE,
+        ).values_list('farmacia_id', 'motorista_id', 'motorista__nombre_visible', 'motorista__rut'):
+            self.motoristas.setdefault(farmacia_id, []).append((motorista_id, nombre, rut))
+        self.celdas = {}
+        for farmacia_id in self.motoristas:
+            self.celdas.setdefault(_celda(*self.coordenadas[farmacia_id]), []).append(farmacia_id)
+
+    def anillo(self, centro, radio):
+        """Farmacias de las celdas a distancia Chebyshev exactamente `radio` de `centro`."""
+        fila, columna = centro
+        if radio == 0:
+            yield from self.celdas.get(centro, ())
+            return
+        for desplazamiento in range(-radio, radio + 1):
+            for celda in (
+                (fila - radio, columna + desplazamiento), (fila + radio, columna + desplazamiento),
+            ):
+                yield from self.celdas.get(celda, ())
+        for desplazamiento in range(-radio + 1, radio):
+            for celda in (
+                (fila + desplazamiento, columna - radio), (fila + desplazamiento, columna + radio),
+            ):
+                yield from self.celdas.get(celda, ())
+
+
+def _cargas_abiertas():
+    return dict(
+        Despacho.objects.filter(estado__in=ESTADOS_ABIERTOS).order_by().values_list(
+            'motorista_asignado_id'
+        ).annotate(abiertos=Count('identificador_unico'))
+    )
+
+
+def _estado():
+    """(índice, cargas) vigentes; se reconstruyen si cambió algún sello."""
+    global _indice, _cargas
+    actuales = versiones.sellos(COLECCIONES_INDICE + COLECCIONES_CARGA)
+    sello_indice = tuple(actuales[nombre] for nombre in COLECCIONES_INDICE)
+    sello_carga = tuple(actuales[nombre] for nombre in COLECCIONES_CARGA)
+    indice, cargas = _indice, _cargas
+    if indice is None or indice.sello != sello_indice or cargas is None or cargas[0] != sello_carga:
+        with _bloqueo:
+            if _indice is None or _indice.sello != sello_indice:
+                _indice = _Indice(sello_indice)
+            if _cargas is None or _cargas[0] != sello_carga:
+                _cargas = (sello_carga, _cargas_abiertas())
+            indice, cargas = _indice, _cargas
+    return indice, cargas[1]
+
+
+def invalidar():
+    """Descarta el índice y las cargas del proceso (la próxima llamada los reconstruye)."""
+    global _indice, _cargas
+    with _bloqueo:
+        _indice = _cargas = None
+
+
+def recomendar(farmacia_id, limite=10, radio_km=RADIO_MAX_KM):
+    """
+    Motoristas para un despacho desde `farmacia_id`, del mejor al peor:
+    [{'motorista_id', 'nombre', 'rut', 'farmacia_id', 'distancia_km', 'despachos_abiertos', 'puntaje'}].
+    El puntaje es la distancia más KM_POR_DESPACHO_ABIERTO por despacho abierto.
+    Lanza Farmacia.DoesNotExist si la farmacia no existe.
+    """
+    indice, cargas = _estado()
+    if limite <= 0:
+        return []
+    if farmacia_id in indice.coordenadas:
+        lat, lon = indice.coordenadas[farmacia_id]
+    else:
+        # Creada en una transacción aún sin confirmar: el sello todavía no cambió
+        lat, lon = map(float, Farmacia.objects.values_list('latitud', 'longitud').get(pk=farmacia_id))
+    centro = _celda(lat, lon)
+    # Un anillo r está al menos (r - 1) celdas más lejos. El lado más corto de
+    # una celda es el de longitud en la latitud más alejada del ecuador que cubre la búsqueda
+    km_por_grado = math.pi / 180 * RADIO_TIERRA_KM
+    latitud_extrema = min(abs(lat) + radio_km / km_por_grado + TAM_CELDA_GRADOS, 89.9)
+    km_por_celda = TAM_CELDA_GRADOS * km_por_grado * math.cos(math.radians(latitud_extrema))
+    radio_celdas = max(1, math.ceil(radio_km / km_por_celda)) + 1
+
+    candidatos = []
+    for radio in range(radio_celdas + 1):
+        cota = (radio - 1) * km_por_celda
+        if len(candidatos) >= limite:
+            candidatos.sort(key=lambda candidato: candidato['puntaje'])
+            if cota > candidatos[limite - 1]['puntaje']:
+                break
+        for otra in indice.anillo(centro, radio):
+            distancia = 0.0 if otra == farmacia_id else distancia_km(lat, lon, *indice.coordenadas[otra])
+            if distancia > radio_km:
+                continue
+            for motorista_id, nombre, rut in indice.motoristas[otra]:
+                abiertos = cargas.get(motorista_id, 0)
+                candidatos.append({
+                    'motorista_id': motorista_id,
+                    'nombre': nombre,
+                    'rut': rut,
+                    'farmacia_id': otra,
+                    'distancia_km': round(distancia, 2),
+                    'despachos_abiertos': abiertos,
+                    'puntaje': round(distancia + KM_POR_DESPACHO_ABIERTO * abiertos, 2),
+                })
+    candidatos.sort(key=lambda candidato: (candidato['puntaje'], candidato['nombre'], candidato['motorista_id']))
+    return candidatos[:limite]
@@ -0,0 +1,357 @@
+"""
+Pipeline de exportación de reportes de despachos.
+
+Los despachos se leen en lotes por keyset (fecha_hora_creacion, identificador_unico)
+con proyecciones values_list, de modo que la memoria se mantiene constante
+incluso en reportes anuales: los drivers de MySQL cargan el resultado completo
+en memoria aunque se use .iterator(), por lo que se pagina en la base de datos.
+"""
+import csv
+from io import StringIO
+
+from django.db.models import Q
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+
+from ..models import Despacho
+from ..utils import filtrar_por_fechas
+
+
+ESTADOS_LABEL = dict(Despacho.ESTADOS)
+MOVIMIENTOS_LABEL = dict(Despacho.MOVIMIENTOS)
+
+TAM_LOTE = 2000
+
+CAMPOS_REPORTE = (
+    'identificador_unico',
+    'tipo_movimiento',
+    'farmacia_origen__nombre',
+    'motorista_asignado_id',
+    'motorista_asignado__nombre_visible',
+    'estado',
+    'fecha_hora_creacion',
+    'fecha_hora_toma_pedido',
+    'fecha_hora_salida_farmacia',
+    'fecha_hora_estimada_llegada',
+    'direccion_entrega',
+)
+
+ENCABEZADO_CSV = [
+    'ID Despacho',
+    'Tipo Movimiento',
+    'Farmacia',
+    'Motorista',
+    'Estado',
+    'Fecha Creación',
+    'Fecha Toma Pedido',
+    'Fecha Salida Farmacia',
+    'Fecha Estimada Llegada',
+    'Tiempo Entrega (min)',
+    'Dirección Entrega',
+    'Requiere Receta',
+]
+
+# Columnas de ReporteCSVView (exportación rápida): sin tiempo ni dirección y con
+# el nombre del usuario del motorista (get_full_name, vacío si no tiene)
+CAMPOS_CSV_BASICO = CAMPOS_REPORTE + (
+    'motorista_asignado__usuario__first_name',
+    'motorista_asignado__usuario__last_name',
+)
+
+ENCABEZADO_CSV_BASICO = [
+    columna for columna in ENCABEZADO_CSV if columna not in ('Tiempo Entrega (min)', 'Dirección Entrega')
+]
+
+
+def despachos_reporte(fecha_desde=None, fecha_hasta=None, motorista_id=None):
+    """
+    Queryset base de los reportes según el rango de días (inclusivo, ver
+    utils.filtrar_por_fechas) y el motorista.
+    """
+    queryset = filtrar_por_fechas(Despacho.objects.all(), 'fecha_hora_creacion', fecha_desde, fecha_hasta)
+    if motorista_id:
+        queryset = queryset.filter(motorista_asignado_id=motorista_id)
+    return queryset
+
+
+def iterar_despachos(queryset, campos=CAMPOS_REPORTE, tam_lote=TAM_LOTE):
+    """
+    Recorre el queryset de más reciente a más antiguo en lotes de `tam_lote`
+    filas (namedtuples con `campos`). Cada lote es una consulta independiente.
+    """
+    queryset = queryset.order_by('-fecha_hora_creacion', '-identificador_unico')
+    ultimo = None
+    while True:
+        lote = queryset
+        if ultimo is not None:
+            lote = lote.filter(
+                Q(fecha_hora_creacion__lt=ultimo.fecha_hora_creacion) |
+                Q(fecha_hora_creacion=ultimo.fecha_hora_creacion, identificador_unico__lt=ultimo.identificador_unico)
+            )
+        filas = list(lote.values_list(*campos, named=True)[:tam_lote])
+        yield from filas
+        if len(filas) < tam_lote:
+            return
+        ultimo = filas[-1]
+
+
+def nombre_motorista(fila):
+    """Equivalente a Motorista.nombre_completo sobre una fila proyectada."""
+    return fila.motorista_asignado__nombre_visible or f"Motorista {fila.motorista_asignado_id}"
+
+
+def tiempo_entrega_minutos(fila):
+    """Equivalente a Despacho.tiempo_entrega_minutos sobre una fila proyectada."""
+    if fila.fecha_hora_salida_farmacia and fila.fecha_hora_estimada_llegada:
+        diff = fila.fecha_hora_estimada_llegada - fila.fecha_hora_salida_farmacia
+        return int(diff.total_seconds() // 60)
+    return None
+
+
+def _fecha(valor, formato='%Y-%m-%d %H:%M'):
+    return valor.strftime(formato) if valor else ''
+
+
+def fila_csv(fila):
+    return [
+        fila.identificador_unico,
+        MOVIMIENTOS_LABEL.get(fila.tipo_movimiento, fila.tipo_movimiento),
+        fila.farmacia_origen__nombre or '',
+        nombre_motorista(fila),
+        ESTADOS_LABEL.get(fila.estado, fila.estado),
+        _fecha(fila.fecha_hora_creacion),
+        _fecha(fila.fecha_hora_toma_pedido),
+        _fecha(fila.fecha_hora_salida_farmacia),
+        _fecha(fila.fecha_hora_estimada_llegada),
+        tiempo_entrega_minutos(fila) or '',
+        fila.direccion_entrega,
+        'Sí' if fila.tipo_movimiento == 'CON_RECETA' else 'No',
+    ]
+
+
+def fila_csv_basica(fila):
+    nombre = f"{fila.motorista_asignado__usuario__first_name or ''} {fila.motorista_asignado__usuario__last_name or ''}"
+    return [
+        fila.identificador_unico,
+        MOVIMIENTOS_LABEL.get(fila.tipo_movimiento, fila.tipo_movimiento),
+        fila.farmacia_origen__nombre or '',
+        nombre.strip(),
+        ESTADOS_LABEL.get(fila.estado, fila.estado),
+        _fecha(fila.fecha_hora_creacion),
+        _fecha(fila.fecha_hora_toma_pedido),
+        _fecha(fila.fecha_hora_salida_farmacia),
+        _fecha(fila.fecha_hora_estimada_llegada),
+        'Sí' if fila.tipo_movimiento == 'CON_RECETA' else 'No',
+    ]
+
+
+def generar_csv(queryset, al_terminar=None, filas_por_bloque=500, basico=False):
+    """
+    Genera el CSV (UTF-8 con BOM) en bloques de bytes para StreamingHttpResponse.
+    Al terminar llama a `al_terminar(total_filas)` con el conteo obtenido
+    durante el recorrido, sin una consulta COUNT adicional. Con `basico` usa
+    las columnas de ENCABEZADO_CSV_BASICO, sin BOM, como ReporteCSVView.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    def vaciar():
+        contenido = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return contenido
+
+    if basico:
+        encabezado, campos, convertir = ENCABEZADO_CSV_BASICO, CAMPOS_CSV_BASICO, fila_csv_basica
+    else:
+        encabezado, campos, convertir = ENCABEZADO_CSV, CAMPOS_REPORTE, fila_csv
+        yield '\ufeff'.encode('utf-8')
+    writer.writerow(encabezado)
+
+    total = 0
+    for fila in iterar_despachos(queryset, campos):
+        writer.writerow(convertir(fila))
+        total += 1
+        if total % filas_por_bloque == 0:
+            yield vaciar()
+    yield vaciar()
+
+    if al_terminar:
+        al_terminar(total)
+
+
+# ============================================
+# PDF
+# ============================================
+
+# Filas por página: cada página es una Table independiente con encabezado,
+# las filas y una fila de subtotal. Con alto de fila y anchos de columna
+# fijos reportlab no mide celdas y cada página cuesta lo mismo.
+FILAS_POR_PAGINA = 30
+ALTO_FILA = 13
+ALTO_ENCABEZADO = 18
+
+ENCABEZADO_PDF = ['ID', 'Tipo', 'Farmacia', 'Motorista', 'Estado', 'Fecha Creación', 'Tiempo (min)']
+ANCHOS_PDF = [50, 95, 130, 130, 85, 90, 68]  # 648pt: ancho útil de carta horizontal
+
+ESTILO_TABLA_PDF = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#40466e')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 9),
+    ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#d9dbe8')),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('SPAN', (0, -1), (-1, -1)),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+])
+
+
+def titulo_reporte(tipo_filtro, fecha=None, mes=None, anio=None):
+    if tipo_filtro == 'diario' and fecha:
+        return f"Reporte Diario de Despachos - {fecha}"
+    elif tipo_filtro == 'mensual' and mes:
+        return f"Reporte Mensual de Despachos - {mes}"
+    elif tipo_filtro == 'anual' and anio:
+        return f"Reporte Anual de Despachos - {anio}"
+    return "Reporte General de Despachos"
+
+
+def fila_pdf(fila, tiempo=None):
+    return [
+        str(fila.identificador_unico),
+        MOVIMIENTOS_LABEL.get(fila.tipo_movimiento, fila.tipo_movimiento)[:18],
+        (fila.farmacia_origen__nombre or '')[:28],
+        nombre_motorista(fila)[:28],
+        ESTADOS_LABEL.get(fila.estado, fila.estado),
+        _fecha(fila.fecha_hora_creacion, '%Y-%m-%d %H:%M'),
+        str(tiempo if tiempo is not None else '-'),
+    ]
+
+
+class _Totales:
+    """Acumula conteo, entregados y minutos de entrega de un grupo de filas."""
+
+    def __init__(self):
+        self.despachos = 0
+        self.entregados = 0
+        self.minutos = 0
+        self.con_tiempo = 0
+
+    def agregar(self, fila, tiempo):
+        self.despachos += 1
+        if fila.estado == 'ENTREGADO':
+            self.entregados += 1
+        if tiempo is not None:
+            self.minutos += tiempo
+            self.con_tiempo += 1
+
+    def texto(self, etiqueta):
+        promedio = f"{self.minutos // self.con_tiempo} min" if self.con_tiempo else '-'
+        return (
+            f"{etiqueta}: {self.despachos} despacho(s) | "
+            f"Entregados: {self.entregados} | Tiempo promedio: {promedio}"
+        )
+
+
+def _tabla_pagina(filas, totales):
+    data = [ENCABEZADO_PDF] + filas + [[totales.texto('Subtotal página')]]
+    data[-1].extend([''] * (len(ENCABEZADO_PDF) - 1))
+    alturas = [ALTO_ENCABEZADO] + [ALTO_FILA] * (len(filas) + 1)
+    return Table(data, colWidths=ANCHOS_PDF, rowHeights=alturas, repeatRows=1, style=ESTILO_TABLA_PDF)
+
+
+def _paginas_pdf(queryset, total_general, estilos):
+    """Genera los flowables página a página mientras se recorren los lotes."""
+    filas, totales = [], _Totales()
+    primera = True
+
+    def cerrar_pagina():
+        if not primera:
+            yield PageBreak()
+        yield _tabla_pagina(filas, totales)
+
+    for fila in iterar_despachos(queryset):
+        tiempo = tiempo_entrega_minutos(fila)
+        filas.append(fila_pdf(fila, tiempo))
+        totales.agregar(fila, tiempo)
+        total_general.agregar(fila, tiempo)
+        if len(filas) == FILAS_POR_PAGINA:
+            yield from cerrar_pagina()
+            filas, totales = [], _Totales()
+            primera = False
+
+    if filas or primera:
+        yield from cerrar_pagina()
+
+    yield Spacer(1, 0.15 * inch)
+    yield Paragraph(total_general.texto('Total general'), estilos['Heading4'])
+
+
+class _DocumentoPorDemanda(SimpleDocTemplate):
+    """
+    SimpleDocTemplate que toma los flowables de un generador a medida que los
+    ubica: handle_flowable (el paso de BaseDocTemplate.build que ubica el
+    primer flowable de la lista) repone la lista del build hasta `reserva`
+    elementos, de modo que nunca hay más de unas pocas páginas en memoria.
+    handle_flowable también ubica los flowables pendientes de cada página
+    (_hanging); esa lista no se toca.
+    """
+
+    def __init__(self, destino, generador, reserva=2, **kwargs):
+        super().__init__(destino, **kwargs)
+        self._generador = generador
+        self._reserva = reserva
+        self._historia = []
+
+    def _reponer(self, flowables):
+        while self._generador is not None and len(flowables) < self._reserva:
+            try:
+                flowables.append(next(self._generador))
+            except StopIteration:
+                self._generador = None
+
+    def handle_flowable(self, flowables):
+        super().handle_flowable(flowables)
+        if flowables is self._historia:
+            self._reponer(flowables)
+
+    def build(self, **kwargs):
+        self._reponer(self._historia)
+        super().build(self._historia, **kwargs)
+
+
+def generar_pdf(destino, queryset, titulo, generado_por=''):
+    """
+    Escribe el PDF del reporte en `destino` (ruta o archivo binario) y retorna
+    la cantidad de despachos incluidos. No hay límite de filas: se pagina en
+    tablas de FILAS_POR_PAGINA con subtotal por página y total al final.
+    """
+    estilos = getSampleStyleSheet()
+    total_general = _Totales()
+    doc = _DocumentoPorDemanda(
+        destino, _paginas_pdf(queryset, total_general, estilos), pagesize=landscape(letter), title=titulo
+    )
+    # El PDF puede servirse desde services/cache_reportes.py mientras los datos no
+    # cambien: la hora es la de generación (datos vigentes a esa hora), no la de descarga.
+    generado = f"Generado por: {generado_por} | Datos al: {timezone.localtime():%Y-%m-%d %H:%M}"
+
+    def encabezado_pagina(canvas, documento):
+        ancho, alto = documento.pagesize
+        canvas.saveState()
+        canvas.setFont('Helvetica-Bold', 14)
+        canvas.drawString(documento.leftMargin, alto - 0.6 * inch, titulo)
+        canvas.setFont('Helvetica', 8)
+        canvas.drawString(documento.leftMargin, alto - 0.8 * inch, generado)
+        canvas.drawRightString(ancho - documento.rightMargin, 0.5 * inch, f"Página {documento.page}")
+        canvas.restoreState()
+
+    doc.build(onFirstPage=encabezado_pagina, onLaterPages=encabezado_pagina)
+    return total_general.despachos
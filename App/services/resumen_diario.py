@@ -0,0 +1,108 @@
+"""
+Mantenimiento del resumen diario de despachos (ResumenDiarioDespacho).
+
+Cada día se recalcula completo desde Despacho: se borran sus filas y se
+insertan los nuevos conteos agrupados por farmacia, motorista y estado.
+
+Los recálculos se serializan en la fila 'resumen_diario' de VersionColeccion:
+cada uno la incrementa (y la bloquea hasta confirmar) antes de leer Despacho,
+así dos workers no insertan a la vez las mismas claves de resumen_diario_unico
+ni uno deja conteos más viejos que el otro. Es siempre el primer bloqueo de la
+transacción, por lo que no hay orden en que dos recálculos se crucen.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+from ..models import Despacho, ResumenDiarioDespacho
+from ..utils import filtrar_por_fechas
+from . import versiones
+from .metricas import DURACION_ENTREGA
+
+
+COLECCION = 'resumen_diario'
+
+
+FILTRO_CON_TIEMPOS = Q(
+    fecha_hora_estimada_llegada__isnull=False,
+    fecha_hora_despacho__isnull=False
+)
+
+
+def _agrupar_por_dia(queryset):
+    """Agrupa despachos por día local, farmacia, motorista y estado."""
+    return queryset.order_by().annotate(
+        dia=TruncDate('fecha_hora_creacion')
+    ).values(
+        'dia', 'farmacia_origen_id', 'motorista_asignado_id', 'estado'
+    ).annotate(
+        cantidad=Count('identificador_unico'),
+        con_tiempo=Count('identificador_unico', filter=FILTRO_CON_TIEMPOS),
+        duracion=Sum(DURACION_ENTREGA, filter=FILTRO_CON_TIEMPOS),
+    )
+
+
+def _filas_resumen(grupos):
+    return [
+        ResumenDiarioDespacho(
+            fecha=grupo['dia'],
+            farmacia_id=grupo['farmacia_origen_id'],
+            motorista_id=grupo['motorista_asignado_id'],
+            estado=grupo['estado'],
+            cantidad=grupo['cantidad'],
+            entregas_con_tiempo=grupo['con_tiempo'],
+            duracion_total_segundos=int(grupo['duracion'].total_seconds()) if grupo['duracion'] else 0,
+        )
+        for grupo in grupos
+    ]
+
+
+def recalcular_rango(fecha_desde, fecha_hasta):
+    """
+    Recalcula todos los días entre fecha_desde y fecha_hasta (ambos incluidos).
+    Retorna la cantidad de filas de resumen generadas.
+    """
+    with transaction.atomic():
+        versiones.incrementar(COLECCION)
+        despachos = filtrar_por_fechas(Despacho.objects.all(), 'fecha_hora_creacion', fecha_desde, fecha_hasta)
+        filas = _filas_resumen(_agrupar_por_dia(despachos))
+        ResumenDiarioDespacho.objects.filter(
+            fecha__gte=fecha_desde, fecha__lte=fecha_hasta
+        ).delete()
+        ResumenDiarioDespacho.objects.bulk_create(filas, batch_size=1000)
+
+    return len(filas)
+
+
+def recalcular_dia(fecha):
+    """Recalcula un único día."""
+    return recalcular_rango(fecha, fecha)
+
+
+def recalcular_dia_al_confirmar(fecha):
+    """
+    Recalcula el día al confirmar la transacción en curso, una sola vez aunque
+    se guarden varios despachos de ese día en ella. Un error del recálculo se
+    registra sin afectar a quien guardó (el comando recalcular_resumen_diario
+    lo repara).
+    """
+    pendientes = transaction.get_connection().run_on_commit
+    if any(getattr(funcion, 'dia_resumen', None) == fecha for _, funcion, _ in pendientes):
+        return
+
+    def recalcular():
+        recalcular_dia(fecha)
+
+    recalcular.dia_resumen = fecha
+    transaction.on_commit(recalcular, robust=True)
+
+
+def recalcular_todo():
+    """Reconstruye el resumen completo a partir de toda la historia."""
+    with transaction.atomic():
+        versiones.incrementar(COLECCION)
+        filas = _filas_resumen(_agrupar_por_dia(Despacho.objects.all()))
+        ResumenDiarioDespacho.objects.all().delete()
+        ResumenDiarioDespacho.objects.bulk_create(filas, batch_size=1000)
+
+    return len(filas)
@@ -0,0 +1,100 @@
+"""
+Series de tiempo de despachos (volumen y tiempo promedio de entrega).
+
+Los intervalos día/semana/mes se calculan sobre ResumenDiarioDespacho; el
+intervalo hora necesita la hora exacta y se calcula sobre Despacho.
+"""
+from django.db.models import Avg, Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncHour, TruncMonth, TruncWeek
+
+from ..models import Despacho, ResumenDiarioDespacho
+from ..utils import filtrar_por_fechas
+from .metricas import DURACION_ENTREGA
+
+
+INTERVALOS = ('hora', 'dia', 'semana', 'mes')
+
+# El intervalo hora lee Despacho directamente; se limita el rango para acotar el costo
+MAX_DIAS_POR_HORA = 31
+
+ENTREGADOS_CON_TIEMPO = Q(
+    estado='ENTREGADO',
+    fecha_hora_estimada_llegada__isnull=False,
+    fecha_hora_despacho__isnull=False
+)
+
+
+def _serie_por_hora(fecha_desde, fecha_hasta, farmacia_id=None, motorista_id=None, region=None, estado=None):
+    qs = filtrar_por_fechas(Despacho.objects.order_by(), 'fecha_hora_creacion', fecha_desde, fecha_hasta)
+    if farmacia_id:
+        qs = qs.filter(farmacia_origen_id=farmacia_id)
+    if motorista_id:
+        qs = qs.filter(motorista_asignado_id=motorista_id)
+    if region:
+        qs = qs.filter(farmacia_origen__regiones__codigo=region)
+    if estado:
+        qs = qs.filter(estado=estado)
+
+    filas = qs.annotate(periodo=TruncHour('fecha_hora_creacion')).values('periodo').annotate(
+        total=Count('identificador_unico'),
+        duracion_promedio=Avg(DURACION_ENTREGA, filter=ENTREGADOS_CON_TIEMPO),
+    ).order_by('periodo')
+
+    return [
+        {
+            'periodo': fila['periodo'].isoformat(),
+            'total': fila['total'],
+            'tiempo_promedio_minutos': int(fila['duracion_promedio'].total_seconds() // 60) if fila['duracion_promedio'] else None,
+        }
+        for fila in filas
+    ]
+
+
+def _serie_desde_resumen(intervalo, fecha_desde, fecha_hasta, farmacia_id=None, motorista_id=None, region=None, estado=None):
+    qs = ResumenDiarioDespacho.objects.order_by().filter(
+        fecha__gte=fecha_desde,
+        fecha__lte=fecha_hasta
+    )
+    if farmacia_id:
+        qs = qs.filter(farmacia_id=farmacia_id)
+    if motorista_id:
+        qs = qs.filter(motorista_id=motorista_id)
+    if region:
+        qs = qs.filter(farmacia__regiones__codigo=region)
+    if estado:
+        qs = qs.filter(estado=estado)
+
+    if intervalo == 'semana':
+        qs = qs.annotate(periodo=TruncWeek('fecha'))
+    elif intervalo == 'mes':
+        qs = qs.annotate(periodo=TruncMonth('fecha'))
+    else:
+        qs = qs.annotate(periodo=F('fecha'))
+
+    entregados = Q(estado='ENTREGADO')
+    filas = qs.values('periodo').annotate(
+        total=Sum('cantidad'),
+        segundos=Coalesce(Sum('duracion_total_segundos', filter=entregados), 0),
+        entregas=Coalesce(Sum('entregas_con_tiempo', filter=entregados), 0),
+    ).order_by('periodo')
+
+    return [
+        {
+            'periodo': fila['periodo'].isoformat(),
+            'total': fila['total'],
+            'tiempo_promedio_minutos': int(fila['segundos'] // fila['entregas'] // 60) if fila['entregas'] else None,
+        }
+        for fila in filas
+    ]
+
+
+def serie_despachos(intervalo, fecha_desde, fecha_hasta, **filtros):
+    """
+    Retorna una lista de {'periodo', 'total', 'tiempo_promedio_minutos'}
+    ordenada por periodo. Filtros: farmacia_id, motorista_id, region, estado.
+    """
+    if intervalo not in INTERVALOS:
+        raise ValueError(f"Intervalo inválido: {intervalo}")
+    if intervalo == 'hora':
+        return _serie_por_hora(fecha_desde, fecha_hasta, **filtros)
+    return _serie_desde_resumen(intervalo, fecha_desde, fecha_hasta, **filtros)
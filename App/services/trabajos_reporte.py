@@ -0,0 +1,123 @@
+"""
+Generación de reportes en segundo plano (TrabajoReporte).
+
+Los trabajos se ejecutan en un pool de hilos local al proceso web
+(settings.REPORTES_WORKERS). Si el proceso se reinicia con trabajos
+pendientes, el comando `procesar_reportes` los retoma.
+"""
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from ..models import ReportDownloadHistory, TrabajoReporte
+from ..utils import generar_nombre_archivo, rango_fechas_por_tipo
+from .exportacion import generar_parquet, generar_xlsx
+from .reportes import despachos_reporte, generar_csv, generar_pdf, titulo_reporte
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obtener_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'REPORTES_WORKERS', 2),
+                thread_name_prefix='reportes'
+            )
+        return _executor
+
+
+def encolar(trabajo):
+    """Envía el trabajo al pool una vez confirmada la transacción que lo creó."""
+    pk = trabajo.pk
+    transaction.on_commit(lambda: _obtener_executor().submit(_ejecutar_en_hilo, pk))
+
+
+def _ejecutar_en_hilo(pk):
+    close_old_connections()
+    try:
+        ejecutar_trabajo(pk)
+    finally:
+        connection.close()
+
+
+def _escribir_archivo(destino, formato, queryset, titulo, generado_por):
+    """Escribe el reporte en `destino` y retorna la cantidad de registros."""
+    if formato == 'PDF':
+        return generar_pdf(destino, queryset, titulo=titulo, generado_por=generado_por)
+    if formato == 'XLSX':
+        return generar_xlsx(destino, queryset)
+    if formato == 'PARQUET':
+        return generar_parquet(destino, queryset)
+
+    total = []
+    for bloque in generar_csv(queryset, al_terminar=total.append):
+        destino.write(bloque)
+    return total[0]
+
+
+def ejecutar_trabajo(pk):
+    """
+    Genera el archivo de un trabajo PENDIENTE. El cambio a EN_PROCESO es un
+    UPDATE condicional, así un trabajo nunca se procesa dos veces.
+    """
+    tomado = TrabajoReporte.objects.filter(pk=pk, estado='PENDIENTE').update(
+        estado='EN_PROCESO', fecha_inicio=timezone.now()
+    )
+    if not tomado:
+        return None
+
+    trabajo = TrabajoReporte.objects.select_related('user').get(pk=pk)
+    parametros = trabajo.parametros or {}
+    tipo_filtro = trabajo.tipo_reporte.lower()
+    fecha = parametros.get('fecha', '')
+    mes = parametros.get('mes', '')
+    anio = parametros.get('anio', '')
+    motorista_id = parametros.get('id_motorista') or None
+
+    try:
+        fecha_desde, fecha_hasta = rango_fechas_por_tipo(tipo_filtro, fecha, mes, anio)
+        queryset = despachos_reporte(fecha_desde, fecha_hasta, motorista_id)
+        filename = generar_nombre_archivo(tipo_filtro, trabajo.formato, fecha, mes, anio)
+
+        with tempfile.TemporaryFile() as temporal:
+            cantidad = _escribir_archivo(
+                temporal, trabajo.formato, queryset,
+                titulo=titulo_reporte(tipo_filtro, fecha, mes, anio),
+                generado_por=trabajo.user.get_full_name()
+            )
+            temporal.seek(0)
+            trabajo.archivo.save(filename, File(temporal), save=False)
+
+        with transaction.atomic():
+            trabajo.historial = ReportDownloadHistory.objects.create(
+                user=trabajo.user,
+                tipo_reporte=trabajo.tipo_reporte,
+                formato=trabajo.formato,
+                fecha_desde=fecha_desde.date() if fecha_desde else None,
+                fecha_hasta=fecha_hasta.date() if fecha_hasta else None,
+                motorista_id=motorista_id,
+                cantidad_registros=cantidad,
+                nombre_archivo=filename
+            )
+            trabajo.estado = 'COMPLETADO'
+            trabajo.fecha_fin = timezone.now()
+            trabajo.save(update_fields=['archivo', 'historial', 'estado', 'fecha_fin'])
+    except Exception as exc:
+        logger.exception("Error generando el reporte %s", pk)
+        TrabajoReporte.objects.filter(pk=pk).update(
+            estado='ERROR', mensaje_error=str(exc)[:1000], fecha_fin=timezone.now()
+        )
+        return None
+
+    return trabajo
@@ -0,0 +1,98 @@
+"""
+Sellos de versión para GET condicional (ETag / Last-Modified).
+
+Cada colección tiene una fila en VersionColeccion que signals.py incrementa al
+confirmar cualquier cambio de sus modelos. Un listado o dashboard se identifica
+por los sellos de las colecciones que muestra; un objeto, por su columna
+fecha_actualizacion y los sellos de lo que anida. Así se puede responder 304
+con una consulta chica, sin evaluar el queryset ni serializar nada.
+
+Los sellos viven en la base de datos y no en la caché local del proceso, para
+que todos los workers vean el mismo valor.
+"""
+import hashlib
+from calendar import timegm
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from ..models import VersionColeccion
+
+
+# Colecciones que cada representación incluye
+DEPENDENCIAS = {
+    'despacho': ('despacho', 'farmacia', 'motorista'),
+    'farmacia': ('farmacia',),
+    'moto': ('moto',),
+    'dashboard': ('despacho', 'farmacia', 'motorista', 'moto', 'asignacion'),
+}
+
+
+def incrementar(*nombres):
+    """Nueva versión de las colecciones `nombres` (se crean si no existen)."""
+    ahora = timezone.now()
+    for nombre in nombres:
+        actualizadas = VersionColeccion.objects.filter(nombre=nombre).update(
+            version=F('version') + 1, fecha_actualizacion=ahora
+        )
+        if actualizadas:
+            continue
+        try:
+            with transaction.atomic():
+                VersionColeccion.objects.create(nombre=nombre, version=1, fecha_actualizacion=ahora)
+        except IntegrityError:
+            # Otro proceso la creó entre el UPDATE y el INSERT
+            VersionColeccion.objects.filter(nombre=nombre).update(
+                version=F('version') + 1, fecha_actualizacion=ahora
+            )
+
+
+def incrementar_al_confirmar(*nombres):
+    transaction.on_commit(lambda: incrementar(*nombres))
+
+
+def sellos(nombres):
+    """{nombre: (version, fecha_actualizacion)}; las colecciones sin fila quedan en (0, None)."""
+    encontrados = {
+        nombre: (version, fecha)
+        for nombre, version, fecha in VersionColeccion.objects.filter(nombre__in=nombres).values_list(
+            'nombre', 'version', 'fecha_actualizacion'
+        )
+    }
+    return {nombre: encontrados.get(nombre, (0, None)) for nombre in nombres}
+
+
+def firma(colecciones, *partes, modificado=None):
+    """
+    (etag, última modificación) de una representación que depende de los
+    sellos de `colecciones`, de `partes` (usuario, URL, formato...) y, para un
+    objeto, de su propia fecha `modificado`.
+    """
+    actuales = sellos(colecciones)
+    valor = repr((sorted(actuales.items()), partes, modificado))
+    fechas = [fecha for _, fecha in actuales.values() if fecha] + ([modificado] if modificado else [])
+    return hashlib.md5(valor.encode('utf-8')).hexdigest(), max(fechas, default=None)
+
+
+def respuesta_no_modificada(request, etag, modificado):
+    """Un 304 (con sus validadores) si If-None-Match / If-Modified-Since coinciden; si no, None."""
+    respuesta = get_conditional_response(
+        request, etag=quote_etag(etag),
+        last_modified=timegm(modificado.utctimetuple()) if modificado else None,
+    )
+    if respuesta is not None:
+        agregar_validadores(respuesta, etag, modificado)
+    return respuesta
+
+
+def agregar_validadores(respuesta, etag, modificado):
+    """ETag, Last-Modified y Cache-Control para que el cliente revalide en vez de reusar a ciegas."""
+    respuesta['ETag'] = quote_etag(etag)
+    if modificado:
+        respuesta['Last-Modified'] = http_date(timegm(modificado.utctimetuple()))
+    # Depende del usuario: no debe quedar en cachés compartidas
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
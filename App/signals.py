@@ -1,8 +1,13 @@
 # signals.py
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import Moto, AsignacionMoto # Asegúrate de que los modelos estén importados
+from .models import Moto, Motorista, Farmacia, AsignacionMoto, AsignacionFarmacia, Despacho, DespachoEvento, ProductoPedido, User # Asegúrate de que los modelos estén importados
 from django.utils import timezone
+from .services.resumen_diario import recalcular_dia_al_confirmar
+from .services.cache_dashboard import invalidar_dashboards
+from .services import busqueda, versiones
+from .services.estimacion_llegada import completar_estimaciones
 
 @receiver(post_save, sender=Moto)
 def sincronizar_asignacion_con_moto(sender, instance, created, **kwargs):
@@ -55,4 +60,137 @@ def sincronizar_asignacion_con_moto(sender, instance, created, **kwargs):
         if asignacion_activa:
             asignacion_activa.activa = False
             asignacion_activa.fecha_desasignacion = timezone.now()
-            asignacion_activa.save() # Esto libera la moto y motorista.
\ No newline at end of file
+            asignacion_activa.save() # Esto libera la moto y motorista.
+
+@receiver(pre_save, sender=Motorista)
+def calcular_nombre_visible(sender, instance, **kwargs):
+    """Mantiene Motorista.nombre_visible al crear el motorista o cambiar su usuario."""
+    instance.nombre_visible = instance.calcular_nombre_visible()
+
+
+@receiver(post_save, sender=User)
+def sincronizar_nombre_visible(sender, instance, created, **kwargs):
+    """Propaga a Motorista.nombre_visible los cambios de nombre del usuario."""
+    update_fields = kwargs.get('update_fields')
+    if created or (update_fields and not {'first_name', 'last_name', 'username'} & set(update_fields)):
+        return
+    nombre = Motorista.nombre_de_usuario(instance)
+    if Motorista.objects.filter(usuario=instance).exclude(nombre_visible=nombre).update(nombre_visible=nombre):
+        transaction.on_commit(invalidar_dashboards)
+
+
+def _guarda_estado(update_fields):
+    return update_fields is None or 'estado' in update_fields
+
+
+@receiver(pre_save, sender=Despacho)
+def recordar_estado_despacho(sender, instance, **kwargs):
+    """
+    Estado guardado antes de un save() que puede cambiarlo (formularios y
+    admin). Normalmente ya viene de Despacho.from_db; solo se consulta si el
+    despacho se cargó con el estado diferido o se armó a mano con su pk.
+    """
+    if (
+        instance.pk is not None and not hasattr(instance, '_estado_guardado')
+        and _guarda_estado(kwargs.get('update_fields'))
+    ):
+        instance._estado_guardado = Despacho.objects.filter(pk=instance.pk).values_list('estado', flat=True).first()
+
+
+@receiver(pre_save, sender=Despacho)
+def estimar_llegada_despacho(sender, instance, **kwargs):
+    """Al crear un despacho sin fecha estimada de llegada, la calcula services/estimacion_llegada.py."""
+    if instance._state.adding and instance.fecha_hora_estimada_llegada is None:
+        completar_estimaciones([instance])
+
+
+@receiver(post_save, sender=Despacho)
+def registrar_evento_despacho(sender, instance, created, **kwargs):
+    """
+    DespachoEvento de la creación y de los cambios de estado hechos con save().
+    Los cambios de services/estados_despacho.py usan update() y escriben su evento allí.
+    """
+    if not created and not _guarda_estado(kwargs.get('update_fields')):
+        return
+    anterior = getattr(instance, '_estado_guardado', None)
+    if created:
+        DespachoEvento.de_transicion(instance.pk, None, instance.estado, instance.fecha_hora_creacion).save(force_insert=True)
+    elif anterior and anterior != instance.estado:
+        DespachoEvento.de_transicion(instance.pk, anterior, instance.estado, timezone.now()).save(force_insert=True)
+    instance._estado_guardado = instance.estado
+
+
+@receiver(post_save, sender=Despacho)
+@receiver(post_delete, sender=Despacho)
+def actualizar_resumen_diario(sender, instance, **kwargs):
+    """
+    Recalcula el día del despacho en ResumenDiarioDespacho una vez confirmada
+    la transacción (una vez por día y transacción). fecha_hora_creacion no
+    cambia, así que basta con ese día.
+    """
+    if not instance.fecha_hora_creacion:
+        return
+    recalcular_dia_al_confirmar(timezone.localdate(instance.fecha_hora_creacion))
+
+
+def invalidar_cache_dashboards(sender, **kwargs):
+    """
+    Invalida los dashboards cacheados al confirmar la transacción. Para Despacho
+    se ejecuta después de recalcular el resumen diario (receiver conectado antes).
+    """
+    transaction.on_commit(invalidar_dashboards)
+
+
+for modelo in (Despacho, Moto, Motorista, Farmacia, AsignacionMoto, AsignacionFarmacia):
+    post_save.connect(invalidar_cache_dashboards, sender=modelo, dispatch_uid=f'invalidar_dashboards_save_{modelo.__name__}')
+    post_delete.connect(invalidar_cache_dashboards, sender=modelo, dispatch_uid=f'invalidar_dashboards_delete_{modelo.__name__}')
+
+
+def _actualizar_busqueda(sender, instance, **kwargs):
+    """Reindexa el documento de búsqueda del objeto al confirmar la transacción."""
+    tipo, pk = TIPOS_BUSQUEDA[sender], instance.pk
+    transaction.on_commit(lambda: busqueda.actualizar(tipo, pk))
+
+
+def _eliminar_busqueda(sender, instance, **kwargs):
+    tipo, pk = TIPOS_BUSQUEDA[sender], instance.pk
+    transaction.on_commit(lambda: busqueda.eliminar(tipo, pk))
+
+
+TIPOS_BUSQUEDA = {Despacho: 'DESPACHO', Motorista: 'MOTORISTA', Farmacia: 'FARMACIA', Moto: 'MOTO'}
+
+for modelo in TIPOS_BUSQUEDA:
+    post_save.connect(_actualizar_busqueda, sender=modelo, dispatch_uid=f'busqueda_save_{modelo.__name__}')
+    post_delete.connect(_eliminar_busqueda, sender=modelo, dispatch_uid=f'busqueda_delete_{modelo.__name__}')
+
+
+def _incrementar_version(sender, **kwargs):
+    """Nueva versión de la colección del modelo (ETag de la API y los dashboards) al confirmar."""
+    versiones.incrementar_al_confirmar(COLECCIONES_VERSION[sender])
+
+
+COLECCIONES_VERSION = {
+    Despacho: 'despacho', Farmacia: 'farmacia', Motorista: 'motorista', Moto: 'moto',
+    AsignacionMoto: 'asignacion', AsignacionFarmacia: 'asignacion',
+}
+
+for modelo in COLECCIONES_VERSION:
+    post_save.connect(_incrementar_version, sender=modelo, dispatch_uid=f'version_save_{modelo.__name__}')
+    post_delete.connect(_incrementar_version, sender=modelo, dispatch_uid=f'version_delete_{modelo.__name__}')
+
+
+@receiver(post_save, sender=ProductoPedido)
+@receiver(post_delete, sender=ProductoPedido)
+def actualizar_version_despacho(sender, instance, **kwargs):
+    """Los productos son parte de la representación del despacho: se marca el despacho como modificado."""
+    Despacho.objects.filter(pk=instance.despacho_id).update(fecha_actualizacion=timezone.now())
+    versiones.incrementar_al_confirmar('despacho')
+
+
+@receiver(post_save, sender=User)
+def actualizar_version_usuario(sender, instance, created, **kwargs):
+    """Los datos del usuario se anidan en el motorista; el login solo toca last_login."""
+    update_fields = kwargs.get('update_fields')
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    versiones.incrementar_al_confirmar('motorista')
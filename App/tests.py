@@ -1,3 +1,1560 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import time as reloj
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import FileResponse
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.renderers import JSONRenderer
+
+from App.api.renderers import FastJSONParser, FastJSONRenderer
+from App.forms import DespachoForm
+from App.models import (
+    AsignacionFarmacia, AsignacionMoto, Despacho, DespachoEvento, DocumentacionMoto, DocumentoBusqueda, Farmacia,
+    FarmaciaRegion, MantenimientoMoto, Moto, Motorista, ProductoPedido, Region, ReportDownloadHistory,
+    ResumenDiarioDespacho, TrabajoReporte, TransicionDespacho, User, VersionColeccion,
+)
+from App.services import busqueda
+from App.services.busqueda import buscar, reindexar_todo
+from App.services import cache_reportes
+from App.services.cache_dashboard import obtener_contexto
+from App.services.metricas import metricas_despachos, metricas_generales, metricas_regionales
+from App.services.resumen_diario import recalcular_dia, recalcular_todo
+from App.services.despachos_masivos import cambiar_estados
+from App.services.exportacion import PARQUET_DISPONIBLE
+from App.services.estados_despacho import ConflictoDeVersion, transicionar
+from App.services.estimacion_llegada import (
+    CLAVE_HISTORIA, NUMPY_DISPONIBLE, _minutos_numpy, _minutos_python, estimar_llegadas,
+)
+from App.services.eventos_despacho import tiempos_entrega
+from App.services.recomendacion_motoristas import invalidar as invalidar_recomendaciones
+from App.services.reportes import (
+    ENCABEZADO_CSV, FILAS_POR_PAGINA, _DocumentoPorDemanda, despachos_reporte, generar_csv, generar_pdf, iterar_despachos, nombre_motorista,
+)
+from App.services.series import serie_despachos
+from App.utils import rango_fechas_por_tipo
+from App.services.trabajos_reporte import _escribir_archivo, ejecutar_trabajo
+
+
+def crear_datos_base(cantidad_despachos=30):
+    """Usuario administrador, una farmacia, un motorista y sus despachos."""
+    admin = User.objects.create_user(
+        'admin_test', password='clave-test', rol='ADMINISTRADOR', first_name='Admin', last_name='Test'
+    )
+    usuario_motorista = User.objects.create_user(
+        'motorista_test', password='clave-test', rol='MOTORISTA', first_name='Ana', last_name='Pérez'
+    )
+    farmacia = Farmacia.objects.create(
+        nombre='Farmacia Test', direccion='Calle 1', region='REGIÓN DEL MAULE', comuna='Talca',
+        localidad='Talca', provincia='Talca',
+        horario_recepcion_inicio=time(8), horario_recepcion_fin=time(20),
+        dias_operativos='LUN,MAR,MIE', latitud=-35.42, longitud=-71.65
+    )
+    motorista = Motorista.objects.create(
+        usuario=usuario_motorista, nombre='Ana', apellido_paterno='Pérez', apellido_materno='Soto', rut='11111111-1'
+    )
+    estados = ['PENDIENTE', 'EN_RUTA', 'ENTREGADO']
+    Despacho.objects.bulk_create([
+        Despacho(
+            farmacia_origen=farmacia,
+            motorista_asignado=motorista,
+            direccion_entrega=f'Dirección {i}',
+            tipo_movimiento='DIRECTO',
+            estado=estados[i % 3],
+        )
+        for i in range(cantidad_despachos)
+    ])
+    return admin, farmacia, motorista
+
+
+class CacheReportesTemporalMixin:
+    """Aísla la caché en disco de reportes en un directorio temporal."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._cache_reportes = tempfile.mkdtemp()
+        cls._override_cache = override_settings(REPORTES_CACHE_DIR=cls._cache_reportes)
+        cls._override_cache.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._override_cache.disable()
+        shutil.rmtree(cls._cache_reportes, ignore_errors=True)
+
+
+class PlanConsultasDespachoTests(CacheReportesTemporalMixin, TestCase):
+    """
+    Regresión de planes de consulta: las consultas de listados, reportes y
+    series sobre Despacho deben poder usar los índices compuestos del modelo.
+    En SQLite se revisa el índice elegido; en MySQL, los índices candidatos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def plan(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return '\n'.join(' '.join(map(str, fila)) for fila in cursor.fetchall())
+
+    def assertPlanUsaIndice(self, plan, *indices):
+        self.assertTrue(
+            any(indice in plan for indice in indices),
+            f"Ningún índice de {indices} aparece en el plan:\n{plan}"
+        )
+
+    def consultas_despacho(self, url, params):
+        """SQL de los SELECT sobre Despacho que ejecuta una vista."""
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(url, params)
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        tabla = Despacho._meta.db_table
+        return [
+            consulta['sql'] for consulta in contexto.captured_queries
+            if consulta['sql'].startswith('SELECT') and f'FROM "{tabla}"' in consulta['sql'].replace('`', '"')
+        ]
+
+    def test_listar_despachos_por_estado(self):
+        consultas = self.consultas_despacho(reverse('despacho_listar'), {'estado': 'PENDIENTE'})
+        self.assertTrue(consultas)
+        for sql in consultas:
+            self.assertPlanUsaIndice(self.plan(sql), 'despacho_estado_fecha_idx')
+
+    def test_listar_despachos_por_tipo(self):
+        consultas = self.consultas_despacho(reverse('despacho_listar'), {'tipo_movimiento': 'DIRECTO'})
+        self.assertTrue(consultas)
+        for sql in consultas:
+            self.assertPlanUsaIndice(self.plan(sql), 'despacho_tipo_fecha_idx')
+
+    def test_listar_despachos_por_rango_de_fechas(self):
+        hoy = timezone.localdate().isoformat()
+        consultas = self.consultas_despacho(reverse('despacho_listar'), {'fecha_desde': hoy, 'fecha_hasta': hoy})
+        self.assertTrue(consultas)
+        for sql in consultas:
+            self.assertNotIn('django_datetime_cast_date', sql)
+            self.assertPlanUsaIndice(self.plan(sql), 'despacho_fecha_idx', 'despacho_activos_fecha_idx')
+
+    def test_reporte_csv_por_rango(self):
+        consultas = self.consultas_despacho(
+            reverse('reporte_csv'), {'tipo': 'mensual', 'mes': timezone.localdate().strftime('%Y-%m')}
+        )
+        self.assertTrue(consultas)
+        for sql in consultas:
+            self.assertPlanUsaIndice(self.plan(sql), 'despacho_fecha_idx')
+
+    def test_lotes_de_reporte_por_motorista(self):
+        desde = timezone.now() - timedelta(days=30)
+        queryset = despachos_reporte(desde, timezone.now(), self.motorista.pk)
+        lote = queryset.order_by('-fecha_hora_creacion', '-identificador_unico').values_list(
+            'identificador_unico', 'fecha_hora_creacion'
+        )[:100]
+        sql, params = lote.query.sql_with_params()
+        self.assertPlanUsaIndice(self.plan(sql, params), 'despacho_motorista_fecha_idx')
+        self.assertEqual(len(list(iterar_despachos(queryset, tam_lote=7))), 30)
+
+    def test_serie_por_hora(self):
+        hoy = timezone.localdate()
+        with CaptureQueriesContext(connection) as contexto:
+            serie = serie_despachos('hora', hoy, hoy)
+        self.assertEqual(sum(punto['total'] for punto in serie), 30)
+        self.assertPlanUsaIndice(self.plan(contexto.captured_queries[0]['sql']), 'despacho_fecha_idx', 'despacho_activos_fecha_idx')
+
+
+class BusquedaGlobalTests(TestCase):
+    """Índice de búsqueda: contenido normalizado, signals y vistas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=3)
+        Despacho.objects.filter(direccion_entrega='Dirección 0').update(paciente_nombre='José Muñoz')
+        Moto.objects.create(patente='AB-CD 12', marca='Honda', modelo='CB190')
+        reindexar_todo()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def tipos(self, texto):
+        return sorted(documento.tipo for documento in buscar(texto))
+
+    def test_busca_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.tipos('jose munoz'), ['DESPACHO'])
+        self.assertEqual(self.tipos('MUÑOZ'), ['DESPACHO'])
+
+    def test_busca_rut_y_patente_con_o_sin_puntuacion(self):
+        self.assertIn('MOTORISTA', self.tipos('11.111.111-1'))
+        self.assertIn('MOTORISTA', self.tipos('111111111'))
+        self.assertEqual(self.tipos('abcd12'), ['MOTO'])
+
+    def test_signals_mantienen_el_indice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farmacia.nombre = 'Farmacia Ahumada'
+            self.farmacia.save()
+        self.assertEqual(self.tipos('ahumada'), ['DESPACHO'] * 3 + ['FARMACIA'])
+
+        despacho = Despacho.objects.get(paciente_nombre='José Muñoz')
+        with self.captureOnCommitCallbacks(execute=True):
+            despacho.delete()
+        self.assertEqual(self.tipos('munoz'), [])
+        self.assertFalse(DocumentoBusqueda.objects.filter(tipo='DESPACHO', objeto_id=despacho.pk).exists())
+
+    def test_muchos_despachos_se_reindexan_fuera_de_la_peticion(self):
+        with mock.patch.object(busqueda, 'LIMITE_DESPACHOS_EN_LINEA', 2), \
+                mock.patch.object(busqueda, '_obtener_executor') as executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.farmacia.nombre = 'Farmacia Cruz Verde'
+            self.farmacia.save()
+        executor.return_value.submit.assert_called_once_with(
+            busqueda._reindexar_despachos_en_hilo, 'farmacia_origen_id', self.farmacia.pk
+        )
+        self.assertEqual(self.tipos('cruz verde'), ['FARMACIA'])
+
+    def test_vista_y_api(self):
+        response = self.client.get(reverse('busqueda_global'), {'q': 'Pérez'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('motorista_detalle', args=[self.motorista.pk]))
+
+        response = self.client.get(reverse('api-busqueda-list'), {'q': 'perez', 'tipo': 'motorista'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.json()['resultados']], [self.motorista.pk])
+        self.assertEqual(self.client.get(reverse('api-busqueda-list')).status_code, 400)
+
+
+class PresupuestoConsultasMixin:
+    """
+    Presupuesto de consultas por página: una vista debe ejecutar como máximo
+    `maximo` consultas, y la misma cantidad sin importar cuántas filas muestre.
+    """
+
+    def contar_consultas(self, url, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(url, params or {})
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return contexto.captured_queries
+
+    def assertPresupuestoConsultas(self, url, maximo, params=None):
+        consultas = self.contar_consultas(url, params)
+        self.assertLessEqual(
+            len(consultas), maximo,
+            f"{url} ejecutó {len(consultas)} consultas (máximo {maximo}):\n"
+            + '\n'.join(consulta['sql'] for consulta in consultas)
+        )
+        return len(consultas)
+
+
+def crear_lote_listados(admin, cantidad):
+    """`cantidad` filas de cada modelo listado, con sus relaciones."""
+    inicio = Farmacia.objects.count()
+    for i in range(inicio, inicio + cantidad):
+        usuario = User.objects.create_user(f'motorista_{i}', rol='MOTORISTA', first_name='Motorista', last_name=str(i))
+        motorista = Motorista.objects.create(
+            usuario=usuario, nombre='Motorista', apellido_paterno=str(i), apellido_materno='Test', rut=f'{i}-{i}'
+        )
+        farmacia = Farmacia.objects.create(
+            nombre=f'Farmacia {i}', direccion='Calle 1', region='REGIÓN DEL MAULE', comuna='Talca',
+            localidad='Talca', provincia='Talca', horario_recepcion_inicio=time(8), horario_recepcion_fin=time(20),
+            dias_operativos='LUN,MAR,MIE', latitud=-35.42, longitud=-71.65
+        )
+        moto = Moto.objects.create(patente=f'MOTO{i}', marca='Honda', modelo='CB190')
+        AsignacionMoto.objects.bulk_create([AsignacionMoto(motorista=motorista, moto=moto)])
+        AsignacionFarmacia.objects.bulk_create([AsignacionFarmacia(motorista=motorista, farmacia=farmacia)])
+        despacho = Despacho.objects.create(
+            farmacia_origen=farmacia, motorista_asignado=motorista,
+            direccion_entrega=f'Dirección {i}', tipo_movimiento='DIRECTO'
+        )
+        ProductoPedido.objects.create(despacho=despacho, codigo_producto=f'P{i}', nombre_producto='Producto', cantidad=1)
+        ReportDownloadHistory.objects.create(
+            user=admin, tipo_reporte='DIARIO', formato='CSV', motorista=motorista,
+            cantidad_registros=1, nombre_archivo=f'reporte_{i}.csv'
+        )
+
+
+class PresupuestoConsultasTests(PresupuestoConsultasMixin, CacheReportesTemporalMixin, TestCase):
+    """
+    Cada listado y detalle corre en O(1) consultas: con 2 y con 25 filas por
+    página ejecuta las mismas consultas, y nunca más que su presupuesto.
+    """
+    # Sesión (2 consultas) y su guardado por request (3) se cuentan en todas las vistas
+    LISTADOS = {
+        'despacho_listar': 7,
+        'motorista_listar': 7,
+        'farmacia_listar': 7,
+        'moto_listar': 7,
+        'asignacion_moto_listar': 7,
+        'asignacion_farmacia_listar': 7,
+        'reportes': 10,
+    }
+    DETALLES = {
+        'despacho_detalle': (Despacho, 7),
+        'motorista_detalle': (Motorista, 6),
+        'farmacia_detalle': (Farmacia, 6),
+        'moto_detalle': (Moto, 7),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin_presupuesto', password='clave-test', rol='ADMINISTRADOR')
+        crear_lote_listados(cls.admin, 2)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_listados_en_consultas_constantes(self):
+        pocas = {nombre: self.assertPresupuestoConsultas(reverse(nombre), maximo) for nombre, maximo in self.LISTADOS.items()}
+        crear_lote_listados(self.admin, 23)
+        for nombre, maximo in self.LISTADOS.items():
+            with self.subTest(vista=nombre):
+                self.assertEqual(self.assertPresupuestoConsultas(reverse(nombre), maximo), pocas[nombre])
+
+    def test_detalles_en_consultas_constantes(self):
+        moto = Moto.objects.first()
+        DocumentacionMoto.objects.create(moto=moto)
+        Moto.objects.filter(pk=moto.pk).update(estado='EN_MANTENIMIENTO')
+        MantenimientoMoto.objects.bulk_create([
+            MantenimientoMoto(
+                moto=moto, fecha_mantenimiento=timezone.localdate(), descripcion='Cambio de aceite',
+                tipo_servicio='PREVENTIVO', kilometraje=1000 * i
+            )
+            for i in range(5)
+        ])
+        ProductoPedido.objects.bulk_create([
+            ProductoPedido(despacho=Despacho.objects.first(), codigo_producto=f'X{i}', nombre_producto='Extra', cantidad=1)
+            for i in range(5)
+        ])
+        for nombre, (modelo, maximo) in self.DETALLES.items():
+            with self.subTest(vista=nombre):
+                self.assertPresupuestoConsultas(reverse(nombre, args=[modelo.objects.first().pk]), maximo)
+
+
+class NombreVisibleMotoristaTests(TestCase):
+    """Motorista.nombre_visible sigue al usuario y se muestra sin unir con User."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=3)
+
+    def test_se_calcula_al_crear_y_sigue_al_usuario(self):
+        self.assertEqual(self.motorista.nombre_visible, 'Ana Pérez')
+        usuario = self.motorista.usuario
+        usuario.first_name = 'Anita'
+        usuario.save()
+        self.motorista.refresh_from_db()
+        self.assertEqual(self.motorista.nombre_visible, 'Anita Pérez')
+
+        usuario.first_name = usuario.last_name = ''
+        usuario.save(update_fields=['first_name', 'last_name'])
+        self.motorista.refresh_from_db()
+        self.assertEqual(self.motorista.nombre_completo, 'motorista_test')
+
+    def test_nombre_sin_consultar_usuario(self):
+        despacho = Despacho.objects.select_related('motorista_asignado').first()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(despacho.motorista_asignado), 'Ana Pérez - 11111111-1')
+        fila = next(iterar_despachos(despachos_reporte()))
+        self.assertEqual(nombre_motorista(fila), 'Ana Pérez')
+
+    def test_comando_de_backfill(self):
+        Motorista.objects.update(nombre_visible='')
+        call_command('sincronizar_nombres_motorista', stdout=StringIO())
+        self.motorista.refresh_from_db()
+        self.assertEqual(self.motorista.nombre_visible, 'Ana Pérez')
+
+    def test_filtro_por_nombre_o_apellido(self):
+        self.client.force_login(self.admin)
+        for texto, esperados in (('ana', 3), ('pérez', 3), ('Soto', 0)):
+            with self.subTest(texto=texto):
+                response = self.client.get(reverse('despacho_listar'), {'motorista': texto})
+                self.assertEqual(len(response.context['despachos']), esperados)
+
+
+class ApiDespachoCamposTests(PresupuestoConsultasMixin, TestCase):
+    """?fields= / ?expand= en la API de despachos y sus consultas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin_api', password='clave-test', rol='ADMINISTRADOR')
+        crear_lote_listados(cls.admin, 2)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('api-despacho-list')
+
+    def test_listado_plano_y_campos_dispersos(self):
+        # Por defecto el listado mantiene la forma anidada del detalle
+        fila = self.client.get(self.url).json()['results'][0]
+        self.assertEqual(fila['farmacia_origen']['nombre'], 'Farmacia 1')
+        self.assertEqual(fila['motorista_asignado']['nombre_visible'], 'Motorista 1')
+
+        fila = self.client.get(self.url, {'view': 'flat'}).json()['results'][0]
+        self.assertIsInstance(fila['farmacia_origen'], int)
+        self.assertEqual(fila['motorista_nombre'], 'Motorista 1')
+
+        params = {'view': 'flat', 'fields': 'identificador_unico,estado', 'expand': 'productos'}
+        fila = self.client.get(self.url, params).json()['results'][0]
+        self.assertEqual(set(fila), {'identificador_unico', 'estado', 'productos'})
+        self.assertEqual(fila['productos'][0]['codigo_producto'], 'P1')
+
+    def test_expand_en_consultas_constantes(self):
+        params = {'view': 'flat', 'expand': 'farmacia_origen,motorista_asignado,productos'}
+        # 9 = 5 de sesión + sellos de versión (ETag) + despachos + productos + COUNT
+        pocas = self.assertPresupuestoConsultas(self.url, 9, params)
+        crear_lote_listados(self.admin, 23)
+        self.assertEqual(self.assertPresupuestoConsultas(self.url, 9, params), pocas)
+        fila = self.client.get(self.url, params).json()['results'][0]
+        self.assertEqual(fila['motorista_asignado']['usuario']['username'], 'motorista_24')
+
+    def test_campos_dispersos_no_recortan_la_escritura(self):
+        url = f'{self.url}?fields=identificador_unico'
+        datos = {
+            'farmacia_origen_id': Farmacia.objects.first().pk, 'motorista_asignado_id': Motorista.objects.first().pk,
+            'direccion_entrega': 'Calle 20', 'tipo_movimiento': 'DIRECTO', 'productos': [],
+        }
+        response = self.client.post(url, datos, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.json())
+        self.assertTrue(Despacho.objects.filter(direccion_entrega='Calle 20').exists())
+
+        response = self.client.post(url, {'direccion_entrega': 'Calle 21'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('farmacia_origen_id', response.json())
+
+
+class ApiDespachosMasivosTests(TestCase):
+    """Carga masiva y cambio de estado en lote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=0)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def item(self, **extra):
+        datos = {
+            'farmacia_origen_id': self.farmacia.pk, 'motorista_asignado_id': self.motorista.pk,
+            'direccion_entrega': 'Calle 2', 'tipo_movimiento': 'DIRECTO',
+            'productos': [{'codigo_producto': 'A1', 'nombre_producto': 'Paracetamol', 'cantidad': 2}],
+        }
+        datos.update(extra)
+        return datos
+
+    def test_crear_masivo(self):
+        items = [self.item(paciente_nombre=f'Paciente {i}') for i in range(40)]
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as contexto:
+            response = self.client.post(reverse('api-despacho-crear-masivo'), items, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 40)
+        self.assertLess(len(contexto.captured_queries), 40)
+        self.assertEqual(ProductoPedido.objects.filter(despacho_id__in=response.json()['ids']).count(), 40)
+        self.assertEqual(ResumenDiarioDespacho.objects.aggregate(total=Sum('cantidad'))['total'], 40)
+        self.assertEqual(DocumentoBusqueda.objects.filter(tipo='DESPACHO').count(), 40)
+
+    def test_crear_masivo_es_todo_o_nada(self):
+        items = [self.item(), self.item(motorista_asignado_id=999999), self.item(productos=[])]
+        response = self.client.post(reverse('api-despacho-crear-masivo'), items, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Despacho.objects.exists())
+        self.assertEqual(list(response.json()['errors']), ['2'])
+
+        items = [self.item(), self.item(motorista_asignado_id=999999)]
+        errores = self.client.post(reverse('api-despacho-crear-masivo'), items, content_type='application/json').json()['errors']
+        self.assertEqual(list(errores), ['1'])
+        self.assertIn('motorista_asignado_id', errores['1'])
+        self.assertFalse(Despacho.objects.exists())
+
+    def test_cambiar_estado_masivo(self):
+        Despacho.objects.bulk_create([
+            Despacho(farmacia_origen=self.farmacia, motorista_asignado=self.motorista,
+                     direccion_entrega='Calle 3', tipo_movimiento='DIRECTO', estado=estado)
+            for estado in ('PENDIENTE', 'PENDIENTE', 'ENTREGADO')
+        ])
+        pendiente, en_cadena, entregado = Despacho.objects.order_by('pk')
+        cambios = [
+            {'id': pendiente.pk, 'estado': 'EN_RUTA'},
+            {'id': en_cadena.pk, 'estado': 'EN_RUTA'},
+            {'id': en_cadena.pk, 'estado': 'ENTREGADO'},
+            {'id': entregado.pk, 'estado': 'EN_RUTA'},
+            {'id': 999999, 'estado': 'EN_RUTA'},
+        ]
+        response = self.client.post(reverse('api-despacho-cambiar-estado-masivo'), cambios, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['ok'] for r in response.json()['results']], [True, True, True, False, False])
+        self.assertEqual(
+            dict(Despacho.objects.values_list('pk', 'estado')),
+            {pendiente.pk: 'EN_RUTA', en_cadena.pk: 'ENTREGADO', entregado.pk: 'ENTREGADO'}
+        )
+        en_cadena.refresh_from_db()
+        self.assertEqual(en_cadena.version, 2)
+        self.assertIsNotNone(en_cadena.fecha_hora_salida_farmacia)
+        self.assertEqual(
+            list(TransicionDespacho.objects.filter(despacho=en_cadena).values_list('estado_anterior', 'estado_nuevo')),
+            [('PENDIENTE', 'EN_RUTA'), ('EN_RUTA', 'ENTREGADO')]
+        )
+
+
+class ApiRenderCompresionTests(TestCase):
+    """Renderer JSON rápido y compresión de respuestas de la API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin_api', password='clave-test', rol='ADMINISTRADOR')
+        crear_lote_listados(cls.admin, 25)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('api-despacho-list')
+
+    def test_renderer_igual_al_de_drf(self):
+        datos = self.client.get(self.url).data
+        datos['extra'] = {'monto': Decimal('10.50'), 'fecha': timezone.now(), 'texto': 'línea nueva'}
+        self.assertEqual(FastJSONRenderer().render(datos), JSONRenderer().render(datos))
+        self.assertEqual(FastJSONParser().parse(BytesIO(JSONRenderer().render(datos))), json.loads(JSONRenderer().render(datos)))
+
+    def test_respuesta_grande_comprimida(self):
+        plana = self.client.get(self.url)
+        self.assertFalse(plana.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plana['Vary'])
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertLess(len(response.content), len(plana.content) / 3)
+        self.assertEqual(gzip.decompress(response.content), plana.content)
+
+        # Fuera de la API y bajo el umbral no se comprime
+        self.assertFalse(self.client.get(reverse('despacho_listar'), HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+        pequena = self.client.get(self.url, {'fields': 'identificador_unico', 'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(pequena.has_header('Content-Encoding'))
+
+
+class GetCondicionalTests(TestCase):
+    """ETag / Last-Modified en la API y los dashboards, con 304 sin serializar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin_etag', password='clave-test', rol='ADMINISTRADOR')
+        crear_lote_listados(cls.admin, 2)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def cambiar(self, objeto, **campos):
+        with self.captureOnCommitCallbacks(execute=True):
+            for campo, valor in campos.items():
+                setattr(objeto, campo, valor)
+            objeto.save()
+
+    def test_listado_304_y_cambios(self):
+        url = reverse('api-despacho-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        # Sin Last-Modified: If-Modified-Since no puede dar un 304 viejo
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code, 200)
+
+        with CaptureQueriesContext(connection) as contexto:
+            no_modificada = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(no_modificada.status_code, 304)
+        self.assertEqual(no_modificada.content, b'')
+        self.assertFalse([c for c in contexto.captured_queries if 'App_despacho' in c['sql']])
+        # Otra vista del mismo listado tiene su propio ETag
+        self.assertNotEqual(self.client.get(url, {'fields': 'estado'})['ETag'], etag)
+        # La versión comprimida (ETag débil) también se reconoce
+        params = {'expand': 'farmacia_origen,motorista_asignado,productos'}
+        comprimida = self.client.get(url, params, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(comprimida['ETag'].startswith('W/'))
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=comprimida['ETag']).status_code, 304)
+
+        # El nombre de la farmacia se muestra en el listado
+        self.cambiar(Farmacia.objects.first(), nombre='Farmacia Renombrada')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detalle_por_objeto(self):
+        primero, segundo = Despacho.objects.order_by('pk')
+        url = reverse('api-despacho-detail', args=[primero.pk])
+        etag = self.client.get(url)['ETag']
+
+        self.cambiar(segundo, estado='EN_RUTA')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductoPedido.objects.create(despacho=primero, codigo_producto='X1', nombre_producto='Nuevo', cantidad=1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('api-despacho-detail', args=[999999])).status_code, 404)
+
+    def test_motos_y_farmacias(self):
+        for nombre in ('api-moto-list', 'api-farmacia-list'):
+            response = self.client.get(reverse(nombre))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get(reverse(nombre), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        moto = Moto.objects.first()
+        url = reverse('api-moto-detail', args=[moto.pk])
+        ultima = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=ultima).status_code, 304)
+        self.cambiar(moto, color='Rojo')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"otro"').json()['color'], 'Rojo')
+
+    def test_dashboard_304(self):
+        url = reverse('dashboard_general')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.cambiar(Despacho.objects.first(), estado='ENTREGADO')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class AsignacionTurnoTests(TestCase):
+    """Carga de turno en lote: todo o nada, con conflictos informados."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin_turno', password='clave-test', rol='ADMINISTRADOR')
+        crear_lote_listados(cls.admin, 3)
+        cls.motoristas = list(Motorista.objects.order_by('pk'))
+        cls.motos = list(Moto.objects.order_by('pk'))
+        cls.farmacias = list(Farmacia.objects.order_by('pk'))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('api-asignacion-moto-turno')
+
+    def activas(self):
+        return dict(AsignacionMoto.objects.filter(activa=True).values_list('motorista_id', 'moto_id'))
+
+    def test_intercambio_de_motos_y_farmacias(self):
+        m, motos, farmacias = self.motoristas, self.motos, self.farmacias
+        turno = [
+            {'motorista': m[0].pk, 'moto': motos[1].pk, 'farmacia': farmacias[2].pk},
+            {'motorista': m[1].pk, 'moto': motos[0].pk},
+            {'motorista': m[2].pk, 'moto': motos[2].pk, 'farmacia': farmacias[2].pk},
+        ]
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as contexto:
+            response = self.client.post(self.url, turno, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json()['motos_asignadas'], 2)
+        self.assertEqual(response.json()['farmacias_asignadas'], 1)
+        self.assertLess(len(contexto.captured_queries), 25)
+
+        self.assertEqual(self.activas(), {m[0].pk: motos[1].pk, m[1].pk: motos[0].pk, m[2].pk: motos[2].pk})
+        self.assertEqual(AsignacionMoto.objects.filter(activa=False, fecha_desasignacion__isnull=False).count(), 2)
+        self.assertEqual(
+            AsignacionFarmacia.objects.get(motorista=m[0], activa=True).farmacia_id, farmacias[2].pk
+        )
+        self.assertEqual(set(Moto.objects.values_list('estado', flat=True)), {'OCUPADO', 'OPERATIVO'})
+        self.assertEqual(Moto.objects.get(pk=motos[0].pk).estado, 'OCUPADO')
+
+    def test_conflictos_no_cambian_nada(self):
+        m, motos = self.motoristas, self.motos
+        antes = self.activas()
+        turno = [
+            # La moto 2 la tiene el motorista 2, que no está en el turno
+            {'motorista': m[0].pk, 'moto': motos[2].pk},
+            {'motorista': m[1].pk, 'moto': 999999},
+            {'motorista': m[1].pk},
+        ]
+        response = self.client.post(self.url, turno, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            [(c['indice'], c['detail'].split()[0]) for c in response.json()['conflictos']],
+            [(0, 'Moto'), (1, 'Moto'), (2, 'Motorista')]
+        )
+        self.assertEqual(self.activas(), antes)
+
+
+class EstadosDespachoTests(TestCase):
+    """Cambios de estado con UPDATE condicional, versión y registro de transiciones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=0)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.despacho = Despacho.objects.create(
+            farmacia_origen=self.farmacia, motorista_asignado=self.motorista,
+            direccion_entrega='Calle 9', tipo_movimiento='DIRECTO'
+        )
+        self.url = reverse('api-despacho-cambiar-estado', args=[self.despacho.pk])
+
+    def test_api_con_version(self):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as contexto:
+            response = self.client.post(self.url, {'estado': 'EN_RUTA', 'version': 0}, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual((response.json()['estado'], response.json()['version']), ('EN_RUTA', 1))
+        self.assertIsNotNone(response.json()['fecha_hora_salida_farmacia'])
+        self.assertIsNotNone(response.json()['fecha_hora_despacho'])
+        updates = [c['sql'] for c in contexto.captured_queries if c['sql'].startswith('UPDATE "App_despacho"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('direccion_entrega', updates[0])
+
+        transicion = TransicionDespacho.objects.get(despacho=self.despacho)
+        self.assertEqual((transicion.estado_anterior, transicion.estado_nuevo, transicion.usuario), ('PENDIENTE', 'EN_RUTA', self.admin))
+
+        # Versión vieja: 409 y nada cambia
+        response = self.client.post(self.url, {'estado': 'ENTREGADO', 'version': 0}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(self.url, {'estado': 'PENDIENTE'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.despacho.refresh_from_db()
+        self.assertEqual((self.despacho.estado, self.despacho.version), ('EN_RUTA', 1))
+
+    def test_escritura_concurrente_no_se_pierde(self):
+        # Un supervisor leyó PENDIENTE; entremedio el motorista salió a ruta
+        leido = Despacho.objects.get(pk=self.despacho.pk)
+        transicionar(self.despacho.pk, 'EN_RUTA')
+        with self.assertRaises(ConflictoDeVersion):
+            transicionar(leido.pk, 'ANULADO', desde=leido.estado)
+        self.assertEqual(Despacho.objects.get(pk=self.despacho.pk).estado, 'EN_RUTA')
+
+        response = self.client.post(reverse('despacho_anular', args=[self.despacho.pk]))
+        self.assertRedirects(response, reverse('despacho_listar'), fetch_redirect_response=False)
+        self.assertEqual(Despacho.objects.get(pk=self.despacho.pk).estado, 'ANULADO')
+        self.assertEqual(
+            list(TransicionDespacho.objects.filter(despacho=self.despacho).values_list('estado_nuevo', flat=True)),
+            ['EN_RUTA', 'ANULADO']
+        )
+
+    def test_api_y_formulario_no_cambian_el_estado(self):
+        url = reverse('api-despacho-detail', args=[self.despacho.pk])
+        response = self.client.patch(url, {'estado': 'ENTREGADO'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json()['estado'], 'PENDIENTE')
+
+        self.assertNotIn('estado', DespachoForm().fields)
+        AsignacionFarmacia.objects.bulk_create([AsignacionFarmacia(motorista=self.motorista, farmacia=self.farmacia, activa=True)])
+        invalidar_recomendaciones()
+        datos = {
+            'farmacia_origen': self.farmacia.pk, 'motorista_asignado': self.motorista.pk,
+            'direccion_entrega': 'Calle 12', 'tipo_movimiento': 'CON_RECETA', 'estado': 'ENTREGADO',
+        }
+        response = self.client.post(reverse('despacho_editar', args=[self.despacho.pk]), datos)
+        self.assertRedirects(response, reverse('despacho_listar'), fetch_redirect_response=False)
+
+        self.despacho.refresh_from_db()
+        self.assertEqual((self.despacho.direccion_entrega, self.despacho.estado), ('Calle 12', 'PENDIENTE'))
+        self.assertFalse(TransicionDespacho.objects.filter(despacho=self.despacho).exists())
+
+
+class EventosDespachoTests(TestCase):
+    """DespachoEvento: escritura en cada cambio de estado, tiempos de entrega y compactación."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=0)
+
+    def nuevo_despacho(self):
+        return Despacho.objects.create(
+            farmacia_origen=self.farmacia, motorista_asignado=self.motorista,
+            direccion_entrega='Calle 10', tipo_movimiento='DIRECTO'
+        )
+
+    def codigos(self, despacho):
+        return list(DespachoEvento.objects.filter(despacho=despacho).values_list('estado_anterior', 'estado'))
+
+    def test_eventos_y_tiempos_de_entrega(self):
+        despacho = self.nuevo_despacho()
+        for estado in ('EN_RUTA', 'INCIDENCIA', 'ENTREGADO'):
+            transicionar(despacho.pk, estado)
+        self.assertEqual(self.codigos(despacho), [(0, 1), (1, 2), (2, 4), (4, 3)])
+
+        ahora = timezone.now()
+        with CaptureQueriesContext(connection) as contexto:
+            tiempos = tiempos_entrega(ahora - timedelta(days=1), ahora + timedelta(days=1))
+        self.assertFalse([c for c in contexto.captured_queries if '"App_despacho"' in c['sql']])
+        self.assertEqual((tiempos['entregados'], tiempos['con_incidencia']), (1, 1))
+        self.assertEqual(tiempos['total']['cantidad'], 1)
+        self.assertGreaterEqual(tiempos['en_ruta']['promedio'], 0)
+
+    def test_cambios_en_lote_y_con_save(self):
+        en_lote = self.nuevo_despacho()
+        cambiar_estados([{'id': en_lote.pk, 'estado': estado} for estado in ('EN_RUTA', 'INCIDENCIA', 'EN_RUTA')])
+        # El camino vuelve a EN_RUTA sin repetir la clave (despacho, fecha_hora, estado)
+        self.assertEqual(self.codigos(en_lote), [(0, 1), (1, 2), (2, 4), (4, 2)])
+
+        editado = self.nuevo_despacho()
+        editado.direccion_entrega = 'Calle 11'
+        editado.save()
+        editado.estado = 'ANULADO'
+        editado.save()
+        self.assertEqual(self.codigos(editado), [(0, 1), (1, 5)])
+
+        # El estado anterior viene de la carga: guardar no vuelve a leer el despacho
+        cargado = Despacho.objects.get(pk=self.nuevo_despacho().pk)
+        cargado.estado = 'EN_RUTA'
+        with CaptureQueriesContext(connection) as contexto:
+            cargado.save()
+        self.assertFalse([c for c in contexto.captured_queries if c['sql'].startswith('SELECT "App_despacho"')])
+        self.assertEqual(self.codigos(cargado), [(0, 1), (1, 2)])
+
+        diferido = Despacho.objects.defer('estado').get(pk=cargado.pk)
+        diferido.estado = 'ENTREGADO'
+        diferido.save()
+        self.assertEqual(self.codigos(diferido), [(0, 1), (1, 2), (2, 3)])
+
+    def test_despacho_creado_entregado(self):
+        creado = Despacho.objects.create(
+            farmacia_origen=self.farmacia, motorista_asignado=self.motorista,
+            direccion_entrega='Calle 13', tipo_movimiento='DIRECTO', estado='ENTREGADO',
+        )
+        self.assertEqual(self.codigos(creado), [(0, 3)])
+        ahora = timezone.now()
+        tiempos = tiempos_entrega(ahora - timedelta(days=1), ahora + timedelta(days=1))
+        self.assertEqual(tiempos['entregados'], 1)
+        self.assertEqual((tiempos['total']['cantidad'], tiempos['total']['promedio']), (1, 0))
+        self.assertEqual(tiempos['en_ruta']['cantidad'], 0)
+
+        # Sin transiciones registradas, la migración 0012 no inventa una creación ya entregada
+        migracion = importlib.import_module('App.migrations.0012_eventos_despacho')
+        DespachoEvento.objects.all().delete()
+        migracion.poblar_eventos(apps, None)
+        self.assertEqual(self.codigos(creado), [(0, 1), (1, 3)])
+
+    def test_compactar_archiva_meses_antiguos(self):
+        reciente = self.nuevo_despacho()
+        antiguo = datetime(2020, 3, 15, 12, tzinfo=dt_timezone.utc)
+        DespachoEvento.objects.bulk_create([
+            DespachoEvento.de_transicion(reciente.pk, 'PENDIENTE', 'EN_RUTA', antiguo),
+            DespachoEvento.de_transicion(reciente.pk, 'EN_RUTA', 'ENTREGADO', antiguo + timedelta(days=40)),
+            # Despacho que ya no existe
+            DespachoEvento.de_transicion(reciente.pk + 1000, None, 'PENDIENTE', timezone.now()),
+        ])
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+
+        salida = StringIO()
+        call_command('compactar_eventos_despacho', '--meses', '6', '--directorio', directorio, stdout=salida)
+
+        self.assertEqual(self.codigos(reciente), [(0, 1)])
+        self.assertFalse(DespachoEvento.objects.filter(despacho_id=reciente.pk + 1000).exists())
+        with gzip.open(f'{directorio}/eventos_despacho_2020-03.csv.gz', 'rt') as archivo:
+            filas = archivo.read().splitlines()
+        self.assertEqual(len(filas), 2)
+        self.assertTrue(filas[1].startswith(f'{reciente.pk},2020-03-15'))
+        self.assertIn('2020-04: 1 eventos archivados', salida.getvalue())
+
+
+class RecomendacionMotoristasTests(TestCase):
+    """Ranking de motoristas por cercanía de su farmacia y despachos abiertos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.origen, cls.cercano = crear_datos_base(cantidad_despachos=0)
+
+        def farmacia(nombre, latitud, longitud):
+            return Farmacia.objects.create(
+                nombre=nombre, direccion='Calle 2', region='REGIÓN DEL MAULE', comuna='Talca', localidad='Talca',
+                provincia='Talca', horario_recepcion_inicio=time(8), horario_recepcion_fin=time(20),
+                dias_operativos='LUN', latitud=latitud, longitud=longitud,
+            )
+
+        def motorista(nombre, rut, **extra):
+            return Motorista.objects.create(
+                nombre=nombre, apellido_paterno='Rojas', apellido_materno='Vera', rut=rut, **extra
+            )
+
+        vecina = farmacia('Vecina', Decimal('-35.447'), Decimal('-71.65'))  # ~3 km
+        lejana = farmacia('Lejana', Decimal('-35.78'), Decimal('-71.65'))  # ~40 km
+        fuera = farmacia('Fuera de radio', Decimal('-37.0'), Decimal('-72.0'))
+        cls.vecino = motorista('Beto', '22222222-2')
+        cls.lejano = motorista('Carla', '33333333-3')
+        fuera_de_radio = motorista('Dario', '44444444-4')
+        inactivo = motorista('Eva', '55555555-5', activo=False)
+        AsignacionFarmacia.objects.bulk_create([
+            AsignacionFarmacia(motorista=cls.cercano, farmacia=cls.origen, activa=True),
+            AsignacionFarmacia(motorista=cls.vecino, farmacia=vecina, activa=True),
+            AsignacionFarmacia(motorista=cls.lejano, farmacia=lejana, activa=True),
+            AsignacionFarmacia(motorista=fuera_de_radio, farmacia=fuera, activa=True),
+            AsignacionFarmacia(motorista=inactivo, farmacia=cls.origen, activa=True),
+        ])
+        # El motorista de la farmacia de origen tiene dos despachos abiertos (0 km + 2 x 2 km)
+        Despacho.objects.bulk_create([
+            Despacho(farmacia_origen=cls.origen, motorista_asignado=cls.cercano, direccion_entrega='Calle 3',
+                     tipo_movimiento='DIRECTO', estado=estado)
+            for estado in ('PENDIENTE', 'EN_RUTA', 'ENTREGADO')
+        ])
+
+    def setUp(self):
+        invalidar_recomendaciones()
+        self.client.force_login(self.admin)
+        self.url = reverse('api-farmacia-motoristas-recomendados', args=[self.origen.pk])
+
+    def test_ranking_api_y_formulario(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        resultados = response.json()['results']
+        self.assertEqual(
+            [r['motorista_id'] for r in resultados],
+            [self.vecino.pk, self.cercano.pk, self.lejano.pk],
+        )
+        self.assertEqual((resultados[1]['distancia_km'], resultados[1]['despachos_abiertos']), (0, 2))
+
+        # Índice y cargas ya construidos: solo se leen los sellos
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(self.url)
+        self.assertEqual(len([c for c in contexto.captured_queries if 'App_versioncoleccion' in c['sql']]), 1)
+        self.assertFalse([c for c in contexto.captured_queries if 'App_asignacionfarmacia' in c['sql']])
+
+        formulario = DespachoForm(data={'farmacia_origen': self.origen.pk})
+        self.assertEqual(
+            list(formulario.fields['motorista_asignado'].queryset.values_list('pk', flat=True)),
+            [self.vecino.pk, self.cercano.pk, self.lejano.pk],
+        )
+
+        self.assertEqual(self.client.get(self.url, {'limite': 'x'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse('api-farmacia-motoristas-recomendados', args=[9999])).status_code, 404
+        )
+
+    def test_nuevo_despacho_cambia_la_carga(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Despacho.objects.create(
+                farmacia_origen=self.origen, motorista_asignado=self.vecino,
+                direccion_entrega='Calle 4', tipo_movimiento='DIRECTO',
+            )
+        resultados = self.client.get(self.url, {'limite': 2}).json()['results']
+        self.assertEqual([r['motorista_id'] for r in resultados], [self.cercano.pk, self.vecino.pk])
+
+
+class EstimacionLlegadaTests(TestCase):
+    """fecha_hora_estimada_llegada calculada por lote al crear despachos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def despacho(self, **extra):
+        return Despacho(
+            farmacia_origen=self.farmacia, motorista_asignado=self.motorista,
+            direccion_entrega='Calle 12', tipo_movimiento='DIRECTO', **extra
+        )
+
+    def test_por_distancia_en_lote(self):
+        creacion = timezone.now()
+        # ~10 km al sur de la farmacia, a la velocidad por defecto (25 km/h): 10 x 1,3 / 25 h + 5 min
+        despachos = [
+            self.despacho(latitud_entrega=Decimal('-35.51'), longitud_entrega=Decimal('-71.65'), fecha_hora_creacion=creacion)
+            for _ in range(200)
+        ]
+        # Farmacias, velocidades y medianas históricas: tres consultas para todo el lote
+        with self.assertNumQueries(3):
+            llegadas = estimar_llegadas(despachos)
+        self.assertEqual(set(llegadas), {creacion + timedelta(minutes=36)})
+
+        # Sin punto de entrega ni historia no hay estimación
+        self.assertEqual(estimar_llegadas([self.despacho()]), [None])
+
+    def test_historia_al_crear(self):
+        entregados = Despacho.objects.bulk_create([self.despacho() for _ in range(5)])
+        inicio = timezone.now() - timedelta(days=1)
+        DespachoEvento.objects.bulk_create([
+            evento
+            for despacho in entregados
+            for evento in (
+                DespachoEvento.de_transicion(despacho.pk, None, 'PENDIENTE', inicio),
+                DespachoEvento.de_transicion(despacho.pk, 'PENDIENTE', 'EN_RUTA', inicio + timedelta(minutes=10)),
+                DespachoEvento.de_transicion(despacho.pk, 'EN_RUTA', 'ENTREGADO', inicio + timedelta(minutes=30)),
+            )
+        ])
+
+        # Sin punto de entrega: mediana de preparación (10) + mediana en ruta (20)
+        creado = Despacho.objects.create(
+            farmacia_origen=self.farmacia, motorista_asignado=self.motorista,
+            direccion_entrega='Calle 13', tipo_movimiento='DIRECTO'
+        )
+        # La estimación se calcula en pre_save, un instante antes de que auto_now_add fije la creación
+        diferencia = creado.fecha_hora_estimada_llegada - creado.fecha_hora_creacion
+        self.assertLess(abs(diferencia - timedelta(minutes=30)), timedelta(seconds=1))
+
+        # La fecha ingresada a mano se respeta
+        manual = timezone.now() + timedelta(hours=3)
+        creado = Despacho.objects.create(
+            farmacia_origen=self.farmacia, motorista_asignado=self.motorista,
+            direccion_entrega='Calle 14', tipo_movimiento='DIRECTO', fecha_hora_estimada_llegada=manual
+        )
+        self.assertEqual(creado.fecha_hora_estimada_llegada, manual)
+
+    def test_mediana_cero_no_cae_en_la_general(self):
+        cache.set(CLAVE_HISTORIA, {
+            self.farmacia.pk: {'hasta_salida': 0.0, 'en_ruta': 0.0},
+            None: {'hasta_salida': 10.0, 'en_ruta': 20.0},
+        })
+        creacion = timezone.now()
+        self.assertEqual(estimar_llegadas([self.despacho(fecha_hora_creacion=creacion)]), [creacion])
+
+    def test_minutos_python_calculados_a_mano(self):
+        nan = float('nan')
+        # 1 grado de longitud en el ecuador: pi / 180 x 6371 km
+        km = math.pi / 180 * 6371
+        minutos = _minutos_python(
+            [(0.0, 0.0), (0.0, 0.0), (0.0, 0.0)], [(0.0, 1.0), (nan, nan), (nan, nan)],
+            [25.0, 25.0, 25.0], [nan, 18.0, nan], [10.0, 4.0, 0.0],
+        )
+        self.assertAlmostEqual(minutos[0], km * 1.3 / 25 * 60 + 5 + 10, places=6)
+        self.assertEqual(minutos[1:], [22.0, None])
+
+    @skipUnless(NUMPY_DISPONIBLE, 'requiere numpy')
+    def test_numpy_y_python_coinciden(self):
+        nan = float('nan')
+        argumentos = (
+            [(-35.4264, -71.6554), (-35.4264, -71.6554), (nan, nan), (-33.45, -70.66)],
+            [(-35.447, -71.65), (nan, nan), (-35.447, -71.65), (nan, nan)],
+            [25.0, 40.0, 25.0, 30.0],
+            [nan, 18.0, 22.0, nan],
+            [10.0, 0.0, 5.0, 0.0],
+        )
+        con_numpy, con_python = _minutos_numpy(*argumentos), _minutos_python(*argumentos)
+        self.assertEqual([valor is None for valor in con_numpy], [False, False, False, True])
+        self.assertEqual([valor is None for valor in con_python], [False, False, False, True])
+        for valor_numpy, valor_python in zip(con_numpy[:3], con_python[:3]):
+            self.assertAlmostEqual(valor_numpy, valor_python, places=6)
+
+
+class MetricasDashboardTests(TestCase):
+    """metricas_generales (resumen diario, agregación condicional) coincide con contar Despacho por estado."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=20)
+        Despacho.objects.filter(direccion_entrega__in=['Dirección 0', 'Dirección 1']).update(estado='INCIDENCIA')
+        # Entregas con duración en minutos enteros (el cálculo anterior sumaba minutos truncados)
+        salida = timezone.now() - timedelta(hours=2)
+        for minutos, despacho in zip((20, 35, 50), Despacho.objects.filter(estado='ENTREGADO')):
+            Despacho.objects.filter(pk=despacho.pk).update(
+                fecha_hora_despacho=salida, fecha_hora_estimada_llegada=salida + timedelta(minutes=minutos)
+            )
+        Moto.objects.create(patente='MT-01', marca='Honda', modelo='CB190')
+        recalcular_todo()
+
+    def test_coincide_con_conteos_por_estado(self):
+        metricas = metricas_generales()
+        con_tiempo = Despacho.objects.filter(
+            estado='ENTREGADO', fecha_hora_estimada_llegada__isnull=False, fecha_hora_despacho__isnull=False
+        )
+        minutos = [int((d.fecha_hora_estimada_llegada - d.fecha_hora_despacho).total_seconds() / 60) for d in con_tiempo]
+        esperado = {
+            'total_despachos': Despacho.objects.count(),
+            'despachos_pendientes': Despacho.objects.filter(estado='PENDIENTE').count(),
+            'despachos_en_ruta': Despacho.objects.filter(estado='EN_RUTA').count(),
+            'despachos_entregados': Despacho.objects.filter(estado='ENTREGADO').count(),
+            'despachos_incidencias': Despacho.objects.filter(estado='INCIDENCIA').count(),
+            'despachos_recientes': Despacho.objects.filter(
+                fecha_hora_creacion__date__gte=timezone.localdate() - timedelta(days=6)
+            ).count(),
+            'tiempo_promedio': sum(minutos) // len(minutos),
+            'motoristas_total': Motorista.objects.count(),
+            'motoristas_activos': Motorista.objects.filter(licencia_vigente=True).count(),
+            'motos_total': Moto.objects.count(),
+            'motos_disponibles': Moto.objects.filter(estado='OPERATIVO').count(),
+            'farmacias_total': Farmacia.objects.count(),
+        }
+        self.assertEqual(metricas, esperado)
+        self.assertEqual(metricas['despachos_incidencias'], 2)
+        self.assertEqual(metricas['tiempo_promedio'], 35)
+
+
+class ResumenDiarioTests(TestCase):
+    """ResumenDiarioDespacho: recálculo por día y recálculo al confirmar desde los signals."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=9)
+
+    def conteos(self):
+        return dict(ResumenDiarioDespacho.objects.values_list('estado').annotate(total=Sum('cantidad')))
+
+    def test_recalcular_dia_reemplaza_conteos(self):
+        hoy = timezone.localdate()
+        recalcular_dia(hoy)
+        self.assertEqual(self.conteos(), {'PENDIENTE': 3, 'EN_RUTA': 3, 'ENTREGADO': 3})
+
+        Despacho.objects.filter(estado='PENDIENTE').update(estado='INCIDENCIA')
+        recalcular_dia(hoy)
+        self.assertEqual(self.conteos(), {'INCIDENCIA': 3, 'EN_RUTA': 3, 'ENTREGADO': 3})
+        # Cada recálculo cambia el sello del resumen
+        self.assertEqual(VersionColeccion.objects.get(nombre='resumen_diario').version, 2)
+
+    def test_signal_recalcula_una_vez_por_dia_y_transaccion(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for i in range(3):
+                Despacho.objects.create(
+                    farmacia_origen=self.farmacia, motorista_asignado=self.motorista,
+                    direccion_entrega=f'Nueva {i}', tipo_movimiento='DIRECTO'
+                )
+        recalculos = [funcion for funcion in callbacks if hasattr(funcion, 'dia_resumen')]
+        self.assertEqual(len(recalculos), 1)
+        self.assertEqual(recalculos[0].dia_resumen, timezone.localdate())
+        self.assertEqual(self.conteos(), {'PENDIENTE': 6, 'EN_RUTA': 3, 'ENTREGADO': 3})
+
+    def test_signal_recalcula_al_eliminar(self):
+        recalcular_dia(timezone.localdate())
+        despacho = Despacho.objects.filter(estado='EN_RUTA').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            despacho.delete()
+        self.assertEqual(self.conteos()['EN_RUTA'], 2)
+
+    def test_despachos_recientes_son_siete_dias_calendario(self):
+        ahora = timezone.now()
+        pks = list(Despacho.objects.values_list('pk', flat=True)[:3])
+        for pk, dias in zip(pks, (6, 7, 8)):
+            Despacho.objects.filter(pk=pk).update(fecha_hora_creacion=ahora - timedelta(days=dias))
+        recalcular_todo()
+        self.assertEqual(metricas_despachos()['despachos_recientes'], 7)
+
+
+class CacheDashboardTests(TestCase):
+    """Contextos de dashboard: se reutilizan y se invalidan al guardar cualquier modelo que resumen."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=3)
+        cls.moto = Moto.objects.create(patente='CD-01', marca='Honda', modelo='CB190')
+
+    def setUp(self):
+        cache.clear()
+        self.construidos = 0
+
+    def constructor(self):
+        self.construidos += 1
+        return {'construido': self.construidos}
+
+    def test_reutiliza_el_contexto(self):
+        self.assertEqual(obtener_contexto('general', self.constructor), {'construido': 1})
+        self.assertEqual(obtener_contexto('general', self.constructor), {'construido': 1})
+        self.assertEqual(self.construidos, 1)
+        # Con otra versión (otro proceso hizo cambios) se recalcula
+        self.assertEqual(obtener_contexto('general', self.constructor, version='v2'), {'construido': 2})
+
+    def test_invalida_al_guardar_cada_modelo(self):
+        guardados = {
+            'Despacho': lambda: Despacho.objects.first().save(),
+            'Moto': lambda: self.moto.save(),
+            'Motorista': lambda: self.motorista.save(),
+            'Farmacia': lambda: self.farmacia.save(),
+            'AsignacionMoto': lambda: AsignacionMoto.objects.create(moto=self.moto, motorista=self.motorista),
+            'AsignacionFarmacia': lambda: AsignacionFarmacia.objects.create(
+                farmacia=self.farmacia, motorista=self.motorista
+            ),
+        }
+        for modelo, guardar in guardados.items():
+            with self.subTest(modelo=modelo):
+                obtener_contexto('general', self.constructor)
+                antes = self.construidos
+                obtener_contexto('general', self.constructor)
+                self.assertEqual(self.construidos, antes)
+                with self.captureOnCommitCallbacks(execute=True):
+                    guardar()
+                obtener_contexto('general', self.constructor)
+                self.assertEqual(self.construidos, antes + 1)
+
+
+class RegionesFarmaciaTests(TestCase):
+    """Regiones normalizadas: dashboard regional, filtro del listado y backfill de la migración 0004."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=4)
+        cls.multiregion = Farmacia.objects.create(
+            nombre='Farmacia Dos Regiones', direccion='Calle 9', region='REGIÓN DEL MAULE, REGIÓN DE ÑUBLE',
+            comuna='Chillán', localidad='Chillán', provincia='Diguillín',
+            horario_recepcion_inicio=time(8), horario_recepcion_fin=time(20),
+            dias_operativos='LUN', latitud=-36.6, longitud=-72.1
+        )
+        Despacho.objects.bulk_create([
+            Despacho(
+                farmacia_origen=cls.multiregion, motorista_asignado=cls.motorista,
+                direccion_entrega=f'Chillán {i}', tipo_movimiento='DIRECTO'
+            )
+            for i in range(3)
+        ])
+        recalcular_todo()
+
+    def test_dashboard_regional_suma_en_cada_region(self):
+        por_region = {fila['region']: fila['total'] for fila in metricas_regionales()['despachos_por_region']}
+        self.assertEqual(por_region['Maule'], 7)
+        self.assertEqual(por_region['Ñuble'], 3)
+        self.assertEqual(por_region['Atacama'], 0)
+
+    def test_filtro_region_por_nombre_o_codigo(self):
+        self.client.force_login(self.admin)
+        for consulta, esperadas in (
+            ('maule', {self.farmacia.pk, self.multiregion.pk}),
+            ('REGIÓN DE ÑUBLE', {self.multiregion.pk}),
+            ('Ñuble', {self.multiregion.pk}),
+        ):
+            with self.subTest(region=consulta):
+                response = self.client.get(reverse('farmacia_listar'), {'region': consulta})
+                self.assertEqual({farmacia.pk for farmacia in response.context['farmacias']}, esperadas)
+
+    def test_migracion_0004_pobla_farmacia_region(self):
+        migracion = importlib.import_module('App.migrations.0004_poblar_regiones')
+        FarmaciaRegion.objects.all().delete()
+        Farmacia.objects.filter(pk=self.farmacia.pk).update(region='REGIÓN DEL MAULE, REGIÓN NUEVA')
+
+        migracion.poblar_regiones(apps, None)
+
+        self.assertEqual(
+            set(FarmaciaRegion.objects.values_list('farmacia_id', 'region__codigo')),
+            {
+                (self.farmacia.pk, 'REGIÓN DEL MAULE'), (self.farmacia.pk, 'REGIÓN NUEVA'),
+                (self.multiregion.pk, 'REGIÓN DEL MAULE'), (self.multiregion.pk, 'REGIÓN DE ÑUBLE'),
+            },
+        )
+        self.assertEqual(Region.objects.get(codigo='REGIÓN NUEVA').nombre, 'REGIÓN NUEVA')
+        self.assertEqual(Region.objects.filter(codigo='REGIÓN DEL MAULE').count(), 1)
+
+
+class SerieDespachosApiTests(TestCase):
+    """GET api/despachos/serie/: validación de parámetros y costo de una serie anual."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=0)
+        hoy = timezone.localdate()
+        ResumenDiarioDespacho.objects.bulk_create([
+            ResumenDiarioDespacho(
+                fecha=hoy - timedelta(days=dias), farmacia=cls.farmacia, motorista=cls.motorista,
+                estado=estado, cantidad=2, entregas_con_tiempo=1 if estado == 'ENTREGADO' else 0,
+                duracion_total_segundos=1800 if estado == 'ENTREGADO' else 0,
+            )
+            for dias in range(365) for estado in ('PENDIENTE', 'ENTREGADO')
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('api-despacho-serie')
+
+    def test_ids_no_numericos_responden_400(self):
+        for parametro in ('farmacia', 'motorista'):
+            with self.subTest(parametro=parametro):
+                response = self.client.get(self.url, {parametro: 'abc'})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'farmacia': self.farmacia.pk, 'motorista': self.motorista.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(punto['total'] for punto in response.json()['resultados']), 4 * 31)
+
+    def test_serie_anual_lee_solo_el_resumen(self):
+        hoy = timezone.localdate()
+        inicio = reloj.perf_counter()
+        with CaptureQueriesContext(connection) as contexto:
+            serie = serie_despachos('dia', hoy - timedelta(days=364), hoy, farmacia_id=self.farmacia.pk)
+        transcurrido = reloj.perf_counter() - inicio
+        self.assertEqual(len(serie), 365)
+        self.assertEqual(serie[0]['tiempo_promedio_minutos'], 30)
+        self.assertEqual(len(contexto.captured_queries), 1)
+        self.assertNotIn(Despacho._meta.db_table, contexto.captured_queries[0]['sql'].replace(ResumenDiarioDespacho._meta.db_table, ''))
+        # Objetivo del endpoint: < 100 ms para un año diario
+        self.assertLess(transcurrido, 0.1)
+
+
+class ReporteCsvTests(CacheReportesTemporalMixin, TestCase):
+    """CSV en streaming: mismas columnas que antes de paginar por keyset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=12)
+
+    def test_reporte_csv_en_streaming(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('reporte_csv'), {'tipo': 'general'})
+        self.assertTrue(response.streaming)
+        filas = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(filas[0], [
+            'ID Despacho', 'Tipo Movimiento', 'Farmacia', 'Motorista', 'Estado', 'Fecha Creación',
+            'Fecha Toma Pedido', 'Fecha Salida Farmacia', 'Fecha Estimada Llegada', 'Tiempo Entrega (min)',
+            'Dirección Entrega', 'Requiere Receta',
+        ])
+        self.assertEqual(len(filas), 13)
+        self.assertEqual(filas[1][3], 'Ana Pérez')
+        self.assertEqual(ReportDownloadHistory.objects.get(formato='CSV').cantidad_registros, 12)
+
+    def test_csv_basico_conserva_sus_columnas(self):
+        bloques = list(generar_csv(despachos_reporte(), filas_por_bloque=5, basico=True))
+        # Dos bloques de 5 filas (el primero con el encabezado) y el resto
+        self.assertEqual(len(bloques), 3)
+        filas = list(csv.reader(b''.join(bloques).decode('utf-8').splitlines()))
+        self.assertEqual(filas[0], [
+            'ID Despacho', 'Tipo Movimiento', 'Farmacia', 'Motorista', 'Estado', 'Fecha Creación',
+            'Fecha Toma Pedido', 'Fecha Salida Farmacia', 'Fecha Estimada Llegada', 'Requiere Receta',
+        ])
+        self.assertEqual(len(filas), 13)
+        self.assertEqual(filas[1][3], 'Ana Pérez')
+
+
+class TrabajosReporteTests(TestCase):
+    """Trabajos de reporte en segundo plano: un solo worker toma cada trabajo y los errores quedan registrados."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media = tempfile.mkdtemp()
+        cls._override_media = override_settings(MEDIA_ROOT=cls._media)
+        cls._override_media.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._override_media.disable()
+        shutil.rmtree(cls._media, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=5)
+
+    def setUp(self):
+        self.trabajo = TrabajoReporte.objects.create(user=self.admin, tipo_reporte='GENERAL', formato='CSV')
+
+    def test_dos_workers_un_trabajo(self):
+        intentos = []
+
+        def escribir_con_competencia(*args, **kwargs):
+            # Otro worker recibe el mismo trabajo mientras el primero lo genera
+            intentos.append(ejecutar_trabajo(self.trabajo.pk))
+            return _escribir_archivo(*args, **kwargs)
+
+        with mock.patch('App.services.trabajos_reporte._escribir_archivo', side_effect=escribir_con_competencia):
+            resultado = ejecutar_trabajo(self.trabajo.pk)
+
+        self.assertEqual(intentos, [None])
+        self.assertIsNone(ejecutar_trabajo(self.trabajo.pk))
+        self.assertEqual(resultado.pk, self.trabajo.pk)
+        self.trabajo.refresh_from_db()
+        self.assertEqual(self.trabajo.estado, 'COMPLETADO')
+        self.assertEqual(self.trabajo.historial.cantidad_registros, 5)
+        self.assertEqual(ReportDownloadHistory.objects.count(), 1)
+
+    def test_error_deja_el_trabajo_en_error(self):
+        with mock.patch(
+            'App.services.trabajos_reporte._escribir_archivo', side_effect=RuntimeError('disco lleno')
+        ), self.assertLogs('App.services.trabajos_reporte', 'ERROR'):
+            self.assertIsNone(ejecutar_trabajo(self.trabajo.pk))
+
+        self.trabajo.refresh_from_db()
+        self.assertEqual(self.trabajo.estado, 'ERROR')
+        self.assertEqual(self.trabajo.mensaje_error, 'disco lleno')
+        self.assertIsNotNone(self.trabajo.fecha_fin)
+        self.assertIsNone(self.trabajo.historial)
+        self.assertFalse(ReportDownloadHistory.objects.exists())
+        # Un trabajo con error no se vuelve a tomar
+        self.assertIsNone(ejecutar_trabajo(self.trabajo.pk))
+
+
+class ReportePdfTests(TestCase):
+    """PDF paginado: una tabla por página y los flowables se generan a medida que se ubican."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=2 * FILAS_POR_PAGINA + 5)
+
+    def test_pdf_de_varias_paginas(self):
+        pendientes = []
+        handle_flowable = _DocumentoPorDemanda.handle_flowable
+
+        def registrar(documento, flowables):
+            if flowables is documento._historia:
+                pendientes.append(len(flowables))
+            return handle_flowable(documento, flowables)
+
+        destino = BytesIO()
+        with mock.patch.object(_DocumentoPorDemanda, 'handle_flowable', registrar):
+            cantidad = generar_pdf(destino, despachos_reporte(), titulo='Reporte de prueba', generado_por='Admin Test')
+        pdf = destino.getvalue()
+        # Nunca hay más flowables pendientes que la reserva
+        self.assertLessEqual(max(pendientes), 2)
+        self.assertEqual(cantidad, 2 * FILAS_POR_PAGINA + 5)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(len(re.findall(rb'/Type /Page\b(?!s)', pdf)), 3)
+
+
+class CacheReportesTests(CacheReportesTemporalMixin, TestCase):
+    """Caché en disco de reportes: aciertos, invalidación por sellos y poda LRU."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=6)
+        recalcular_todo()
+
+    def setUp(self):
+        for entrada in os.scandir(self._cache_reportes):
+            os.unlink(entrada.path)
+
+    def clave(self):
+        desde, hasta = rango_fechas_por_tipo('diario', timezone.localdate().isoformat(), '', '')
+        return cache_reportes.firma_reporte(desde, hasta, None, 'CSV')[0]
+
+    def test_segunda_descarga_sale_de_la_cache(self):
+        self.client.force_login(self.admin)
+        parametros = {'tipo': 'diario', 'fecha': timezone.localdate().isoformat()}
+        primera = self.client.get(reverse('reporte_csv'), parametros)
+        contenido = b''.join(primera.streaming_content)
+        self.assertNotIsInstance(primera, FileResponse)
+
+        segunda = self.client.get(reverse('reporte_csv'), parametros)
+        self.assertIsInstance(segunda, FileResponse)
+        self.assertEqual(b''.join(segunda.streaming_content), contenido)
+        self.assertEqual(
+            list(ReportDownloadHistory.objects.values_list('cantidad_registros', flat=True)), [6, 6]
+        )
+
+    def test_clave_cambia_con_despachos_farmacias_y_motoristas(self):
+        claves = {self.clave()}
+        self.assertEqual(self.clave(), next(iter(claves)))
+        cambios = (
+            lambda: Despacho.objects.first().save(),
+            lambda: Farmacia.objects.filter(pk=self.farmacia.pk).first().save(),
+            lambda: Motorista.objects.filter(pk=self.motorista.pk).first().save(),
+        )
+        for cambiar in cambios:
+            with self.captureOnCommitCallbacks(execute=True):
+                cambiar()
+            clave = self.clave()
+            self.assertNotIn(clave, claves)
+            claves.add(clave)
+
+    @override_settings(REPORTES_CACHE_MAX_BYTES=25)
+    def test_poda_los_menos_usados(self):
+        for clave, antiguedad in (('a', 1000), ('b', 2000)):
+            ruta = cache_reportes.guardar(clave, 'CSV', BytesIO(b'x' * 10))
+            os.utime(ruta, (antiguedad, antiguedad))
+        self.assertIsNotNone(cache_reportes.obtener('a', 'CSV'))
+
+        cache_reportes.guardar('c', 'CSV', BytesIO(b'x' * 10))
+        self.assertIsNotNone(cache_reportes.obtener('a', 'CSV'))
+        self.assertIsNone(cache_reportes.obtener('b', 'CSV'))
+        self.assertIsNotNone(cache_reportes.obtener('c', 'CSV'))
+
+
+class ReportesTipadosTests(CacheReportesTemporalMixin, TestCase):
+    """Descargas XLSX y Parquet: se abren con su librería y conservan filas y tipos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=7)
+        Despacho.objects.filter(direccion_entrega='Dirección 0').update(
+            tipo_movimiento='CON_RECETA', direccion_entrega='Calle\x01 9'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_reporte_xlsx(self):
+        response = self.client.get(reverse('reporte_xlsx'), {'tipo': 'general'})
+        self.assertEqual(response.status_code, 200)
+        libro = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        filas = list(libro['Despachos'].iter_rows(values_only=True))
+        self.assertEqual(list(filas[0]), ENCABEZADO_CSV)
+        self.assertEqual(len(filas), 8)
+        ids = set(Despacho.objects.values_list('identificador_unico', flat=True))
+        self.assertEqual({fila[0] for fila in filas[1:]}, ids)
+        primera = filas[1]
+        self.assertIsInstance(primera[5], datetime)
+        self.assertEqual(primera[3], 'Ana Pérez')
+        con_receta = [fila for fila in filas[1:] if fila[11]]
+        self.assertEqual(len(con_receta), 1)
+        # Los caracteres de control no son válidos en XLSX y se quitan
+        self.assertEqual(con_receta[0][10], 'Calle 9')
+        self.assertEqual(ReportDownloadHistory.objects.get(formato='XLSX').cantidad_registros, 7)
+
+    @skipUnless(PARQUET_DISPONIBLE, 'requiere pyarrow')
+    def test_reporte_parquet(self):
+        import pyarrow.parquet as pq
+
+        response = self.client.get(reverse('reporte_parquet'), {'tipo': 'general'})
+        self.assertEqual(response.status_code, 200)
+        tabla = pq.read_table(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(tabla.num_rows, 7)
+        self.assertEqual(
+            set(tabla.column('id_despacho').to_pylist()),
+            set(Despacho.objects.values_list('identificador_unico', flat=True)),
+        )
+        self.assertEqual(tabla.column('requiere_receta').to_pylist().count(True), 1)
+
+    @skipIf(PARQUET_DISPONIBLE, 'pyarrow instalado')
+    def test_reporte_parquet_sin_pyarrow(self):
+        response = self.client.get(reverse('reporte_parquet'), {'tipo': 'general'})
+        self.assertRedirects(response, reverse('reportes'), fetch_redirect_response=False)
+        self.assertFalse(ReportDownloadHistory.objects.exists())
+
+
+class ApiPaginacionDespachosTests(TestCase):
+    """Listado de despachos: ?page= por defecto y páginas por cursor con ?pagination=cursor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.farmacia, cls.motorista = crear_datos_base(cantidad_despachos=30)
+        cls.orden = list(Despacho.objects.order_by('-fecha_hora_creacion', '-identificador_unico').values_list(
+            'identificador_unico', flat=True
+        ))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('api-despacho-list')
+
+    def ids(self, datos):
+        return [fila['identificador_unico'] for fila in datos['results']]
+
+    def test_paginacion_por_numero_de_pagina(self):
+        datos = self.client.get(self.url, {'page': 2, 'fields': 'identificador_unico'}).json()
+        self.assertEqual(datos['count'], 30)
+        self.assertIsNone(datos['next'])
+        self.assertIn('fields=identificador_unico', datos['previous'])
+        self.assertEqual(self.ids(datos), self.orden[25:])
+
+    def test_cursor_siguiente_y_anterior(self):
+        paginas = []
+        datos = self.client.get(self.url, {'pagination': 'cursor', 'page_size': 10}).json()
+        self.assertIsNone(datos['previous'])
+        paginas.append(datos)
+        while datos['next']:
+            datos = self.client.get(datos['next']).json()
+            paginas.append(datos)
+
+        self.assertEqual([len(pagina['results']) for pagina in paginas], [10, 10, 10])
+        self.assertEqual([i for pagina in paginas for i in self.ids(pagina)], self.orden)
+        self.assertTrue(all(pagina['count'] == 30 for pagina in paginas))
+
+        # Volviendo con previous se obtienen exactamente las páginas anteriores
+        anterior = self.client.get(paginas[2]['previous']).json()
+        self.assertEqual(self.ids(anterior), self.ids(paginas[1]))
+        primera = self.client.get(anterior['previous']).json()
+        self.assertEqual(self.ids(primera), self.ids(paginas[0]))
+        self.assertIsNone(primera['previous'])
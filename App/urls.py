@@ -1,6 +1,6 @@
 from django.urls import path, include
 from . import views
-from .views import auth, farmacia, motorista, moto, asignacion_moto, asignacion_farmacia, despacho, dashboard
+from .views import auth, farmacia, motorista, moto, asignacion_moto, asignacion_farmacia, despacho, dashboard, busqueda
 
 urlpatterns = [
     # ============================================
@@ -72,7 +72,17 @@ urlpatterns = [
     path('reportes/', dashboard.reportes_filtro, name='reportes'),
     path('reportes/csv/', dashboard.reporte_csv, name='reporte_csv'),
     path('reportes/pdf/', dashboard.reporte_pdf, name='reporte_pdf'),
+    path('reportes/xlsx/', dashboard.reporte_xlsx, name='reporte_xlsx'),
+    path('reportes/parquet/', dashboard.reporte_parquet, name='reporte_parquet'),
+    path('reportes/trabajos/crear/', dashboard.reporte_trabajo_crear, name='reporte_trabajo_crear'),
+    path('reportes/trabajos/<int:pk>/', dashboard.reporte_trabajo_estado, name='reporte_trabajo_estado'),
+    path('reportes/trabajos/<int:pk>/descargar/', dashboard.reporte_trabajo_descargar, name='reporte_trabajo_descargar'),
     
+    # ============================================
+    # BÚSQUEDA GLOBAL
+    # ============================================
+    path('buscar/', busqueda.busqueda_global, name='busqueda_global'),
+
     # ============================================
     # API
     # ============================================
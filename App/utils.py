@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from django.utils import timezone
 
 def rango_fechas_por_tipo(tipo_filtro, fecha=None, mes=None, anio=None):
@@ -69,6 +69,60 @@ def rango_fechas_por_tipo(tipo_filtro, fecha=None, mes=None, anio=None):
     return fecha_desde, fecha_hasta
 
 
+def rango_del_dia(fecha):
+    """
+    Retorna el rango semiabierto [inicio, fin) de un día en la zona horaria local.
+    """
+    inicio = timezone.make_aware(datetime.combine(fecha, datetime.min.time()))
+    fin = timezone.make_aware(datetime.combine(fecha + timedelta(days=1), datetime.min.time()))
+    return inicio, fin
+
+
+def a_fecha(valor):
+    """
+    Normaliza una fecha de usuario: date, datetime (se usa su fecha local) o
+    str 'YYYY-MM-DD'. Retorna None si está vacía o no es válida.
+    """
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).date() if timezone.is_aware(valor) else valor.date()
+    if isinstance(valor, date):
+        return valor
+    try:
+        return datetime.strptime(str(valor).strip()[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def rango_semiabierto(fecha_desde=None, fecha_hasta=None):
+    """
+    Convierte un rango de fechas inclusivo (ver a_fecha) en el rango de
+    datetimes aware [inicio, fin) en la zona horaria local, donde fin es la
+    medianoche del día siguiente a fecha_hasta. Los extremos vacíos son None.
+    """
+    desde = a_fecha(fecha_desde)
+    hasta = a_fecha(fecha_hasta)
+    inicio = rango_del_dia(desde)[0] if desde else None
+    fin = rango_del_dia(hasta)[1] if hasta else None
+    return inicio, fin
+
+
+def filtrar_por_fechas(queryset, campo, fecha_desde=None, fecha_hasta=None):
+    """
+    Filtra `campo` (DateTimeField) por un rango de fechas inclusivo usando
+    comparaciones directas sobre la columna (campo >= inicio AND campo < fin),
+    de modo que la consulta puede usar índices. Ej:
+    filtrar_por_fechas(Despacho.objects.all(), 'fecha_hora_creacion', '2025-01-01', '2025-01-31')
+    """
+    inicio, fin = rango_semiabierto(fecha_desde, fecha_hasta)
+    if inicio:
+        queryset = queryset.filter(**{f'{campo}__gte': inicio})
+    if fin:
+        queryset = queryset.filter(**{f'{campo}__lt': fin})
+    return queryset
+
+
 def generar_nombre_archivo(tipo_filtro, formato, fecha=None, mes=None, anio=None):
     """
     Genera un nombre de archivo descriptivo para el reporte.
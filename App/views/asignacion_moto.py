@@ -152,8 +152,7 @@ def listar_asignaciones_moto(request):
 
     if motorista:
         qs = qs.filter(
-            Q(motorista__usuario__first_name__icontains=motorista) |
-            Q(motorista__usuario__last_name__icontains=motorista) |
+            Q(motorista__nombre_visible__icontains=motorista) |
             Q(motorista__rut__icontains=motorista)
         )
 
@@ -0,0 +1,50 @@
+"""
+Vista de búsqueda global (despachos, motoristas, farmacias y motos)
+"""
+from django.shortcuts import render, redirect
+from django.urls import reverse
+
+from ..models import DocumentoBusqueda
+from ..services.busqueda import LIMITE_RESULTADOS, buscar
+
+
+URL_DETALLE = {
+    'DESPACHO': 'despacho_detalle',
+    'MOTORISTA': 'motorista_detalle',
+    'FARMACIA': 'farmacia_detalle',
+    'MOTO': 'moto_detalle',
+}
+
+
+def busqueda_global(request):
+    """
+    Resultados de la búsqueda del navbar agrupados por tipo.
+    Parámetros: q (texto) y tipo (opcional).
+    """
+    if not request.user.is_authenticated:
+        return redirect('login')
+
+    q = request.GET.get('q', '').strip()
+    tipo = request.GET.get('tipo', '')
+    if tipo not in URL_DETALLE:
+        tipo = ''
+
+    grupos = []
+    if q:
+        documentos = buscar(q, tipos=[tipo] if tipo else None, limite=LIMITE_RESULTADOS * 2)
+        por_tipo = {}
+        for documento in documentos:
+            documento.url = reverse(URL_DETALLE[documento.tipo], args=[documento.objeto_id])
+            por_tipo.setdefault(documento.tipo, []).append(documento)
+        grupos = [
+            (etiqueta, por_tipo[clave]) for clave, etiqueta in DocumentoBusqueda.TIPOS if clave in por_tipo
+        ]
+
+    context = {
+        'q': q,
+        'tipo': tipo,
+        'tipos': DocumentoBusqueda.TIPOS,
+        'grupos': grupos,
+        'total': sum(len(documentos) for _, documentos in grupos),
+    }
+    return render(request, 'busqueda/resultados.html', context)
@@ -1,21 +1,24 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.views.generic import View
-from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+from django.http import StreamingHttpResponse, JsonResponse, FileResponse, Http404
+from django.db import transaction
 from django.contrib import messages
-from django.db.models import Count, Q
 from django.utils import timezone
-from datetime import timedelta, datetime
-import csv
-from io import BytesIO
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.units import inch
-from ..models import Despacho, Motorista, Farmacia, Moto, AsignacionMoto, AsignacionFarmacia, ReportDownloadHistory
-from ..decorators import RolRequiredMixin, LoginRequiredMixin, GerenteOnlyMixin
-from django.utils.dateparse import parse_date
-from reportlab.lib.styles import getSampleStyleSheet
-from ..utils import rango_fechas_por_tipo, generar_nombre_archivo
+from datetime import datetime
+import tempfile
+from ..models import Motorista, ReportDownloadHistory, TrabajoReporte
+from ..decorators import RolRequiredMixin, LoginRequiredMixin
+from ..utils import rango_fechas_por_tipo, generar_nombre_archivo, filtrar_por_fechas
+from ..services.metricas import metricas_generales, metricas_regionales, resumen_por_estado
+from ..services.cache_dashboard import obtener_contexto
+from ..services.versiones import DEPENDENCIAS, agregar_validadores, firma, respuesta_no_modificada
+from ..services.reportes import despachos_reporte, generar_csv, generar_pdf, titulo_reporte
+from ..services.trabajos_reporte import encolar
+from ..services import cache_reportes
+from ..services.cache_reportes import firma_reporte
+from ..services.exportacion import PARQUET_DISPONIBLE, generar_parquet, generar_xlsx
 
 
 
@@ -24,6 +27,29 @@ from ..utils import rango_fechas_por_tipo, generar_nombre_archivo
 # VISTAS DE DASHBOARD
 # ============================================
 
+def render_dashboard(request, nombre, constructor, template_name):
+    """
+    Renderiza un dashboard con ETag según los sellos de versión de las
+    colecciones que resume. Si el navegador ya tiene esa versión se responde
+    304 sin armar el contexto ni renderizar la plantilla. Sin Last-Modified:
+    con resolución de un segundo, If-Modified-Since podría dar un 304 con
+    datos viejos tras un cambio en el mismo segundo.
+    """
+    # Las métricas dependen del día (últimos 7 días, hoy)
+    version, _ = firma(DEPENDENCIAS['dashboard'], timezone.localdate())
+    # Cambios de nombre o rol del usuario también incrementan la colección 'motorista'
+    etag = f'{version}-{nombre}-{request.user.pk}'
+
+    # Con mensajes pendientes se renderiza siempre, para mostrarlos
+    if not len(messages.get_messages(request)):
+        no_modificada = respuesta_no_modificada(request, etag, None)
+        if no_modificada is not None:
+            return no_modificada
+
+    context = obtener_contexto(nombre, constructor, version=version)
+    return agregar_validadores(render(request, template_name, context), etag, None)
+
+
 class DashboardGeneralView(LoginRequiredMixin, View):
     """
     Dashboard General - acceso Admin/Supervisor/Gerente.
@@ -37,60 +63,7 @@ class DashboardGeneralView(LoginRequiredMixin, View):
             messages.error(request, 'No tienes acceso al dashboard general.')
             return redirect('home')
         
-        # Métricas generales
-        total_despachos = Despacho.objects.count()
-        despachos_pendientes = Despacho.objects.filter(estado='PENDIENTE').count()
-        despachos_en_ruta = Despacho.objects.filter(estado='EN_RUTA').count()
-        despachos_entregados = Despacho.objects.filter(estado='ENTREGADO').count()
-        despachos_incidencias = Despacho.objects.filter(estado='INCIDENCIA').count()
-        
-        # Últimos 7 días
-        hace_7_dias = timezone.now() - timedelta(days=7)
-        despachos_recientes = Despacho.objects.filter(fecha_hora_creacion__gte=hace_7_dias).count()
-        
-        # Motoristas activos
-        motoristas_activos = Motorista.objects.filter(licencia_vigente=True).count()
-        motoristas_total = Motorista.objects.count()
-        
-        # Motos disponibles
-        motos_disponibles = Moto.objects.filter(estado='OPERATIVO').count()
-        motos_total = Moto.objects.count()
-        
-        # Farmacias
-        farmacias_total = Farmacia.objects.count()
-        
-        # Tiempo promedio de entrega (en minutos)
-        despachos_entregados_obj = Despacho.objects.filter(
-            estado='ENTREGADO',
-            fecha_hora_estimada_llegada__isnull=False,
-            fecha_hora_despacho__isnull=False
-        )
-        
-        if despachos_entregados_obj.exists():
-            total_minutos = sum(
-                int((d.fecha_hora_estimada_llegada - d.fecha_hora_despacho).total_seconds() / 60)
-                for d in despachos_entregados_obj
-            )
-            tiempo_promedio = total_minutos // len(despachos_entregados_obj)
-        else:
-            tiempo_promedio = 0
-        
-        context = {
-            'total_despachos': total_despachos,
-            'despachos_pendientes': despachos_pendientes,
-            'despachos_en_ruta': despachos_en_ruta,
-            'despachos_entregados': despachos_entregados,
-            'despachos_incidencias': despachos_incidencias,
-            'despachos_recientes': despachos_recientes,
-            'motoristas_activos': motoristas_activos,
-            'motoristas_total': motoristas_total,
-            'motos_disponibles': motos_disponibles,
-            'motos_total': motos_total,
-            'farmacias_total': farmacias_total,
-            'tiempo_promedio': tiempo_promedio,
-        }
-        
-        return render(request, self.template_name, context)
+        return render_dashboard(request, 'general', metricas_generales, self.template_name)
 
 
 class DashboardRegionalView(RolRequiredMixin, View):
@@ -102,27 +75,7 @@ class DashboardRegionalView(RolRequiredMixin, View):
     roles_permitidos = ['ADMINISTRADOR', 'GERENTE', 'SUPERVISOR']
 
     def get(self, request):
-        # Agrupar por región/comuna
-        despachos_por_region = Farmacia.objects.values('region').annotate(
-            total=Count('despacho')
-        ).order_by('-total')
-        
-        despachos_por_estado = Despacho.objects.values('estado').annotate(
-            total=Count('identificador_unico')
-        ).order_by('-total')
-        
-        # Motoristas por rendimiento
-        motoristas_rendimiento = Motorista.objects.annotate(
-            total_despachos=Count('despacho')
-        ).order_by('-total_despachos')[:10]
-        
-        context = {
-            'despachos_por_region': despachos_por_region,
-            'despachos_por_estado': despachos_por_estado,
-            'motoristas_rendimiento': motoristas_rendimiento,
-        }
-        
-        return render(request, self.template_name, context)
+        return render_dashboard(request, 'regional', metricas_regionales, self.template_name)
 
 
 # ============================================
@@ -140,44 +93,10 @@ class ReporteCSVView(RolRequiredMixin, View):
         fecha_desde = request.GET.get('fecha_desde')
         fecha_hasta = request.GET.get('fecha_hasta')
 
-        queryset = Despacho.objects.all()
+        queryset = despachos_reporte(fecha_desde, fecha_hasta)
 
-        if fecha_desde:
-            queryset = queryset.filter(fecha_hora_creacion__gte=fecha_desde)
-        if fecha_hasta:
-            queryset = queryset.filter(fecha_hora_creacion__lte=fecha_hasta)
-
-        response = HttpResponse(content_type='text/csv')
+        response = StreamingHttpResponse(generar_csv(queryset, basico=True), content_type='text/csv; charset=utf-8')
         response['Content-Disposition'] = 'attachment; filename="reporte_despachos.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID Despacho',
-            'Tipo Movimiento',
-            'Farmacia',
-            'Motorista',
-            'Estado',
-            'Fecha Creación',
-            'Fecha Toma Pedido',
-            'Fecha Salida Farmacia',
-            'Fecha Estimada Llegada',
-            'Requiere Receta'
-        ])
-
-        for despacho in queryset:
-            writer.writerow([
-                despacho.identificador_unico,
-                despacho.get_tipo_movimiento_display(),
-                despacho.farmacia_origen.nombre if despacho.farmacia_origen else '',
-                despacho.motorista_asignado.usuario.get_full_name() if despacho.motorista_asignado and despacho.motorista_asignado.usuario else '',
-                despacho.get_estado_display(),
-                despacho.fecha_hora_creacion.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_creacion else '',
-                despacho.fecha_hora_toma_pedido.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_toma_pedido else '',
-                despacho.fecha_hora_salida_farmacia.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_salida_farmacia else '',
-                despacho.fecha_hora_estimada_llegada.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_estimada_llegada else '',
-                'Sí' if despacho.tipo_movimiento == 'CON_RECETA' else 'No'
-            ])
-
         return response
 
 
@@ -192,54 +111,13 @@ class ReportePDFView(RolRequiredMixin, View):
         fecha_desde = request.GET.get('fecha_desde')
         fecha_hasta = request.GET.get('fecha_hasta')
 
-        queryset = Despacho.objects.all()
-        if fecha_desde:
-            queryset = queryset.filter(fecha_hora_creacion__gte=fecha_desde)
-        if fecha_hasta:
-            queryset = queryset.filter(fecha_hora_creacion__lte=fecha_hasta)
-
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-
-        styles = getSampleStyleSheet()
-        title = Paragraph("Reporte de Despachos", styles['Title'])
-        elements.append(title)
-        elements.append(Spacer(1, 0.3 * inch))
-
-        # Header de la tabla
-        data = [['ID Despacho', 'Tipo', 'Farmacia', 'Motorista', 'Estado', 'Fecha Creación', 'Requiere Receta']]
-
-        for despacho in queryset[:100]:  # Limitar a 100 registros
-            data.append([
-                despacho.identificador_unico,
-                despacho.get_tipo_movimiento_display(),
-                despacho.farmacia_origen.nombre[:20] if despacho.farmacia_origen else '',
-                despacho.motorista_asignado.usuario.get_full_name()[:20] if despacho.motorista_asignado and despacho.motorista_asignado.usuario else '',
-                despacho.get_estado_display(),
-                despacho.fecha_hora_creacion.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_creacion else '',
-                'Sí' if despacho.tipo_movimiento == 'CON_RECETA' else 'No'
-            ])
-
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), '#40466e'),
-            ('TEXTCOLOR', (0, 0), (-1, 0), '#fff'),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), '#f0f0f0'),
-            ('GRID', (0, 0), (-1, -1), 1, '#ccc'),
-        ]))
-
-        elements.append(table)
-        doc.build(elements)
-        buffer.seek(0)
-
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="reporte_despachos.pdf"'
-        return response
+        queryset = despachos_reporte(fecha_desde, fecha_hasta)
+
+        archivo = tempfile.TemporaryFile()
+        generar_pdf(archivo, queryset, titulo="Reporte de Despachos", generado_por=request.user.get_full_name())
+        archivo.seek(0)
+
+        return FileResponse(archivo, as_attachment=True, filename='reporte_despachos.pdf', content_type='application/pdf')
 
 
 # ============================================
@@ -258,60 +136,7 @@ def dashboard_general(request):
         messages.error(request, 'No tienes acceso al dashboard general.')
         return redirect('home')
     
-    # Métricas generales
-    total_despachos = Despacho.objects.count()
-    despachos_pendientes = Despacho.objects.filter(estado='PENDIENTE').count()
-    despachos_en_ruta = Despacho.objects.filter(estado='EN_RUTA').count()
-    despachos_entregados = Despacho.objects.filter(estado='ENTREGADO').count()
-    despachos_incidencias = Despacho.objects.filter(estado='INCIDENCIA').count()
-    
-    # Últimos 7 días
-    hace_7_dias = timezone.now() - timedelta(days=7)
-    despachos_recientes = Despacho.objects.filter(fecha_hora_creacion__gte=hace_7_dias).count()
-    
-    # Motoristas activos
-    motoristas_activos = Motorista.objects.filter(licencia_vigente=True).count()
-    motoristas_total = Motorista.objects.count()
-    
-    # Motos disponibles
-    motos_disponibles = Moto.objects.filter(estado='OPERATIVO').count()
-    motos_total = Moto.objects.count()
-    
-    # Farmacias
-    farmacias_total = Farmacia.objects.count()
-    
-    # Tiempo promedio de entrega
-    despachos_entregados_obj = Despacho.objects.filter(
-        estado='ENTREGADO',
-        fecha_hora_estimada_llegada__isnull=False,
-        fecha_hora_despacho__isnull=False
-    )
-    
-    if despachos_entregados_obj.exists():
-        total_minutos = sum(
-            int((d.fecha_hora_estimada_llegada - d.fecha_hora_despacho).total_seconds() / 60)
-            for d in despachos_entregados_obj
-        )
-        tiempo_promedio = total_minutos // len(despachos_entregados_obj)
-    else:
-        tiempo_promedio = 0
-    
-    context = {
-        'total_despachos': total_despachos,
-        'despachos_pendientes': despachos_pendientes,
-        'despachos_en_ruta': despachos_en_ruta,
-        'despachos_entregados': despachos_entregados,
-        'despachos_incidencias': despachos_incidencias,
-        'despachos_recientes': despachos_recientes,
-        'motoristas_activos': motoristas_activos,
-        'motoristas_total': motoristas_total,
-        'motos_disponibles': motos_disponibles,
-        'motos_total': motos_total,
-        'farmacias_total': farmacias_total,
-        'tiempo_promedio': tiempo_promedio,
-    }
-    
-    return render(request, 'dashboard/dashboard_general.html', context)
+    return render_dashboard(request, 'general', metricas_generales, 'dashboard/dashboard_general.html')
 
 
 def dashboard_regional(request):
@@ -325,27 +150,7 @@ def dashboard_regional(request):
         messages.error(request, 'No tienes acceso al dashboard regional.')
         return redirect('home')
     
-    # Agrupar por región
-    despachos_por_region = Farmacia.objects.values('region').annotate(
-        total=Count('despacho')
-    ).order_by('-total')
-    
-    despachos_por_estado = Despacho.objects.values('estado').annotate(
-        total=Count('identificador_unico')
-    ).order_by('-total')
-    
-    # Motoristas por rendimiento
-    motoristas_rendimiento = Motorista.objects.annotate(
-        total_despachos=Count('despacho')
-    ).order_by('-total_despachos')[:10]
-    
-    context = {
-        'despachos_por_region': despachos_por_region,
-        'despachos_por_estado': despachos_por_estado,
-        'motoristas_rendimiento': motoristas_rendimiento,
-    }
-    
-    return render(request, 'dashboard/dashboard_regional.html', context)
+    return render_dashboard(request, 'regional', metricas_regionales, 'dashboard/dashboard_regional.html')
 
 
 def reportes_filtro(request):
@@ -370,51 +175,27 @@ def reportes_filtro(request):
     # ========== DESPACHOS (PREVIEW) ==========
     fecha_desde, fecha_hasta = rango_fechas_por_tipo(tipo_filtro, fecha, mes, anio)
     
-    despachos = Despacho.objects.select_related(
-        'farmacia_origen', 
-        'motorista_asignado',
-        'motorista_asignado__usuario'
-    ).all()
-    
-    if fecha_desde:
-        despachos = despachos.filter(fecha_hora_creacion__gte=fecha_desde)
-    if fecha_hasta:
-        despachos = despachos.filter(fecha_hora_creacion__lte=fecha_hasta)
-    if motorista_id:
-        despachos = despachos.filter(motorista_asignado__identificador_unico=motorista_id)
-    
-    despachos = despachos.order_by('-fecha_hora_creacion')
+    despachos = despachos_reporte(fecha_desde, fecha_hasta, motorista_id or None).select_related(
+        'farmacia_origen',
+        'motorista_asignado'
+    ).order_by('-fecha_hora_creacion')
     
     # ========== HISTORIAL DE DESCARGAS ==========
     historial = ReportDownloadHistory.objects.filter(
         user=request.user
     ).select_related('motorista')
     
-    if historial_desde:
-        try:
-            historial_desde_dt = datetime.strptime(historial_desde, '%Y-%m-%d')
-            historial = historial.filter(fecha_descarga__gte=historial_desde_dt)
-        except ValueError:
-            pass
-    
-    if historial_hasta:
-        try:
-            historial_hasta_dt = datetime.strptime(historial_hasta, '%Y-%m-%d')
-            historial_hasta_dt = historial_hasta_dt.replace(hour=23, minute=59, second=59)
-            historial = historial.filter(fecha_descarga__lte=historial_hasta_dt)
-        except ValueError:
-            pass
+    historial = filtrar_por_fechas(historial, 'fecha_descarga', historial_desde, historial_hasta)
     
     historial = historial[:50]  # Últimos 50 reportes
     
-    # ========== ESTADÍSTICAS ==========
-    total_despachos = despachos.count()
-    estadisticas = despachos.aggregate(
-        pendientes=Count('identificador_unico', filter=Q(estado='PENDIENTE')),
-        en_ruta=Count('identificador_unico', filter=Q(estado='EN_RUTA')),
-        entregados=Count('identificador_unico', filter=Q(estado='ENTREGADO')),
-        con_incidencia=Count('identificador_unico', filter=Q(estado='INCIDENCIA'))
+    # ========== ESTADÍSTICAS (desde el resumen diario) ==========
+    estadisticas = resumen_por_estado(
+        fecha_desde=fecha_desde.date() if fecha_desde else None,
+        fecha_hasta=fecha_hasta.date() if fecha_hasta else None,
+        motorista_id=motorista_id or None,
     )
+    total_despachos = estadisticas.pop('total')
     
     # ========== VALORES PARA FORMULARIO ==========
     hoy = datetime.now()
@@ -437,7 +218,9 @@ def reportes_filtro(request):
         'historial_fecha_hasta': historial_hasta,
         'total_despachos': total_despachos,
         'estadisticas': estadisticas,
-        'motoristas': Motorista.objects.filter(activo=True),
+        'motoristas': Motorista.objects.filter(activo=True).order_by('nombre_visible'),
+        'trabajos': TrabajoReporte.objects.filter(user=request.user).select_related('historial')[:10],
+        'parquet_disponible': PARQUET_DISPONIBLE,
     }
     
     return render(request, 'dashboard/dashboard_report_list.html', context)
@@ -462,71 +245,42 @@ def reporte_csv(request):
     fecha_desde, fecha_hasta = rango_fechas_por_tipo(tipo_filtro, fecha, mes, anio)
     
     # Filtrar despachos
-    queryset = Despacho.objects.select_related(
-        'farmacia_origen',
-        'motorista_asignado',
-        'motorista_asignado__usuario'
-    ).all()
-    
-    if fecha_desde:
-        queryset = queryset.filter(fecha_hora_creacion__gte=fecha_desde)
-    if fecha_hasta:
-        queryset = queryset.filter(fecha_hora_creacion__lte=fecha_hasta)
-    if motorista_id:
-        queryset = queryset.filter(motorista_asignado__identificador_unico=motorista_id)
-    
-    queryset = queryset.order_by('-fecha_hora_creacion')
+    queryset = despachos_reporte(fecha_desde, fecha_hasta, motorista_id or None)
     
     # Generar nombre de archivo
     filename = generar_nombre_archivo(tipo_filtro, 'csv', fecha, mes, anio)
     
-    # Crear CSV
-    response = HttpResponse(content_type='text/csv; charset=utf-8-sig')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Registrar en historial al terminar el stream, con el conteo de filas enviadas
+    def registrar_descarga(total_registros):
+        ReportDownloadHistory.objects.create(
+            user=request.user,
+            tipo_reporte=tipo_filtro.upper(),
+            formato='CSV',
+            fecha_desde=fecha_desde.date() if fecha_desde else None,
+            fecha_hasta=fecha_hasta.date() if fecha_hasta else None,
+            motorista_id=motorista_id if motorista_id else None,
+            cantidad_registros=total_registros,
+            nombre_archivo=filename
+        )
     
-    writer = csv.writer(response)
-    writer.writerow([
-        'ID Despacho',
-        'Tipo Movimiento',
-        'Farmacia',
-        'Motorista',
-        'Estado',
-        'Fecha Creación',
-        'Fecha Toma Pedido',
-        'Fecha Salida Farmacia',
-        'Fecha Estimada Llegada',
-        'Tiempo Entrega (min)',
-        'Dirección Entrega',
-        'Requiere Receta'
-    ])
-    
-    for despacho in queryset:
-        writer.writerow([
-            despacho.identificador_unico,
-            despacho.get_tipo_movimiento_display(),
-            despacho.farmacia_origen.nombre if despacho.farmacia_origen else '',
-            despacho.motorista_asignado.nombre_completo if despacho.motorista_asignado else '',
-            despacho.get_estado_display(),
-            despacho.fecha_hora_creacion.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_creacion else '',
-            despacho.fecha_hora_toma_pedido.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_toma_pedido else '',
-            despacho.fecha_hora_salida_farmacia.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_salida_farmacia else '',
-            despacho.fecha_hora_estimada_llegada.strftime('%Y-%m-%d %H:%M') if despacho.fecha_hora_estimada_llegada else '',
-            despacho.tiempo_entrega_minutos or '',
-            despacho.direccion_entrega,
-            'Sí' if despacho.tipo_movimiento == 'CON_RECETA' else 'No'
-        ])
+    # Servir desde la caché si los despachos del rango no cambiaron
+    clave, total_registros = firma_reporte(fecha_desde, fecha_hasta, motorista_id, 'CSV')
+    ruta_cache = cache_reportes.obtener(clave, 'CSV')
+    if ruta_cache:
+        registrar_descarga(total_registros)
+        return FileResponse(
+            open(ruta_cache, 'rb'), as_attachment=True, filename=filename,
+            content_type='text/csv; charset=utf-8'
+        )
     
-    # Registrar en historial
-    ReportDownloadHistory.objects.create(
-        user=request.user,
-        tipo_reporte=tipo_filtro.upper(),
-        formato='CSV',
-        fecha_desde=fecha_desde.date() if fecha_desde else None,
-        fecha_hasta=fecha_hasta.date() if fecha_hasta else None,
-        motorista_id=motorista_id if motorista_id else None,
-        cantidad_registros=queryset.count(),
-        nombre_archivo=filename
+    # Crear CSV en streaming (memoria constante), guardándolo en la caché al terminar
+    response = StreamingHttpResponse(
+        cache_reportes.guardar_al_transmitir(
+            clave, 'CSV', generar_csv(queryset, al_terminar=registrar_descarga)
+        ),
+        content_type='text/csv; charset=utf-8'
     )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     
     return response
 
@@ -550,87 +304,30 @@ def reporte_pdf(request):
     fecha_desde, fecha_hasta = rango_fechas_por_tipo(tipo_filtro, fecha, mes, anio)
     
     # Filtrar despachos
-    queryset = Despacho.objects.select_related(
-        'farmacia_origen',
-        'motorista_asignado',
-        'motorista_asignado__usuario'
-    ).all()
-    
-    if fecha_desde:
-        queryset = queryset.filter(fecha_hora_creacion__gte=fecha_desde)
-    if fecha_hasta:
-        queryset = queryset.filter(fecha_hora_creacion__lte=fecha_hasta)
-    if motorista_id:
-        queryset = queryset.filter(motorista_asignado__identificador_unico=motorista_id)
-    
-    queryset = queryset.order_by('-fecha_hora_creacion')[:100]  # Limitar PDF a 100
+    queryset = despachos_reporte(fecha_desde, fecha_hasta, motorista_id or None)
     
     # Generar nombre de archivo
     filename = generar_nombre_archivo(tipo_filtro, 'pdf', fecha, mes, anio)
     
-    # Crear PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(letter))
-    elements = []
-    
-    styles = getSampleStyleSheet()
+    # El PDF incluye el título y el autor, por lo que también forman parte de la clave
+    titulo = titulo_reporte(tipo_filtro, fecha, mes, anio)
+    generado_por = request.user.get_full_name()
+    clave, cantidad_registros = firma_reporte(
+        fecha_desde, fecha_hasta, motorista_id, 'PDF', titulo, generado_por
+    )
+    ruta_cache = cache_reportes.obtener(clave, 'PDF')
     
-    # Título
-    if tipo_filtro == 'diario' and fecha:
-        titulo = f"Reporte Diario de Despachos - {fecha}"
-    elif tipo_filtro == 'mensual' and mes:
-        titulo = f"Reporte Mensual de Despachos - {mes}"
-    elif tipo_filtro == 'anual' and anio:
-        titulo = f"Reporte Anual de Despachos - {anio}"
+    if ruta_cache:
+        archivo = open(ruta_cache, 'rb')
     else:
-        titulo = "Reporte General de Despachos"
-    
-    title = Paragraph(titulo, styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Información adicional
-    info_text = f"Generado por: {request.user.get_full_name()} | Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    info = Paragraph(info_text, styles['Normal'])
-    elements.append(info)
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Tabla
-    data = [[
-        'ID', 'Tipo', 'Farmacia', 'Motorista', 
-        'Estado', 'Fecha Creación', 'Tiempo (min)'
-    ]]
-    
-    for despacho in queryset:
-        data.append([
-            str(despacho.identificador_unico),
-            despacho.get_tipo_movimiento_display()[:15],
-            (despacho.farmacia_origen.nombre[:20] if despacho.farmacia_origen else '')[:20],
-            (despacho.motorista_asignado.nombre_completo[:20] if despacho.motorista_asignado else '')[:20],
-            despacho.get_estado_display(),
-            despacho.fecha_hora_creacion.strftime('%Y-%m-%d') if despacho.fecha_hora_creacion else '',
-            str(despacho.tiempo_entrega_minutos or '-')
-        ])
-    
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#40466e')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    buffer.seek(0)
-    
-    response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # Crear PDF en un archivo temporal (no se mantiene el documento completo en memoria)
+        archivo = tempfile.TemporaryFile()
+        cantidad_registros = generar_pdf(archivo, queryset, titulo=titulo, generado_por=generado_por)
+        archivo.seek(0)
+        cache_reportes.guardar(clave, 'PDF', archivo)
+        archivo.seek(0)
+    
+    response = FileResponse(archivo, as_attachment=True, filename=filename, content_type='application/pdf')
     
     # Registrar en historial
     ReportDownloadHistory.objects.create(
@@ -640,8 +337,155 @@ def reporte_pdf(request):
         fecha_desde=fecha_desde.date() if fecha_desde else None,
         fecha_hasta=fecha_hasta.date() if fecha_hasta else None,
         motorista_id=motorista_id if motorista_id else None,
-        cantidad_registros=len(queryset),
+        cantidad_registros=cantidad_registros,
         nombre_archivo=filename
     )
     
-    return response
\ No newline at end of file
+    return response
+
+def _reporte_tipado(request, formato, generar, content_type):
+    """
+    Descarga común de los formatos tipados (XLSX, Parquet): usa la caché de
+    reportes y registra la descarga en el historial.
+    """
+    if request.user.rol not in ['GERENTE', 'SUPERVISOR', 'ADMINISTRADOR', 'OPERADOR']:
+        messages.error(request, 'No tienes permiso para descargar reportes.')
+        return redirect('home')
+    
+    # Obtener parámetros
+    tipo_filtro = request.GET.get('tipo', 'general')
+    fecha = request.GET.get('fecha', '')
+    mes = request.GET.get('mes', '')
+    anio = request.GET.get('anio', '')
+    motorista_id = request.GET.get('id_motorista', '')
+    
+    fecha_desde, fecha_hasta = rango_fechas_por_tipo(tipo_filtro, fecha, mes, anio)
+    queryset = despachos_reporte(fecha_desde, fecha_hasta, motorista_id or None)
+    filename = generar_nombre_archivo(tipo_filtro, formato, fecha, mes, anio)
+    
+    clave, cantidad_registros = firma_reporte(fecha_desde, fecha_hasta, motorista_id, formato)
+    ruta_cache = cache_reportes.obtener(clave, formato)
+    
+    if ruta_cache:
+        archivo = open(ruta_cache, 'rb')
+    else:
+        archivo = tempfile.TemporaryFile()
+        cantidad_registros = generar(archivo, queryset)
+        archivo.seek(0)
+        cache_reportes.guardar(clave, formato, archivo)
+        archivo.seek(0)
+    
+    ReportDownloadHistory.objects.create(
+        user=request.user,
+        tipo_reporte=tipo_filtro.upper(),
+        formato=formato,
+        fecha_desde=fecha_desde.date() if fecha_desde else None,
+        fecha_hasta=fecha_hasta.date() if fecha_hasta else None,
+        motorista_id=motorista_id if motorista_id else None,
+        cantidad_registros=cantidad_registros,
+        nombre_archivo=filename
+    )
+    
+    return FileResponse(archivo, as_attachment=True, filename=filename, content_type=content_type)
+
+
+def reporte_xlsx(request):
+    """
+    Generar y descargar reporte en formato Excel (XLSX) con columnas tipadas.
+    """
+    return _reporte_tipado(
+        request, 'XLSX', generar_xlsx,
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+def reporte_parquet(request):
+    """
+    Generar y descargar reporte en formato Parquet (requiere pyarrow).
+    """
+    if not PARQUET_DISPONIBLE:
+        messages.error(request, 'La exportación Parquet no está disponible en este servidor.')
+        return redirect('reportes')
+    return _reporte_tipado(request, 'PARQUET', generar_parquet, 'application/vnd.apache.parquet')
+
+
+# ============================================
+# REPORTES EN SEGUNDO PLANO
+# ============================================
+
+def _trabajo_a_dict(trabajo):
+    return {
+        'id': trabajo.pk,
+        'tipo_reporte': trabajo.get_tipo_reporte_display(),
+        'formato': trabajo.formato,
+        'estado': trabajo.estado,
+        'estado_display': trabajo.get_estado_display(),
+        'fecha_creacion': timezone.localtime(trabajo.fecha_creacion).strftime('%d/%m/%Y %H:%M'),
+        'cantidad_registros': trabajo.historial.cantidad_registros if trabajo.historial else None,
+        'mensaje_error': trabajo.mensaje_error,
+        'url_descarga': reverse('reporte_trabajo_descargar', args=[trabajo.pk]) if trabajo.estado == 'COMPLETADO' else None,
+    }
+
+
+@require_http_methods(["POST"])
+def reporte_trabajo_crear(request):
+    """
+    Encola la generación de un reporte CSV o PDF y retorna el trabajo en JSON.
+    """
+    if request.user.rol not in ['GERENTE', 'SUPERVISOR', 'ADMINISTRADOR', 'OPERADOR']:
+        return JsonResponse({'error': 'No tienes permiso para generar reportes.'}, status=403)
+    
+    tipo_filtro = request.POST.get('tipo', 'general')
+    formato = request.POST.get('formato', 'CSV').upper()
+    
+    if tipo_filtro.upper() not in dict(ReportDownloadHistory.TIPO_REPORTE):
+        return JsonResponse({'error': f'Tipo de reporte inválido: {tipo_filtro}'}, status=400)
+    if formato not in dict(ReportDownloadHistory.FORMATO):
+        return JsonResponse({'error': f'Formato inválido: {formato}'}, status=400)
+    if formato == 'PARQUET' and not PARQUET_DISPONIBLE:
+        return JsonResponse({'error': 'La exportación Parquet no está disponible en este servidor.'}, status=400)
+    
+    with transaction.atomic():
+        trabajo = TrabajoReporte.objects.create(
+            user=request.user,
+            tipo_reporte=tipo_filtro.upper(),
+            formato=formato,
+            parametros={
+                'fecha': request.POST.get('fecha', ''),
+                'mes': request.POST.get('mes', ''),
+                'anio': request.POST.get('anio', ''),
+                'id_motorista': request.POST.get('id_motorista', ''),
+            }
+        )
+        encolar(trabajo)
+    
+    return JsonResponse(_trabajo_a_dict(trabajo), status=202)
+
+
+@require_http_methods(["GET"])
+def reporte_trabajo_estado(request, pk):
+    """
+    Estado de un trabajo de reporte del usuario (para el polling del dashboard).
+    """
+    trabajo = get_object_or_404(
+        TrabajoReporte.objects.select_related('historial'), pk=pk, user=request.user
+    )
+    return JsonResponse(_trabajo_a_dict(trabajo))
+
+
+@require_http_methods(["GET"])
+def reporte_trabajo_descargar(request, pk):
+    """
+    Descarga el archivo generado por un trabajo completado.
+    """
+    trabajo = get_object_or_404(
+        TrabajoReporte.objects.select_related('historial'), pk=pk, user=request.user
+    )
+    if trabajo.estado != 'COMPLETADO' or not trabajo.archivo:
+        raise Http404('El reporte aún no está disponible.')
+    
+    return FileResponse(
+        trabajo.archivo.open('rb'),
+        as_attachment=True,
+        filename=trabajo.historial.nombre_archivo if trabajo.historial else None
+    )
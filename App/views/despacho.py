@@ -5,11 +5,14 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, CreateView, UpdateView, View, DetailView
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.utils import timezone
 from django.db.models import Q
-from ..models import Despacho, Motorista, Farmacia, AsignacionFarmacia
+from ..models import Despacho, Motorista, Farmacia
 from ..forms import DespachoForm
+from ..services.estados_despacho import TransicionNoValida, es_valida, transicionar
+from ..services.paginacion import conteo_cacheado, paginar_keyset
+from ..services.recomendacion_motoristas import recomendar
+from ..utils import filtrar_por_fechas
 from ..forms import ProductoPedido, ProductoPedidoForm
 from ..decorators import RolRequiredMixin, LoginRequiredMixin
 import django_filters
@@ -35,7 +38,7 @@ class ListarDespachosView(LoginRequiredMixin, ListView):
     paginate_by = 30
 
     def get_queryset(self):
-        queryset = Despacho.objects.all()
+        queryset = Despacho.objects.select_related('farmacia_origen', 'motorista_asignado')
         
         # Filtros
         estado = self.request.GET.get('estado')
@@ -53,10 +56,7 @@ class ListarDespachosView(LoginRequiredMixin, ListView):
             queryset = queryset.filter(farmacia_origen_id=farmacia)
         if motorista:
             queryset = queryset.filter(motorista_asignado_id=motorista)
-        if fecha_desde:
-            queryset = queryset.filter(fecha_hora_creacion__gte=fecha_desde)
-        if fecha_hasta:
-            queryset = queryset.filter(fecha_hora_creacion__lte=fecha_hasta)
+        queryset = filtrar_por_fechas(queryset, 'fecha_hora_creacion', fecha_desde, fecha_hasta)
         
         # Si es motorista, solo ve sus despachos
         if self.request.user.rol == 'MOTORISTA':
@@ -197,15 +197,17 @@ class AnularDespachoView(RolRequiredMixin, View):
 
     def dispatch(self, request, *args, **kwargs):
         despacho = get_object_or_404(Despacho, pk=kwargs['pk'])
-        if despacho.estado not in ['PENDIENTE', 'EN_RUTA']:
+        if not es_valida(despacho.estado, 'ANULADO'):
             messages.error(request, 'Solo puedes anular despachos en estado PENDIENTE o EN_RUTA.')
             return redirect('despacho_listar')
         return super().dispatch(request, *args, **kwargs)
 
     def post(self, request, pk):
-        despacho = get_object_or_404(Despacho, pk=pk)
-        despacho.estado = 'ANULADO'
-        despacho.save()
+        try:
+            transicionar(pk, 'ANULADO', usuario=request.user)
+        except TransicionNoValida as exc:
+            messages.error(request, f'No se pudo anular el despacho: {exc}')
+            return redirect('despacho_listar')
         messages.success(request, 'Despacho anulado exitosamente.')
         return redirect('despacho_listar')
 
@@ -214,6 +216,9 @@ class DespachoDetailView(LoginRequiredMixin, DetailView):
     model = Despacho
     template_name = 'despacho/despacho_detail.html'
     context_object_name = 'despacho'
+    queryset = Despacho.objects.select_related(
+        'farmacia_origen', 'motorista_asignado'
+    ).prefetch_related('productos')
     
 
 class DespachoFilter(django_filters.FilterSet):
@@ -274,8 +279,7 @@ def listar_despachos(request):
     # Motorista (nombre, apellido, usuario, ID único)
     if motorista:
         qs = qs.filter(
-            Q(motorista_asignado__usuario__first_name__icontains=motorista) |
-            Q(motorista_asignado__usuario__last_name__icontains=motorista) |
+            Q(motorista_asignado__nombre_visible__icontains=motorista) |
             Q(motorista_asignado__usuario__username__icontains=motorista)
         )
 
@@ -287,21 +291,28 @@ def listar_despachos(request):
     if tipo_movimiento:
         qs = qs.filter(tipo_movimiento=tipo_movimiento)
 
-    # Rango de fechas
-    if fecha_desde:
-        qs = qs.filter(fecha_hora_creacion__date__gte=fecha_desde)
+    # Rango de fechas (comparación directa sobre la columna, usa índices)
+    qs = filtrar_por_fechas(qs, "fecha_hora_creacion", fecha_desde, fecha_hasta)
 
-    if fecha_hasta:
-        qs = qs.filter(fecha_hora_creacion__date__lte=fecha_hasta)
+    # --- PAGINACIÓN (keyset: cada página cuesta lo mismo que la primera) ---
+    cursor = request.GET.get("cursor")
+    anterior = request.GET.get("dir") == "anterior"
+    try:
+        pagina = paginar_keyset(qs, cursor=cursor, anterior=anterior, tam_pagina=20)
+    except ValueError:
+        pagina = paginar_keyset(qs, tam_pagina=20)
 
-    # --- PAGINACIÓN ---
-    paginator = Paginator(qs.order_by("-fecha_hora_creacion"), 20)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Filtros actuales para los enlaces de paginación
+    filtros = request.GET.copy()
+    filtros.pop("cursor", None)
+    filtros.pop("dir", None)
+    filtros.pop("page", None)
 
     context = {
-        "despachos": page_obj,
-        "is_paginated": paginator.num_pages > 1,
+        "despachos": pagina,
+        "is_paginated": pagina.has_next or pagina.has_previous,
+        "total_despachos": conteo_cacheado(qs),
+        "filtros_query": filtros.urlencode(),
         "puede_crear": request.user.rol in ['ADMINISTRADOR', 'SUPERVISOR', 'OPERADOR'],
         "puede_cambiar_estado": request.user.rol in ['ADMINISTRADOR', 'SUPERVISOR', 'OPERADOR']
     }
@@ -506,13 +517,17 @@ def anular_despacho(request, pk):
     
     despacho = get_object_or_404(Despacho, pk=pk)
     
-    if despacho.estado not in ['PENDIENTE', 'EN_RUTA']:
+    if not es_valida(despacho.estado, 'ANULADO'):
         messages.error(request, 'Solo puedes anular despachos en estado PENDIENTE o EN_RUTA.')
         return redirect('despacho_listar')
     
     if request.method == 'POST':
-        despacho.estado = 'ANULADO'
-        despacho.save()
+        try:
+            # UPDATE condicional: si otro usuario cambió el estado entremedio, no se pisa su cambio
+            transicionar(pk, 'ANULADO', usuario=request.user, desde=despacho.estado)
+        except TransicionNoValida as exc:
+            messages.error(request, f'No se pudo anular el despacho: {exc}')
+            return redirect('despacho_listar')
         messages.success(request, 'Despacho anulado exitosamente.')
         return redirect('despacho_listar')
     
@@ -524,7 +539,8 @@ logger = logging.getLogger(__name__)
 @require_http_methods(["GET"])
 def motoristas_por_farmacia(request):
     """
-    Vista AJAX para obtener motoristas asignados a una farmacia específica.
+    Vista AJAX para obtener los motoristas recomendados para despachar desde
+    una farmacia, del mejor al peor (services/recomendacion_motoristas.py).
     """
     logger.info(f"Request recibido - Method: {request.method}")
     logger.info(f"Headers: {dict(request.headers)}")
@@ -561,31 +577,24 @@ def motoristas_por_farmacia(request):
             logger.error(f"Farmacia con ID {farmacia_id} no existe")
             return JsonResponse({'error': 'Farmacia no encontrada'}, status=404)
         
-        # Buscar asignaciones activas
-        asignaciones = AsignacionFarmacia.objects.filter(
-            farmacia_id=farmacia_id, 
-            activa=True
-        ).select_related('motorista', 'motorista__usuario')
-        
-        logger.info(f"Asignaciones encontradas: {asignaciones.count()}")
-        
-        # Construir lista de motoristas
-        motoristas_data = []
-        for asignacion in asignaciones:
-            motorista = asignacion.motorista
-
-            # Usar la propiedad nombre_completo del modelo Motorista
-            nombre_completo = motorista.nombre_completo
-
-            motorista_dict = {
-                'id': motorista.identificador_unico,
-                'text': f"{nombre_completo} - RUT: {motorista.rut}",
-                'identificador': motorista.identificador_unico
+        # Motoristas recomendados: cercanía de su farmacia asignada y despachos abiertos
+        recomendados = recomendar(farmacia_id, limite=DespachoForm.LIMITE_MOTORISTAS)
+        logger.info(f"Motoristas recomendados: {len(recomendados)}")
+
+        motoristas_data = [
+            {
+                'id': candidato['motorista_id'],
+                'text': (
+                    f"{candidato['nombre']} - RUT: {candidato['rut']} "
+                    f"({candidato['distancia_km']} km, {candidato['despachos_abiertos']} abiertos)"
+                ),
+                'identificador': candidato['motorista_id'],
+                'distancia_km': candidato['distancia_km'],
+                'despachos_abiertos': candidato['despachos_abiertos'],
             }
+            for candidato in recomendados
+        ]
 
-            motoristas_data.append(motorista_dict)
-            logger.info(f"Motorista agregado: {motorista_dict}")
-        
         logger.info(f"Total motoristas devueltos: {len(motoristas_data)}")
         
         return JsonResponse({
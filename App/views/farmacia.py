@@ -6,6 +6,7 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView, D
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.core.paginator import Paginator
+from django.db.models import Q
 from ..models import Farmacia
 from ..forms import FarmaciaForm
 from ..decorators import SupervisorOAdminMixin, RolRequiredMixin, LoginRequiredMixin
@@ -143,7 +144,9 @@ def listar_farmacias(request):
     qs = Farmacia.objects.all()
     if query_id: qs = qs.filter(identificador_unico__icontains=query_id)
     if query_nombre: qs = qs.filter(nombre__icontains=query_nombre)
-    if query_region: qs = qs.filter(region__icontains=query_region)
+    if query_region:
+        # Código ('REGIÓN DEL MAULE') o nombre ('Maule'), parcial como antes; distinct por farmacias con varias regiones
+        qs = qs.filter(Q(regiones__codigo__icontains=query_region) | Q(regiones__nombre__icontains=query_region)).distinct()
     if query_comuna: qs = qs.filter(comuna__icontains=query_comuna)
     if query_horario_inicio: qs = qs.filter(horario_recepcion_inicio__icontains=query_horario_inicio)
     if query_horario_fin: qs = qs.filter(horario_recepcion_fin__icontains=query_horario_fin)
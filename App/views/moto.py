@@ -216,6 +216,7 @@ class MotoDetailView(LoginRequiredMixin, DetailView):
     model = Moto
     template_name = 'moto/moto_detail.html'
     context_object_name = 'moto'
+    queryset = Moto.objects.select_related('documentacion').prefetch_related('mantenimientos')
 
 
 class MotoFilter(django_filters.FilterSet):
@@ -22,6 +22,7 @@ class ListarMotoristasView(LoginRequiredMixin, ListView):
     template_name = 'motorista/motorista_list.html'
     context_object_name = 'motoristas'
     paginate_by = 20
+    queryset = Motorista.objects.select_related('usuario')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -120,7 +121,7 @@ def listar_motoristas(request):
     if not request.user.is_authenticated:
         return redirect('login')
 
-    qs = Motorista.objects.all()
+    qs = Motorista.objects.select_related('usuario')
     if query_id: qs = qs.filter(identificador_unico__icontains=query_id)
     if query_nombre: qs = qs.filter(nombre__icontains=query_nombre)
     if query_apellido_paterno: qs = qs.filter(apellido_paterno__icontains=query_apellido_paterno)
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'App.middleware.compresion.CompresionAPIMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,8 +86,29 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 25,
+    # orjson si está instalado; sin él se comportan como los de DRF
+    'DEFAULT_RENDERER_CLASSES': (
+        'App.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'App.api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Dependencias opcionales: se detectan al importar y, sin ellas, se usa el
+# camino en Python puro (o la función no está disponible).
+#   orjson   renderer/parser JSON de la API (App.api.renderers)
+#   brotli   compresión br de la API (App.middleware.compresion)
+#   numpy    estimación de llegada por lote (App.services.estimacion_llegada); recomendada en producción
+#   pyarrow  reportes Parquet (App.services.exportacion)
+
+# Compresión gzip/brotli de respuestas de la API (App.middleware.compresion)
+API_COMPRESION_PREFIJOS = ('/api/',)
+API_COMPRESION_MIN_BYTES = 1024
+
 
 WSGI_APPLICATION = 'Proyecto.wsgi.application'
 
@@ -105,6 +127,28 @@ DATABASES = {
     }
 }
 
+# models.W037: MySQL no soporta índices parciales (Despacho.despacho_activos_fecha_idx);
+# se omiten al migrar y los cubren los índices compuestos.
+SILENCED_SYSTEM_CHECKS = ['models.W037']
+
+
+# Caché
+# Por defecto memoria local (por proceso). Con varios workers conviene un backend
+# compartido, ej: 'django.core.cache.backends.redis.RedisCache' con LOCATION 'redis://127.0.0.1:6379'.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'logico-default',
+    }
+}
+
+# Alias de CACHES y duración (segundos) de los contextos de dashboard
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_CACHE_TTL = 300
+
+# Hilos que generan reportes en segundo plano (TrabajoReporte)
+REPORTES_WORKERS = 2
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -154,6 +198,14 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Caché en disco de reportes CSV/PDF ya generados (fuera de MEDIA_ROOT, no es público)
+REPORTES_CACHE_DIR = os.path.join(BASE_DIR, 'cache_reportes')
+REPORTES_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# Eventos de despacho: meses que quedan en la base y destino de los meses archivados
+EVENTOS_DESPACHO_MESES_ACTIVOS = 12
+EVENTOS_DESPACHO_ARCHIVO_DIR = os.path.join(BASE_DIR, 'archivo_eventos')
+
 # URL de login
 LOGIN_URL = '/login/'
 